@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .ingest import ingest_records
+
+
+logger = logging.getLogger(__name__)
+
+
+class PageViewBuffer:
+    """
+    Collect page views and funnel events in memory and write them in batches.
+
+    Requests only enqueue a small dict. A background thread writes
+    batches with ``bulk_create`` once ``batch_size`` events are
+    waiting or every ``flush_interval`` seconds. The queue is bounded:
+    when the database falls behind, new events are dropped and counted
+    rather than slowing down the storefront.
+    """
+
+    def __init__(
+        self,
+        max_size=10000,
+        batch_size=200,
+        flush_interval=5.0,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self._thread = None
+        self._pid = None
+
+        self._counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "flushed": 0,
+            "flush_errors": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        """
+        Return a snapshot of this worker's buffer counters.
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+
+        counters["pending"] = self._queue.qsize()
+
+        return counters
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each gunicorn
+        # worker starts its own flusher on first use.
+        pid = os.getpid()
+
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run,
+                name="analytics-flush",
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def add(self, **fields):
+        """
+        Queue an event for writing. Returns False if it was dropped.
+        """
+
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+        self._count("enqueued")
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            self.flush()
+
+    def _drain(self):
+        batch = []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def flush(self):
+        """
+        Write everything currently queued.
+        """
+
+        with self._flush_lock:
+            close_old_connections()
+
+            try:
+                while True:
+                    batch = self._drain()
+
+                    if not batch:
+                        break
+
+                    self._write(batch)
+            finally:
+                close_old_connections()
+
+    def _write(self, batch):
+        try:
+            ingest_records(batch)
+        except Exception:
+            self._count("flush_errors")
+            logger.exception(
+                "Dropped %d buffered analytics events",
+                len(batch),
+            )
+            return
+
+        self._count("flushed", len(batch))
+
+
+pageview_buffer = PageViewBuffer(
+    max_size=settings.ANALYTICS_BUFFER_MAX_SIZE,
+    batch_size=settings.ANALYTICS_BUFFER_BATCH_SIZE,
+    flush_interval=settings.ANALYTICS_BUFFER_FLUSH_INTERVAL,
+)
+
+# Write whatever is still queued when a worker shuts down.
+atexit.register(pageview_buffer.flush)
@@ -0,0 +1,177 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+BOT_MARKERS_FILE = Path(__file__).resolve().parent / "data" / "bot_markers.txt"
+
+# Distinct user agents seen in a day are a few thousand at most;
+# bots and the long tail beyond that just miss the cache.
+CACHE_SIZE = 4096
+
+# Anything past this is never needed to classify a user agent,
+# and bounding it bounds the cost of a cache miss.
+MAX_USER_AGENT_LENGTH = 512
+
+TABLET_MARKERS = ("ipad", "tablet")
+MOBILE_MARKERS = ("iphone", "android", "mobile")
+
+# Checked in order: Edge and Opera also claim to be Chrome,
+# and every Chromium browser claims to be Safari.
+BROWSER_FAMILIES = (
+    ("edge", ("edg/", "edga/", "edgios/", "edge/")),
+    ("opera", ("opr/", "opera")),
+    ("samsung", ("samsungbrowser/",)),
+    ("chrome", ("chrome/", "crios/")),
+    ("firefox", ("firefox/", "fxios/")),
+    ("safari", ("safari/",)),
+)
+
+
+Classification = namedtuple(
+    "Classification",
+    ["is_bot", "device", "family"],
+)
+
+
+def load_bot_markers(path=BOT_MARKERS_FILE):
+    markers = []
+
+    with open(path, encoding="utf-8") as lines:
+        for line in lines:
+            line = line.strip().lower()
+
+            if line and not line.startswith("#"):
+                markers.append(line)
+
+    return markers
+
+
+def _trie_pattern(words):
+    """
+    Build a regex alternation with shared prefixes factored out.
+
+    "bot|bingbot|bingpreview" becomes "b(?:ing(?:bot|preview)|ot)",
+    so the regex engine tries each leading character once however
+    many markers share it.
+    """
+
+    trie = {}
+
+    for word in words:
+        node = trie
+
+        for char in word:
+            node = node.setdefault(char, {})
+
+        node[""] = {}
+
+    def pattern(node):
+        if "" in node and len(node) == 1:
+            return ""
+
+        branches = [
+            re.escape(char) + pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+
+        group = "(?:" + "|".join(branches) + ")"
+
+        # A marker ends here, but longer ones continue.
+        if "" in node:
+            group += "?"
+
+        return group
+
+    return pattern(trie)
+
+
+def _build_tokens(bot_markers):
+    tokens = {}
+
+    for family, markers in reversed(BROWSER_FAMILIES):
+        tokens.update(dict.fromkeys(markers, family))
+
+    tokens.update(dict.fromkeys(MOBILE_MARKERS, "mobile"))
+    tokens.update(dict.fromkeys(TABLET_MARKERS, "tablet"))
+
+    # Bot markers win over any other meaning of the same token.
+    tokens.update(dict.fromkeys(bot_markers, "bot"))
+
+    return tokens
+
+
+UA_TOKENS = _build_tokens(load_bot_markers())
+
+# Every marker in one pattern. It only ever matches a whole token,
+# so the matched text is the key to look its meaning up.
+UA_PATTERN = re.compile(_trie_pattern(UA_TOKENS))
+
+
+def classify(user_agent):
+    """
+    Return whether ``user_agent`` is a bot, its device type and its
+    browser family, from a single pass of one compiled regex.
+
+    Cache misses cost about the same however many bot markers
+    the data file lists, since the pattern shares their prefixes.
+    """
+
+    # Truncated before the cache sees it, so huge made-up user agents
+    # can't make each cache entry kilobytes long.
+    return _classify((user_agent or "")[:MAX_USER_AGENT_LENGTH])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _classify(user_agent):
+    if not user_agent:
+        return Classification(False, "other", "other")
+
+    found = set()
+
+    for match in UA_PATTERN.finditer(user_agent.lower()):
+        kind = UA_TOKENS[match.group()]
+
+        if kind == "bot":
+            return Classification(True, "other", "bot")
+
+        found.add(kind)
+
+    if "tablet" in found:
+        device = "tablet"
+    elif "mobile" in found:
+        device = "mobile"
+    else:
+        device = "desktop"
+
+    family = next(
+        (
+            family
+            for family, _ in BROWSER_FAMILIES
+            if family in found
+        ),
+        "other",
+    )
+
+    return Classification(False, device, family)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def referrer_hostname(referrer):
+    """
+    Return the lower-cased host name of a referrer URL, or "".
+    """
+
+    if not referrer:
+        return ""
+
+    try:
+        return (urlparse(referrer).hostname or "").lower()
+    except ValueError:
+        return ""
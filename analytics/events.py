@@ -0,0 +1,75 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .buffer import pageview_buffer
+from .classify import classify
+from .ingest import ingest_records
+from .spool import spool_writer
+from .visitor_keys import request_visitor_key
+
+
+logger = logging.getLogger(__name__)
+
+
+def submit(fields):
+    """
+    Hand a page view or funnel event to the configured ingestion path.
+    """
+
+    if settings.ANALYTICS_INGEST == "spool":
+        spool_writer.append(**fields)
+    elif settings.ANALYTICS_INGEST == "buffered":
+        pageview_buffer.add(**fields)
+    else:
+        ingest_records([fields], sketches=False)
+
+        # Merging a sketch locks the row every request to the page
+        # shares, so leave that to the buffer's batched writes.
+        if "event" not in fields:
+            pageview_buffer.add(**fields, sketch_only=True)
+
+
+def record_funnel_event(request, event, product_handle=""):
+    """
+    Record a step towards a sale. Never raises: a failure here must
+    not stop anyone adding to their bag or reaching checkout.
+    """
+
+    try:
+        user_agent = request.META.get(
+            "HTTP_USER_AGENT",
+            "",
+        )
+
+        if classify(user_agent).is_bot:
+            return
+
+        submit(
+            {
+                "timestamp": timezone.now(),
+                "event": event,
+                "product_handle": product_handle[:255],
+                "visitor_key": request_visitor_key(request),
+            }
+        )
+    except Exception:
+        logger.exception("Failed to record %s event", event)
+
+
+async def arecord_funnel_event(request, event, product_handle=""):
+    """
+    ``record_funnel_event`` for async views. Only direct ingestion
+    touches the database; the other modes run on the event loop.
+    """
+
+    if settings.ANALYTICS_INGEST == "direct":
+        await sync_to_async(record_funnel_event)(
+            request,
+            event,
+            product_handle,
+        )
+    else:
+        record_funnel_event(request, event, product_handle)
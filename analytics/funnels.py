@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from catalog.models import Product
+
+from .models import FunnelDayRollup, FunnelEvent
+
+
+STEPS = {
+    FunnelEvent.VIEW_PRODUCT: "views",
+    FunnelEvent.ADD_TO_BAG: "adds",
+    FunnelEvent.REMOVE: "removes",
+    FunnelEvent.CHECKOUT_REDIRECT: "checkouts",
+}
+
+
+def _funnel(name):
+    return {
+        "name": name,
+        **dict.fromkeys(STEPS.values(), 0),
+    }
+
+
+def _with_rates(funnel):
+    views = funnel["views"]
+    adds = funnel["adds"]
+
+    funnel["add_rate"] = adds / views * 100 if views else None
+    funnel["checkout_rate"] = funnel["checkouts"] / adds * 100 if adds else None
+
+    return funnel
+
+
+def _counts(since_day):
+    return (
+        FunnelDayRollup.objects
+        .filter(day__gte=since_day)
+        .values("product_handle", "event")
+        .annotate(total=Sum("count"))
+        .values_list("product_handle", "event", "total")
+    )
+
+
+def product_funnels(since_day, limit=10):
+    """
+    Return view → bag → checkout counts per product, most viewed first.
+    """
+
+    funnels = {}
+
+    for handle, event, total in _counts(since_day):
+        if not handle:
+            continue
+
+        funnel = funnels.setdefault(handle, _funnel(handle))
+        funnel[STEPS[event]] += total
+
+    ranked = sorted(
+        funnels.values(),
+        key=lambda funnel: (-funnel["views"], -funnel["adds"], funnel["name"]),
+    )
+
+    return [_with_rates(funnel) for funnel in ranked[:limit]]
+
+
+def collection_funnels(since_day):
+    """
+    Return funnel counts per collection, using the catalogue mirror
+    to find each product's collections. Products not in the mirror
+    are left out.
+    """
+
+    counts = list(_counts(since_day))
+
+    memberships = defaultdict(list)
+
+    for handle, collection in (
+        Product.objects
+        .filter(
+            slug__in={handle for handle, _, _ in counts if handle},
+            collections__isnull=False,
+        )
+        .values_list("slug", "collections__name")
+    ):
+        memberships[handle].append(collection)
+
+    funnels = {}
+
+    for handle, event, total in counts:
+        for collection in memberships.get(handle, ()):
+            funnel = funnels.setdefault(collection, _funnel(collection))
+            funnel[STEPS[event]] += total
+
+    ranked = sorted(
+        funnels.values(),
+        key=lambda funnel: (-funnel["views"], funnel["name"]),
+    )
+
+    return [_with_rates(funnel) for funnel in ranked]
@@ -0,0 +1,61 @@
+from django.db import transaction
+
+from .models import FunnelEvent, PageView
+from .rollups import record_funnel_rollups, record_rollups, record_sketches
+
+
+@transaction.atomic
+def ingest_pageviews(events, sketches=True):
+    """
+    Write a batch of page view dicts and fold them into the rollups.
+    """
+
+    PageView.objects.bulk_create(
+        [PageView(**fields) for fields in events]
+    )
+
+    record_rollups(events, sketches=sketches)
+
+
+@transaction.atomic
+def ingest_funnel_events(events):
+    """
+    Write a batch of funnel event dicts and fold them into the rollups.
+    """
+
+    FunnelEvent.objects.bulk_create(
+        [FunnelEvent(**fields) for fields in events]
+    )
+
+    record_funnel_rollups(events)
+
+
+@transaction.atomic
+def ingest_records(records, sketches=True):
+    """
+    Write a mixed batch from the buffer or spool: funnel events carry
+    an ``event`` field, page views already written directly carry
+    ``sketch_only`` and still need merging into the visitor sketches,
+    and everything else is a page view.
+    """
+
+    pageviews = []
+    funnel_events = []
+    sketch_only = []
+
+    for record in records:
+        if "event" in record:
+            funnel_events.append(record)
+        elif record.get("sketch_only"):
+            sketch_only.append(record)
+        else:
+            pageviews.append(record)
+
+    if pageviews:
+        ingest_pageviews(pageviews, sketches=sketches)
+
+    if funnel_events:
+        ingest_funnel_events(funnel_events)
+
+    if sketch_only:
+        record_sketches(sketch_only)
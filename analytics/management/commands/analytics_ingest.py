@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from analytics.spool import closed_segments, ingest_segment
+
+
+class Command(BaseCommand):
+    help = (
+        "Load spooled page views and funnel events (ANALYTICS_INGEST=spool) "
+        "into the database. Run it on the same host as the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--spool-dir",
+            default=settings.ANALYTICS_SPOOL_DIR,
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep running and load new segments as they close.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10,
+            help="Seconds between checks with --watch.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        while True:
+            self._ingest(options)
+
+            if not options["watch"]:
+                return
+
+            time.sleep(options["interval"])
+
+    def _ingest(self, options):
+        close_old_connections()
+
+        for path in closed_segments(options["spool_dir"]):
+            try:
+                written = ingest_segment(
+                    path,
+                    batch_size=options["batch_size"],
+                )
+            except Exception as exc:
+                if not options["watch"]:
+                    raise
+
+                # The segment stays in place; try again next round.
+                self.stderr.write(f"Could not load {path.name}: {exc}")
+                close_old_connections()
+                return
+
+            self.stdout.write(f"Loaded {written} events from {path.name}.")
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.retention import ARCHIVE_FORMATS, prune_pageviews
+
+
+def _size(value):
+    if value is None:
+        return "unknown"
+
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+    return f"{value:.1f} GiB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive raw page views older than the retention window and "
+        "delete them in small chunks. Their rollups are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.ANALYTICS_RETENTION_DAYS,
+            help="Keep raw page views for the last N days.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.ANALYTICS_ARCHIVE_DIR,
+            help="Where to write archived page views.",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete expired page views without archiving them.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=ARCHIVE_FORMATS,
+            default="jsonl",
+            help=(
+                "jsonl writes one JSON object per line; columnar writes "
+                "one array per field, which compresses better."
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Rows archived and deleted per transaction.",
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help=(
+                "Vacuum the page view table afterwards and report its "
+                "size. Deleted rows keep their space until then."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be removed without changing anything.",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1.")
+
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        archive_dir = None if options["no_archive"] else options["archive_dir"]
+
+        report = prune_pageviews(
+            keep_days=options["days"],
+            archive_dir=archive_dir,
+            archive_format=options["format"],
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+            vacuum=options["vacuum"],
+        )
+
+        if report["first_day"] is None:
+            self.stdout.write(
+                f"No page views older than {report['cutoff']:%Y-%m-%d}."
+            )
+            return
+
+        days = report["rolled_up_days"]
+
+        if days:
+            self.stdout.write(
+                f"{'Would roll up' if options['dry_run'] else 'Rolled up'} "
+                f"{len(days)} days that had no rollups, "
+                f"{days[0]} to {days[-1]}."
+            )
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Dry run: {report['rows']} page views from "
+                    f"{report['first_day']} to {report['last_day']} "
+                    "would be removed."
+                )
+            )
+            return
+
+        if archive_dir:
+            self.stdout.write(
+                f"Archived to {archive_dir}: {report['archive_files']} files, "
+                f"{_size(report['archive_bytes'])}."
+            )
+
+        if options["vacuum"]:
+            reclaimed = None
+
+            if None not in (report["size_before"], report["size_after"]):
+                reclaimed = report["size_before"] - report["size_after"]
+
+            self.stdout.write(
+                f"Table size: {_size(report['size_before'])} -> "
+                f"{_size(report['size_after'])} "
+                f"({_size(reclaimed)} reclaimed)."
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {report['rows']} page views from "
+                f"{report['first_day']} to {report['last_day']} "
+                f"in {report['chunks']} chunks."
+            )
+        )
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from analytics.models import PageView
+from analytics.retention import pruned_through
+from analytics.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the analytics rollup tables from raw page views."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only rebuild the last N days (default: all page views).",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        bounds = PageView.objects.aggregate(
+            first=Min("timestamp"),
+            last=Max("timestamp"),
+        )
+
+        if bounds["first"] is None:
+            self.stdout.write("No page views recorded yet.")
+            return
+
+        start_day = timezone.localdate(bounds["first"])
+        end_day = timezone.localdate(bounds["last"])
+
+        # Pruned days have lost some or all of their raw page views;
+        # rebuilding them would overwrite their rollups with less.
+        pruned = pruned_through()
+
+        if pruned is not None:
+            start_day = max(start_day, pruned + timedelta(days=1))
+
+        if options["days"] is not None:
+            if options["days"] < 1:
+                raise CommandError("--days must be at least 1.")
+
+            start_day = max(
+                start_day,
+                today - timedelta(days=options["days"] - 1),
+            )
+            end_day = today
+
+        if start_day > end_day:
+            self.stdout.write("Every day with page views has been pruned.")
+            return
+
+        current = start_day
+
+        # One day per transaction keeps locks short
+        # while live traffic keeps writing rollups.
+        while current <= end_day:
+            rebuild_rollups(current, current)
+            current += timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt rollups for {start_day} to {end_day}."
+            )
+        )
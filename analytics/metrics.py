@@ -0,0 +1,54 @@
+import threading
+
+
+class MiddlewareMetrics:
+    """
+    Count what the analytics middleware did and how long it took.
+
+    Timings cover only the analytics step, not the view, so they show
+    what recording page views adds to each storefront response.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._counters = {
+            "recorded": 0,
+            "ignored": 0,
+            "sampled_out": 0,
+            "errors": 0,
+        }
+        self._timed = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def observe(self, seconds):
+        with self._lock:
+            self._timed += 1
+            self._total_seconds += seconds
+            self._max_seconds = max(self._max_seconds, seconds)
+
+    def stats(self):
+        """
+        Return a snapshot of this worker's counters and timings.
+        """
+
+        with self._lock:
+            stats = dict(self._counters)
+            timed = self._timed
+            total = self._total_seconds
+            stats["max_ms"] = self._max_seconds * 1000
+
+        stats["timed"] = timed
+        stats["avg_ms"] = total / timed * 1000 if timed else 0.0
+
+        return stats
+
+
+middleware_metrics = MiddlewareMetrics()
@@ -1,11 +1,18 @@
-import hashlib
-import hmac
-from urllib.parse import urlparse
+import logging
+import random
+import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
 from django.utils import timezone
 
-from .models import PageView
+from .classify import classify, referrer_hostname
+from .events import submit
+from .metrics import middleware_metrics
+from .visitor_keys import request_visitor_key
+
+
+logger = logging.getLogger(__name__)
 
 
 IGNORED_PATHS = (
@@ -18,93 +25,60 @@ IGNORED_PATHS = (
 )
 
 
-BOT_MARKERS = (
-    "bot",
-    "crawler",
-    "spider",
-    "slurp",
-    "bingpreview",
-    "facebookexternalhit",
-    "whatsapp",
-    "telegrambot",
-    "discordbot",
-)
-
-
-def _get_ip(request):
-    forwarded = request.META.get(
-        "HTTP_X_FORWARDED_FOR",
-        "",
-    )
-
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-
-    return request.META.get(
-        "REMOTE_ADDR",
-        "",
-    )
-
-
-def _visitor_key(request):
+def _ignored_path_trie(prefixes):
     """
-    Create a one-way anonymous visitor identifier.
+    Index path prefixes by segment: "/static/" becomes {"static": None}.
 
-    It changes every day, preventing long-term visitor tracking.
-    Raw IP addresses and user-agent strings are not stored.
+    None marks the end of a prefix, so any path below it is ignored.
+    Lookups cost one dict step per path segment, however many prefixes
+    are configured.
     """
 
-    ip = _get_ip(request)
+    trie = {}
 
-    user_agent = request.META.get(
-        "HTTP_USER_AGENT",
-        "",
-    )
+    for prefix in prefixes:
+        segments = [
+            segment
+            for segment in prefix.split("/")
+            if segment
+        ]
 
-    day = timezone.localdate().isoformat()
+        if not segments:
+            continue
 
-    message = (
-        f"{day}|{ip}|{user_agent}"
-    ).encode("utf-8")
+        node = trie
 
-    digest = hmac.new(
-        settings.SECRET_KEY.encode("utf-8"),
-        message,
-        hashlib.sha256,
-    ).hexdigest()
+        for segment in segments[:-1]:
+            child = node.get(segment, {})
 
-    return digest[:32]
+            # A shorter prefix already covers this one.
+            if child is None:
+                break
 
+            node[segment] = child
+            node = child
+        else:
+            node[segments[-1]] = None
 
-def _device_type(user_agent):
-    ua = user_agent.lower()
+    return trie
 
-    if "ipad" in ua or "tablet" in ua:
-        return "tablet"
-
-    if any(
-        marker in ua
-        for marker in (
-            "iphone",
-            "android",
-            "mobile",
-        )
-    ):
-        return "mobile"
 
-    if ua:
-        return "desktop"
+def _is_ignored(trie, path):
+    node = trie
 
-    return "other"
+    for segment in path.split("/"):
+        if not segment:
+            continue
 
+        try:
+            node = node[segment]
+        except KeyError:
+            return False
 
-def _is_bot(user_agent):
-    ua = user_agent.lower()
+        if node is None:
+            return True
 
-    return any(
-        marker in ua
-        for marker in BOT_MARKERS
-    )
+    return False
 
 
 def _referrer_host(request):
@@ -113,15 +87,9 @@ def _referrer_host(request):
         "",
     )
 
-    if not referrer:
-        return ""
+    hostname = referrer_hostname(referrer)
 
-    try:
-        hostname = (
-            urlparse(referrer).hostname
-            or ""
-        ).lower()
-    except ValueError:
+    if not hostname:
         return ""
 
     try:
@@ -148,12 +116,72 @@ class AnalyticsMiddleware:
     Analytics failure must never interrupt the shop.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        self.ignored_paths = _ignored_path_trie(
+            (
+                *IGNORED_PATHS,
+                settings.STATIC_URL,
+                settings.MEDIA_URL,
+                *settings.ANALYTICS_IGNORED_PATHS,
+            )
+        )
+        self.sample_rate = settings.ANALYTICS_SAMPLE_RATE
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if not self._should_record(request):
+            return self.get_response(request)
+
         response = self.get_response(request)
 
+        self._record_safely(request, response)
+
+        return response
+
+    async def __acall__(self, request):
+        if not self._should_record(request):
+            return await self.get_response(request)
+
+        response = await self.get_response(request)
+
+        # Buffered and spooled page views never wait on the database.
+        if settings.ANALYTICS_INGEST == "direct":
+            await sync_to_async(self._record_safely)(request, response)
+        else:
+            self._record_safely(request, response)
+
+        return response
+
+    def _should_record(self, request):
+        # Decide from the method and path alone, before the view runs,
+        # so ignored traffic costs nothing beyond this check.
+        if request.method != "GET" or _is_ignored(
+            self.ignored_paths,
+            request.path,
+        ):
+            middleware_metrics.count("ignored")
+            return False
+
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            middleware_metrics.count("sampled_out")
+            return False
+
+        return True
+
+    def _record_safely(self, request, response):
+        started = time.perf_counter()
+
         try:
             self._record(
                 request,
@@ -162,22 +190,17 @@ class AnalyticsMiddleware:
         except Exception:
             # Analytics must never be capable of
             # breaking the customer-facing site.
-            pass
+            middleware_metrics.count("errors")
+            logger.exception("Failed to record page view")
 
-        return response
+        middleware_metrics.observe(
+            time.perf_counter() - started
+        )
 
     def _record(self, request, response):
-        if request.method != "GET":
-            return
-
         if response.status_code != 200:
             return
 
-        path = request.path
-
-        if path.startswith(IGNORED_PATHS):
-            return
-
         content_type = response.get(
             "Content-Type",
             "",
@@ -191,18 +214,23 @@ class AnalyticsMiddleware:
             "",
         )
 
-        if _is_bot(user_agent):
+        classification = classify(user_agent)
+
+        if classification.is_bot:
             return
 
-        PageView.objects.create(
-            path=path[:500],
-            referrer_host=_referrer_host(
+        fields = {
+            "timestamp": timezone.now(),
+            "path": request.path[:500],
+            "referrer_host": _referrer_host(
                 request
             ),
-            device=_device_type(
-                user_agent
-            ),
-            visitor_key=_visitor_key(
+            "device": classification.device,
+            "visitor_key": request_visitor_key(
                 request
             ),
-        )
\ No newline at end of file
+        }
+
+        submit(fields)
+
+        middleware_metrics.count("recorded")
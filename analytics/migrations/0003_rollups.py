@@ -0,0 +1,61 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_pageview_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVisitor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('path', models.CharField(blank=True, max_length=500)),
+                ('visitor_key', models.CharField(max_length=32)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'path', 'visitor_key'), name='analytics_dailyvisitor_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('device', models.CharField(choices=[('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet'), ('other', 'Other')], max_length=20)),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'device'), name='analytics_deviceday_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PageHourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('path', models.CharField(max_length=500)),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'path'), name='analytics_pagehour_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferrerDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('referrer_host', models.CharField(blank=True, max_length=255)),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'referrer_host'), name='analytics_referrerday_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FunnelDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event', models.CharField(choices=[('view_product', 'Viewed product'), ('add_to_bag', 'Added to bag'), ('remove', 'Removed from bag'), ('checkout_redirect', 'Went to checkout')], max_length=20)),
+                ('product_handle', models.CharField(blank=True, max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'event', 'product_handle'), name='analytics_funnelday_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FunnelEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('event', models.CharField(choices=[('view_product', 'Viewed product'), ('add_to_bag', 'Added to bag'), ('remove', 'Removed from bag'), ('checkout_redirect', 'Went to checkout')], max_length=20)),
+                ('product_handle', models.CharField(blank=True, max_length=255)),
+                ('visitor_key', models.CharField(max_length=32)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['timestamp'], name='analytics_f_timesta_ef95c9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_funnel_events'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pageview',
+            name='analytics_p_path_51c7b7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pageview',
+            name='analytics_p_visitor_25cc91_idx',
+        ),
+        migrations.AlterField(
+            model_name='pageview',
+            name='path',
+            field=models.CharField(max_length=500),
+        ),
+        migrations.AlterField(
+            model_name='pageview',
+            name='visitor_key',
+            field=models.CharField(max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='dailyvisitor',
+            index=models.Index(fields=['path', 'day'], name='analytics_d_path_bd84d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['path', 'timestamp', 'visitor_key'], name='analytics_p_path_66545a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['referrer_host', 'timestamp', 'visitor_key'], name='analytics_p_referre_a5fa81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['device', 'timestamp', 'visitor_key'], name='analytics_p_device_68f86b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitorsketch',
+            index=models.Index(fields=['path', 'day'], name='analytics_v_path_fc2c2a_idx'),
+        ),
+    ]
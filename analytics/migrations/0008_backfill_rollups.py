@@ -0,0 +1,59 @@
+from django.db import migrations
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Roll up the page views recorded before the rollup tables existed.
+
+    0003_rollups created the tables empty, and the dashboard reads only
+    rollups, so without this every earlier day would show no traffic.
+    Each day is rebuilt from its raw rows in its own transaction, the
+    same way ``manage.py rebuild_analytics_rollups`` does, so running
+    it over days that already have rollups is harmless. Days that may
+    have been pruned are skipped.
+    """
+
+    # The rebuild writes through the current models; this migration
+    # only needs the tables as they are at this point in history.
+    from analytics.rollups import rebuild_rollups
+
+    PageView = apps.get_model("analytics", "PageView")
+    RetentionState = apps.get_model("analytics", "RetentionState")
+
+    pruned = (
+        RetentionState.objects
+        .filter(name="pageviews")
+        .values_list("pruned_through", flat=True)
+        .first()
+    )
+
+    days = (
+        PageView.objects
+        .order_by()
+        .annotate(day=TruncDate("timestamp"))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+    for day in sorted(days):
+        if pruned is None or day > pruned:
+            rebuild_rollups(day, day)
+
+
+class Migration(migrations.Migration):
+
+    # Commit each day as it is rebuilt rather than holding one
+    # transaction across the whole page view history.
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0007_retention_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_rollups,
+            migrations.RunPython.noop,
+        ),
+    ]
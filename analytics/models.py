@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class PageView(models.Model):
@@ -9,12 +10,11 @@ class PageView(models.Model):
         ("other", "Other"),
     ]
 
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the request is recorded, not when a buffered
+    # batch is eventually written.
+    timestamp = models.DateTimeField(default=timezone.now)
 
-    path = models.CharField(
-        max_length=500,
-        db_index=True,
-    )
+    path = models.CharField(max_length=500)
 
     referrer_host = models.CharField(
         max_length=255,
@@ -29,19 +29,244 @@ class PageView(models.Model):
 
     # Anonymous identifier that changes every day.
     # Raw IP addresses and user agents are never stored.
-    visitor_key = models.CharField(
-        max_length=32,
-        db_index=True,
+    visitor_key = models.CharField(max_length=32)
+
+    class Meta:
+        ordering = ["-timestamp"]
+
+        # One index per filter the traffic API and retention command
+        # use, each ending in a timestamp range. The visitor key is the
+        # last column so distinct-visitor counts read only the index.
+        indexes = [
+            models.Index(fields=["timestamp"]),
+            models.Index(fields=["path", "timestamp", "visitor_key"]),
+            models.Index(fields=["referrer_host", "timestamp", "visitor_key"]),
+            models.Index(fields=["device", "timestamp", "visitor_key"]),
+        ]
+
+    def __str__(self):
+        return f"{self.path} - {self.timestamp:%Y-%m-%d %H:%M}"
+
+
+class FunnelEvent(models.Model):
+    """
+    A step towards a sale, recorded from the catalogue views.
+    """
+
+    VIEW_PRODUCT = "view_product"
+    ADD_TO_BAG = "add_to_bag"
+    REMOVE = "remove"
+    CHECKOUT_REDIRECT = "checkout_redirect"
+
+    EVENT_CHOICES = [
+        (VIEW_PRODUCT, "Viewed product"),
+        (ADD_TO_BAG, "Added to bag"),
+        (REMOVE, "Removed from bag"),
+        (CHECKOUT_REDIRECT, "Went to checkout"),
+    ]
+
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    event = models.CharField(
+        max_length=20,
+        choices=EVENT_CHOICES,
     )
 
+    # Shopify product handle; blank when the product isn't known.
+    product_handle = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+
+    visitor_key = models.CharField(max_length=32)
+
     class Meta:
         ordering = ["-timestamp"]
 
         indexes = [
             models.Index(fields=["timestamp"]),
-            models.Index(fields=["path", "timestamp"]),
-            models.Index(fields=["visitor_key", "timestamp"]),
         ]
 
     def __str__(self):
-        return f"{self.path} - {self.timestamp:%Y-%m-%d %H:%M}"
\ No newline at end of file
+        return f"{self.event} {self.product_handle} - {self.timestamp:%Y-%m-%d %H:%M}"
+
+
+# ---------------------------------------------------------------------------
+# Rollups
+#
+# Kept up to date as page views are written (see analytics.rollups), so the
+# dashboard reads a handful of buckets instead of scanning raw page views.
+# ---------------------------------------------------------------------------
+
+
+class PageHourRollup(models.Model):
+    hour = models.DateTimeField()
+
+    path = models.CharField(max_length=500)
+
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "path"],
+                name="analytics_pagehour_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.path} @ {self.hour:%Y-%m-%d %H:00}: {self.views}"
+
+
+class ReferrerDayRollup(models.Model):
+    day = models.DateField()
+
+    referrer_host = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "referrer_host"],
+                name="analytics_referrerday_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.referrer_host or '(direct)'} on {self.day}: {self.visits}"
+
+
+class DeviceDayRollup(models.Model):
+    day = models.DateField()
+
+    device = models.CharField(
+        max_length=20,
+        choices=PageView.DEVICE_CHOICES,
+    )
+
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "device"],
+                name="analytics_deviceday_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.device} on {self.day}: {self.visits}"
+
+
+class DailyVisitor(models.Model):
+    """
+    One row per anonymous visitor per day, site-wide and per page.
+
+    Site-wide rows have an empty ``path``. Visitor keys already rotate
+    daily, so counting rows gives distinct visitors for any day range.
+    """
+
+    day = models.DateField()
+
+    path = models.CharField(
+        max_length=500,
+        blank=True,
+    )
+
+    visitor_key = models.CharField(max_length=32)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "path", "visitor_key"],
+                name="analytics_dailyvisitor_unique",
+            ),
+        ]
+
+        indexes = [
+            models.Index(fields=["path", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.visitor_key} on {self.day} {self.path}"
+
+
+class VisitorSketch(models.Model):
+    """
+    HyperLogLog sketch of the visitor keys seen on a day.
+
+    An empty ``path`` holds the site-wide sketch. See analytics.hll.
+    """
+
+    day = models.DateField()
+
+    path = models.CharField(
+        max_length=500,
+        blank=True,
+    )
+
+    sketch = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "path"],
+                name="analytics_visitorsketch_unique",
+            ),
+        ]
+
+        indexes = [
+            models.Index(fields=["path", "day"]),
+        ]
+
+    def __str__(self):
+        return f"Visitor sketch {self.day} {self.path}"
+
+
+class FunnelDayRollup(models.Model):
+    day = models.DateField()
+
+    event = models.CharField(
+        max_length=20,
+        choices=FunnelEvent.EVENT_CHOICES,
+    )
+
+    product_handle = models.CharField(
+        max_length=255,
+        blank=True,
+    )
+
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "event", "product_handle"],
+                name="analytics_funnelday_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.product_handle} on {self.day}: {self.count}"
+
+
+class RetentionState(models.Model):
+    """
+    Bookkeeping for prune_pageviews.
+
+    ``pruned_through`` is the last local day whose raw page views may
+    have been deleted. It is saved before any rows go, so a day left
+    half deleted by an interrupted run is covered too. Rollups up to
+    and including it can't be rebuilt from the raw rows that remain.
+    """
+
+    name = models.CharField(max_length=40, unique=True)
+    pruned_through = models.DateField(blank=True, null=True)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.name} (pruned through {self.pruned_through})"
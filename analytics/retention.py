@@ -0,0 +1,324 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyVisitor, PageHourRollup, PageView, RetentionState
+from .rollups import _day_bounds, rebuild_rollups
+
+
+ARCHIVE_FIELDS = [
+    "id",
+    "timestamp",
+    "path",
+    "referrer_host",
+    "device",
+    "visitor_key",
+]
+
+ARCHIVE_FORMATS = ("jsonl", "columnar")
+
+STATE_NAME = "pageviews"
+
+
+def pruned_through():
+    """
+    Return the last day whose raw page views may have been pruned,
+    or None if nothing has been pruned yet.
+    """
+
+    return (
+        RetentionState.objects
+        .filter(name=STATE_NAME)
+        .values_list("pruned_through", flat=True)
+        .first()
+    )
+
+
+def table_size():
+    """
+    Return the bytes used by the page view table and its indexes,
+    or None if the database can't tell us.
+    """
+
+    table = PageView._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT pg_total_relation_size(%s)",
+                [table],
+            )
+            return cursor.fetchone()[0]
+
+        if connection.vendor == "sqlite":
+            try:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat "
+                    "WHERE name IN ("
+                    "  SELECT name FROM sqlite_master WHERE tbl_name = %s"
+                    ")",
+                    [table],
+                )
+            except Exception:
+                # SQLite built without the dbstat table.
+                return None
+
+            return cursor.fetchone()[0] or 0
+
+    return None
+
+
+def vacuum_table():
+    """
+    Let the database reuse the space left by deleted page views.
+
+    Deleted rows keep their space until this runs: PostgreSQL's VACUUM
+    makes it reusable and hands back empty pages at the end of the
+    table, and SQLite's rewrites the whole database file. Neither can
+    run inside a transaction.
+    """
+
+    table = connection.ops.quote_name(PageView._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"VACUUM (ANALYZE) {table}")
+
+        elif connection.vendor == "sqlite":
+            cursor.execute("VACUUM")
+
+
+def _days_without_rollups(expired, pruned):
+    """
+    Return the expired days that have raw page views but no rollups,
+    e.g. history recorded before the rollup tables existed.
+
+    Days up to ``pruned`` may already have lost raw rows, so they are
+    never rolled up again.
+    """
+
+    days = set(
+        expired
+        .order_by()
+        .annotate(day=TruncDate("timestamp"))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+    if pruned is not None:
+        days = {day for day in days if day > pruned}
+
+    if not days:
+        return []
+
+    start, end = _day_bounds(min(days), max(days))
+
+    with_pages = set(
+        PageHourRollup.objects
+        .filter(hour__gte=start, hour__lt=end)
+        .order_by()
+        .annotate(day=TruncDate("hour"))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+    with_visitors = set(
+        DailyVisitor.objects
+        .filter(day__in=days)
+        .order_by()
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+    return sorted(days - (with_pages & with_visitors))
+
+
+def _partition_path(archive_dir, day, run, part, archive_format):
+    suffix = "jsonl.gz" if archive_format == "jsonl" else "columns.json.gz"
+
+    # Hive-style day=YYYY-MM-DD directories, so the archive can be
+    # loaded into most warehouses as a table partitioned by day.
+    return (
+        Path(archive_dir)
+        / "pageviews"
+        / f"day={day.isoformat()}"
+        / f"part-{run}-{part:05d}.{suffix}"
+    )
+
+
+def _write_partition(path, rows, archive_format):
+    if archive_format == "jsonl":
+        payload = "".join(
+            json.dumps(row, separators=(",", ":")) + "\n"
+            for row in rows
+        )
+
+    else:
+        payload = json.dumps(
+            {
+                "fields": ARCHIVE_FIELDS,
+                "rows": len(rows),
+                "columns": {
+                    field: [row[field] for row in rows]
+                    for field in ARCHIVE_FIELDS
+                },
+            },
+            separators=(",", ":"),
+        )
+
+    data = gzip.compress(payload.encode("utf-8"))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # The rows are deleted straight after this,
+    # so make sure they have reached the disk.
+    with open(path, "wb") as archive:
+        archive.write(data)
+        archive.flush()
+        os.fsync(archive.fileno())
+
+    return len(data)
+
+
+def _archive_chunk(rows, archive_dir, archive_format, run, part):
+    by_day = defaultdict(list)
+
+    for row in rows:
+        day = timezone.localdate(row["timestamp"])
+        row["timestamp"] = row["timestamp"].isoformat()
+        by_day[day].append(row)
+
+    written = 0
+
+    for day, day_rows in by_day.items():
+        written += _write_partition(
+            _partition_path(archive_dir, day, run, part, archive_format),
+            day_rows,
+            archive_format,
+        )
+
+    return len(by_day), written
+
+
+def prune_pageviews(
+    keep_days,
+    archive_dir=None,
+    archive_format="jsonl",
+    chunk_size=5000,
+    dry_run=False,
+    vacuum=False,
+):
+    """
+    Archive page views older than ``keep_days`` and delete them in chunks.
+
+    Rollups are written when page views are ingested, so they usually
+    cover these rows already. Expired days without rollups, such as
+    history from before the rollup tables existed, are rolled up from
+    their raw rows first. Each chunk is written to the archive before
+    it is deleted, in its own short transaction, so live ingestion is
+    never blocked for long. Pass ``archive_dir=None`` to delete without
+    archiving.
+
+    The table doesn't shrink when rows are deleted, so its size is only
+    measured around a ``vacuum=True`` run, which vacuums it afterwards.
+    """
+
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {archive_format}")
+
+    cutoff_day = timezone.localdate() - timedelta(days=keep_days)
+    cutoff, _ = _day_bounds(cutoff_day, cutoff_day)
+
+    expired = PageView.objects.filter(timestamp__lt=cutoff)
+
+    report = {
+        "cutoff": cutoff,
+        "first_day": None,
+        "last_day": None,
+        "rows": 0,
+        "chunks": 0,
+        "archive_files": 0,
+        "archive_bytes": 0,
+        "rolled_up_days": [],
+        "size_before": table_size() if vacuum else None,
+        "size_after": None,
+    }
+
+    timestamps = expired.values_list("timestamp", flat=True)
+    first = timestamps.order_by("timestamp").first()
+
+    if first is None:
+        return report
+
+    report["first_day"] = timezone.localdate(first)
+    report["last_day"] = timezone.localdate(
+        timestamps.order_by("-timestamp").first()
+    )
+
+    report["rolled_up_days"] = _days_without_rollups(
+        expired,
+        pruned_through(),
+    )
+
+    if dry_run:
+        report["rows"] = expired.count()
+        return report
+
+    # One day per transaction, as rebuild_analytics_rollups does.
+    for day in report["rolled_up_days"]:
+        rebuild_rollups(day, day)
+
+    # Record the days before deleting anything, so an interrupted run
+    # still stops rebuild_analytics_rollups from rebuilding a half
+    # deleted day out of the rows that are left.
+    state, _ = RetentionState.objects.get_or_create(name=STATE_NAME)
+
+    if state.pruned_through is None or state.pruned_through < report["last_day"]:
+        state.pruned_through = report["last_day"]
+
+    state.last_run_at = timezone.now()
+    state.save()
+
+    run = timezone.now().strftime("%Y%m%dT%H%M%S")
+
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expired
+                .order_by("timestamp", "id")
+                .values(*ARCHIVE_FIELDS)[:chunk_size]
+            )
+
+            if not rows:
+                break
+
+            ids = [row["id"] for row in rows]
+
+            if archive_dir:
+                files, written = _archive_chunk(
+                    rows,
+                    archive_dir,
+                    archive_format,
+                    run,
+                    report["chunks"],
+                )
+                report["archive_files"] += files
+                report["archive_bytes"] += written
+
+            PageView.objects.filter(id__in=ids).delete()
+
+        report["rows"] += len(ids)
+        report["chunks"] += 1
+
+    if vacuum:
+        vacuum_table()
+        report["size_after"] = table_size()
+
+    return report
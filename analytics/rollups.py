@@ -0,0 +1,367 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import (
+    DailyVisitor,
+    DeviceDayRollup,
+    FunnelDayRollup,
+    FunnelEvent,
+    PageHourRollup,
+    PageView,
+    ReferrerDayRollup,
+    VisitorSketch,
+)
+
+
+# Site-wide sketches get more registers than per-page ones:
+# about 1.6% standard error for 4 KiB versus 3.3% for 1 KiB.
+SITE_SKETCH_PRECISION = 12
+PATH_SKETCH_PRECISION = 10
+
+
+def _new_sketch(path):
+    return HyperLogLog(
+        SITE_SKETCH_PRECISION if path == "" else PATH_SKETCH_PRECISION
+    )
+
+
+def _hour(timestamp):
+    return timestamp.replace(
+        minute=0,
+        second=0,
+        microsecond=0,
+    )
+
+
+def _increment(model, counts, count_field):
+    """
+    Add ``counts`` (a mapping of lookup tuples to amounts) to a rollup.
+
+    One UPDATE per bucket, falling back to INSERT for new buckets.
+    """
+
+    for lookup, amount in counts.items():
+        lookup = dict(lookup)
+
+        updated = model.objects.filter(**lookup).update(
+            **{count_field: F(count_field) + amount}
+        )
+
+        if updated:
+            continue
+
+        try:
+            with transaction.atomic():
+                model.objects.create(
+                    **lookup,
+                    **{count_field: amount},
+                )
+        except IntegrityError:
+            # Another worker created the bucket first.
+            model.objects.filter(**lookup).update(
+                **{count_field: F(count_field) + amount}
+            )
+
+
+def _merge_sketches(keys_by_bucket):
+    """
+    Add visitor keys to the stored sketch for each ``(day, path)``.
+    """
+
+    for (day, path), visitor_keys in keys_by_bucket.items():
+        while True:
+            row = (
+                VisitorSketch.objects
+                .select_for_update()
+                .filter(day=day, path=path)
+                .first()
+            )
+
+            sketch = (
+                HyperLogLog.from_bytes(bytes(row.sketch))
+                if row
+                else _new_sketch(path)
+            )
+
+            for visitor_key in visitor_keys:
+                sketch.add(visitor_key)
+
+            if row:
+                row.sketch = sketch.to_bytes()
+                row.save(update_fields=["sketch"])
+                break
+
+            try:
+                with transaction.atomic():
+                    VisitorSketch.objects.create(
+                        day=day,
+                        path=path,
+                        sketch=sketch.to_bytes(),
+                    )
+                break
+            except IntegrityError:
+                # Another worker created the sketch first;
+                # go round again and merge into theirs.
+                continue
+
+
+def visitor_estimate(since_day, path=""):
+    """
+    Estimate distinct visitors from ``since_day`` onwards by merging sketches.
+    """
+
+    merged = _new_sketch(path)
+
+    for sketch in VisitorSketch.objects.filter(
+        day__gte=since_day,
+        path=path,
+    ).values_list("sketch", flat=True):
+        merged.merge(HyperLogLog.from_bytes(bytes(sketch)))
+
+    return merged.count()
+
+
+def record_sketches(events):
+    """
+    Merge the visitor keys of a batch of page view dicts into the sketches.
+
+    Each ``(day, path)`` sketch is locked while it's merged, so this is
+    only called for batches written off the request path.
+    """
+
+    keys_by_bucket = defaultdict(set)
+
+    for event in events:
+        day = timezone.localdate(event["timestamp"])
+
+        keys_by_bucket[(day, "")].add(event["visitor_key"])
+        keys_by_bucket[(day, event["path"])].add(event["visitor_key"])
+
+    _merge_sketches(keys_by_bucket)
+
+
+def record_rollups(events, sketches=True):
+    """
+    Fold a batch of page view dicts into the rollup tables.
+
+    With ``sketches=False`` the visitor sketches are left for the caller
+    to merge later with ``record_sketches()``.
+    """
+
+    pages = Counter()
+    referrers = Counter()
+    devices = Counter()
+    visitors = set()
+
+    for event in events:
+        timestamp = event["timestamp"]
+        day = timezone.localdate(timestamp)
+
+        pages[
+            (
+                ("hour", _hour(timestamp)),
+                ("path", event["path"]),
+            )
+        ] += 1
+
+        referrers[
+            (
+                ("day", day),
+                ("referrer_host", event["referrer_host"]),
+            )
+        ] += 1
+
+        devices[
+            (
+                ("day", day),
+                ("device", event["device"]),
+            )
+        ] += 1
+
+        visitors.add((day, "", event["visitor_key"]))
+        visitors.add((day, event["path"], event["visitor_key"]))
+
+    _increment(PageHourRollup, pages, "views")
+    _increment(ReferrerDayRollup, referrers, "visits")
+    _increment(DeviceDayRollup, devices, "visits")
+
+    DailyVisitor.objects.bulk_create(
+        [
+            DailyVisitor(
+                day=day,
+                path=path,
+                visitor_key=visitor_key,
+            )
+            for day, path, visitor_key in visitors
+        ],
+        ignore_conflicts=True,
+    )
+
+    if sketches:
+        record_sketches(events)
+
+
+def record_funnel_rollups(events):
+    """
+    Fold a batch of funnel event dicts into the daily funnel counts.
+    """
+
+    counts = Counter(
+        (
+            ("day", timezone.localdate(event["timestamp"])),
+            ("event", event["event"]),
+            ("product_handle", event["product_handle"]),
+        )
+        for event in events
+    )
+
+    _increment(FunnelDayRollup, counts, "count")
+
+
+def _day_bounds(start_day, end_day):
+    start = timezone.make_aware(
+        datetime.combine(start_day, time.min)
+    )
+
+    end = timezone.make_aware(
+        datetime.combine(end_day + timedelta(days=1), time.min)
+    )
+
+    return start, end
+
+
+@transaction.atomic
+def rebuild_rollups(start_day, end_day, batch_size=1000):
+    """
+    Recompute every rollup for local days ``start_day``..``end_day``.
+
+    Existing rollup rows in the range are replaced, so running this
+    again over the same days is safe.
+    """
+
+    start, end = _day_bounds(start_day, end_day)
+
+    views = PageView.objects.filter(
+        timestamp__gte=start,
+        timestamp__lt=end,
+    ).order_by()
+
+    PageHourRollup.objects.filter(
+        hour__gte=start,
+        hour__lt=end,
+    ).delete()
+
+    for model in (
+        ReferrerDayRollup,
+        DeviceDayRollup,
+        DailyVisitor,
+        VisitorSketch,
+        FunnelDayRollup,
+    ):
+        model.objects.filter(
+            day__gte=start_day,
+            day__lte=end_day,
+        ).delete()
+
+    PageHourRollup.objects.bulk_create(
+        (
+            PageHourRollup(**row)
+            for row in views
+            .annotate(hour=TruncHour("timestamp"))
+            .values("hour", "path")
+            .annotate(views=Count("id"))
+        ),
+        batch_size=batch_size,
+    )
+
+    days = views.annotate(day=TruncDate("timestamp"))
+
+    ReferrerDayRollup.objects.bulk_create(
+        (
+            ReferrerDayRollup(**row)
+            for row in days
+            .values("day", "referrer_host")
+            .annotate(visits=Count("id"))
+        ),
+        batch_size=batch_size,
+    )
+
+    DeviceDayRollup.objects.bulk_create(
+        (
+            DeviceDayRollup(**row)
+            for row in days
+            .values("day", "device")
+            .annotate(visits=Count("id"))
+        ),
+        batch_size=batch_size,
+    )
+
+    FunnelDayRollup.objects.bulk_create(
+        (
+            FunnelDayRollup(**row)
+            for row in FunnelEvent.objects
+            .filter(
+                timestamp__gte=start,
+                timestamp__lt=end,
+            )
+            .order_by()
+            .annotate(day=TruncDate("timestamp"))
+            .values("day", "event", "product_handle")
+            .annotate(count=Count("id"))
+        ),
+        batch_size=batch_size,
+    )
+
+    sketches = {}
+
+    def visitor_rows(rows):
+        for day, path, visitor_key in rows:
+            if (day, path) not in sketches:
+                sketches[(day, path)] = _new_sketch(path)
+
+            sketches[(day, path)].add(visitor_key)
+
+            yield DailyVisitor(
+                day=day,
+                path=path,
+                visitor_key=visitor_key,
+            )
+
+    DailyVisitor.objects.bulk_create(
+        visitor_rows(
+            (day, "", visitor_key)
+            for day, visitor_key in days
+            .values_list("day", "visitor_key")
+            .distinct()
+            .iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+    DailyVisitor.objects.bulk_create(
+        visitor_rows(
+            days
+            .values_list("day", "path", "visitor_key")
+            .distinct()
+            .iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+    VisitorSketch.objects.bulk_create(
+        (
+            VisitorSketch(
+                day=day,
+                path=path,
+                sketch=sketch.to_bytes(),
+            )
+            for (day, path), sketch in sketches.items()
+        ),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,171 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import DailyVisitor, PageHourRollup, PageView
+
+
+BUCKETS = ("hour", "day")
+
+# Longest range each bucket size may span, in days.
+MAX_RANGE_DAYS = {
+    "hour": 31,
+    "day": 366,
+}
+
+
+def _bucket_starts(start, end, bucket):
+    """
+    Yield every bucket start from ``start`` up to ``end``.
+
+    Hours are stepped in UTC so a DST change neither repeats nor skips
+    an hour, then shown in local time like the query results.
+    """
+
+    if bucket == "day":
+        day = timezone.localdate(start)
+
+        while day < timezone.localdate(end):
+            yield day
+            day += timedelta(days=1)
+
+        return
+
+    current = start.astimezone(dt_timezone.utc)
+
+    while current < end:
+        yield timezone.localtime(current)
+        current += timedelta(hours=1)
+
+
+def _key(value):
+    # Aware datetimes from the database and from _bucket_starts may
+    # carry different tzinfo objects; compare them as instants.
+    if isinstance(value, datetime):
+        return value.timestamp()
+
+    return value
+
+
+def traffic_series(
+    start_day,
+    end_day,
+    bucket="day",
+    path=None,
+    referrer_host=None,
+    device=None,
+):
+    """
+    Return page views and visitors per bucket for local days
+    ``start_day``..``end_day``, with empty buckets filled in.
+
+    Without a referrer or device filter the page views come from the
+    rollups, which outlive pruned raw page views. Filtering by referrer
+    or device, or counting visitors per hour, needs the raw rows.
+    """
+
+    start = timezone.make_aware(datetime.combine(start_day, time.min))
+    end = timezone.make_aware(
+        datetime.combine(end_day + timedelta(days=1), time.min)
+    )
+
+    views = {}
+    visitors = {}
+
+    raw = PageView.objects.filter(
+        timestamp__gte=start,
+        timestamp__lt=end,
+    ).order_by()
+
+    if path is not None:
+        raw = raw.filter(path=path)
+
+    trunc = TruncHour if bucket == "hour" else TruncDate
+
+    if referrer_host is not None or device is not None:
+        source = "pageviews"
+
+        if referrer_host is not None:
+            raw = raw.filter(referrer_host=referrer_host)
+
+        if device is not None:
+            raw = raw.filter(device=device)
+
+        for row in (
+            raw
+            .annotate(bucket=trunc("timestamp"))
+            .values("bucket")
+            .annotate(
+                views=Count("id"),
+                visitors=Count("visitor_key", distinct=True),
+            )
+        ):
+            views[_key(row["bucket"])] = row["views"]
+            visitors[_key(row["bucket"])] = row["visitors"]
+
+    else:
+        source = "rollups"
+
+        rollups = PageHourRollup.objects.filter(
+            hour__gte=start,
+            hour__lt=end,
+        ).order_by()
+
+        if path is not None:
+            rollups = rollups.filter(path=path)
+
+        for row in (
+            rollups
+            .annotate(bucket=trunc("hour"))
+            .values("bucket")
+            .annotate(views=Sum("views"))
+        ):
+            views[_key(row["bucket"])] = row["views"]
+
+        if bucket == "day":
+            counted = (
+                DailyVisitor.objects
+                .filter(
+                    day__gte=start_day,
+                    day__lte=end_day,
+                    path=path or "",
+                )
+                .values("day")
+                .annotate(visitors=Count("id"))
+                .values_list("day", "visitors")
+            )
+        else:
+            counted = (
+                raw
+                .annotate(bucket=TruncHour("timestamp"))
+                .values("bucket")
+                .annotate(visitors=Count("visitor_key", distinct=True))
+                .values_list("bucket", "visitors")
+            )
+
+        for value, count in counted:
+            visitors[_key(value)] = count
+
+    return {
+        "bucket": bucket,
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
+        "source": source,
+        "series": [
+            {
+                "t": bucket_start.isoformat(),
+                "pageviews": views.get(_key(bucket_start), 0),
+                "visitors": visitors.get(_key(bucket_start), 0),
+            }
+            for bucket_start in _bucket_starts(start, end, bucket)
+        ],
+    }
+
+
+def parse_day(value, default):
+    if not value:
+        return default
+
+    return date.fromisoformat(value)
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .ingest import ingest_records
+
+
+logger = logging.getLogger(__name__)
+
+# Each record is a 4-byte big-endian length followed by that many
+# bytes of compact JSON.
+HEADER = struct.Struct(">I")
+
+SEGMENT_SUFFIX = ".spool"
+
+# Writers start a new segment every this many seconds; the consumer
+# only reads segments no writer can still be appending to.
+SEGMENT_SECONDS = 60
+
+
+def _segment_start(now):
+    return int(now) - int(now) % SEGMENT_SECONDS
+
+
+class SpoolWriter:
+    """
+    Append page views and funnel events to local segment files for
+    ``analytics_ingest``.
+
+    A request costs one ``write`` to an O_APPEND file descriptor, whatever
+    state the database is in. Each process writes its own segments,
+    named after its pid and the minute they cover, so a recycled worker
+    leaves complete files behind rather than losing queued events.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = Path(spool_dir)
+
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._segment = None
+
+    def _open(self, segment):
+        if self._fd is not None:
+            os.close(self._fd)
+
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+
+        path = self.spool_dir / (
+            f"pageviews-{segment}-{os.getpid()}{SEGMENT_SUFFIX}"
+        )
+
+        self._fd = os.open(
+            path,
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o640,
+        )
+        self._pid = os.getpid()
+        self._segment = segment
+
+    def append(self, **fields):
+        fields["timestamp"] = fields["timestamp"].isoformat()
+
+        payload = json.dumps(
+            fields,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+        record = HEADER.pack(len(payload)) + payload
+        segment = _segment_start(time.time())
+
+        with self._lock:
+            # A forked worker must not share its parent's file.
+            if self._segment != segment or self._pid != os.getpid():
+                self._open(segment)
+
+            os.write(self._fd, record)
+
+
+def read_records(path):
+    """
+    Return the event dicts in a segment file.
+
+    A record cut short by a crash mid-write is skipped.
+    """
+
+    data = Path(path).read_bytes()
+    records = []
+    offset = 0
+
+    while offset + HEADER.size <= len(data):
+        (length,) = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+
+        if offset + length > len(data):
+            logger.warning("Skipping truncated record at the end of %s", path)
+            break
+
+        fields = json.loads(data[offset:offset + length])
+        fields["timestamp"] = datetime.fromisoformat(fields["timestamp"])
+        records.append(fields)
+
+        offset += length
+
+    return records
+
+
+def closed_segments(spool_dir, now=None):
+    """
+    Return segment files no writer will append to again, oldest first.
+
+    The segment before the current one is left alone for one more
+    period: a writer that picked its segment just before the boundary,
+    or whose clock is slightly behind, may still be appending to it.
+    """
+
+    if now is None:
+        now = time.time()
+
+    closed_before = _segment_start(now) - SEGMENT_SECONDS
+    segments = []
+
+    for path in Path(spool_dir).glob(f"pageviews-*{SEGMENT_SUFFIX}"):
+        try:
+            segment = int(path.name.split("-")[1])
+        except (IndexError, ValueError):
+            continue
+
+        if segment < closed_before:
+            segments.append((segment, path))
+
+    return [path for _, path in sorted(segments)]
+
+
+def ingest_segment(path, batch_size=500):
+    """
+    Load one segment into the database and delete it. Returns the
+    number of events written.
+
+    The whole segment is one transaction, so a failure leaves the file
+    in place to retry. A crash between the commit and the delete would
+    load it twice, so delivery is at least once.
+    """
+
+    records = read_records(path)
+
+    with transaction.atomic():
+        for start in range(0, len(records), batch_size):
+            ingest_records(records[start:start + batch_size])
+
+    os.unlink(path)
+
+    return len(records)
+
+
+spool_writer = SpoolWriter(settings.ANALYTICS_SPOOL_DIR)
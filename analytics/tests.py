@@ -1,3 +1,1144 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import date, timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.models import Collection, Product
+
+from .buffer import PageViewBuffer
+from .classify import (
+    MAX_USER_AGENT_LENGTH,
+    UA_PATTERN,
+    UA_TOKENS,
+    _classify,
+    classify,
+    load_bot_markers,
+)
+from .funnels import collection_funnels, product_funnels
+from .hll import HyperLogLog
+from .ingest import ingest_pageviews, ingest_records
+from .metrics import middleware_metrics
+from .middleware import AnalyticsMiddleware, _ignored_path_trie, _is_ignored
+from .spool import HEADER, SEGMENT_SECONDS, SpoolWriter, closed_segments
+from .visitor_keys import MAX_IP_LENGTH, VisitorKeys
+from .models import (
+    DailyVisitor,
+    DeviceDayRollup,
+    FunnelDayRollup,
+    FunnelEvent,
+    PageHourRollup,
+    PageView,
+    ReferrerDayRollup,
+    VisitorSketch,
+)
+from .retention import _archive_chunk
+from .rollups import rebuild_rollups, visitor_estimate
+
+
+# Rendering pages needs static URLs without a collectstatic manifest.
+TEST_STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.InMemoryStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+
+def _pageview(**overrides):
+    fields = {
+        "timestamp": timezone.now(),
+        "path": "/shop/",
+        "referrer_host": "",
+        "device": "desktop",
+        "visitor_key": "a" * 32,
+    }
+    fields.update(overrides)
+    return fields
+
+
+class PageViewBufferTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(PageViewBuffer, "_ensure_started")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flush_writes_batches_with_request_timestamps(self):
+        buffer = PageViewBuffer(batch_size=2)
+        recorded_at = timezone.now() - timedelta(minutes=5)
+
+        for _ in range(5):
+            buffer.add(**_pageview(timestamp=recorded_at))
+
+        buffer.flush()
+
+        self.assertEqual(PageView.objects.count(), 5)
+        self.assertEqual(
+            set(PageView.objects.values_list("timestamp", flat=True)),
+            {recorded_at},
+        )
+        self.assertEqual(buffer.stats()["flushed"], 5)
+        self.assertEqual(buffer.stats()["pending"], 0)
+
+    def test_full_buffer_drops_and_counts(self):
+        buffer = PageViewBuffer(max_size=2)
+
+        results = [buffer.add(**_pageview()) for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(buffer.stats()["dropped"], 1)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+
+        self.events = [
+            _pageview(timestamp=now, path="/shop/", visitor_key="a" * 32),
+            _pageview(timestamp=now, path="/shop/", visitor_key="a" * 32),
+            _pageview(
+                timestamp=now,
+                path="/shop/lace-trim-jacket/",
+                referrer_host="instagram.com",
+                device="mobile",
+                visitor_key="b" * 32,
+            ),
+            _pageview(
+                timestamp=now - timedelta(days=2),
+                path="/shop/",
+                visitor_key="c" * 32,
+            ),
+        ]
+
+        ingest_pageviews(self.events)
+
+    def _snapshot(self):
+        return {
+            "pages": sorted(
+                PageHourRollup.objects.values_list("hour", "path", "views")
+            ),
+            "referrers": sorted(
+                ReferrerDayRollup.objects.values_list(
+                    "day", "referrer_host", "visits"
+                )
+            ),
+            "devices": sorted(
+                DeviceDayRollup.objects.values_list("day", "device", "visits")
+            ),
+            "visitors": sorted(
+                DailyVisitor.objects.values_list("day", "path", "visitor_key")
+            ),
+        }
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        incremental = self._snapshot()
+
+        today = timezone.localdate()
+        rebuild_rollups(today - timedelta(days=3), today)
+
+        self.assertEqual(self._snapshot(), incremental)
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_dashboard_reads_rollups(self):
+        staff = get_user_model().objects.create_user(
+            "staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("analytics:dashboard"))
+
+        self.assertEqual(response.context["pageviews_today"], 3)
+        self.assertEqual(response.context["visitors_today"], 2)
+        self.assertEqual(response.context["pageviews_7_days"], 4)
+        self.assertEqual(response.context["visitors_7_days"], 3)
+        self.assertEqual(
+            response.context["top_pages"][0],
+            {"path": "/shop/", "views": 3, "visitors": 2},
+        )
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_dashboard_shows_catalogue_cache_counters(self):
+        staff = get_user_model().objects.create_user(
+            "staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(staff)
+
+        counters = {
+            "hits": 41,
+            "misses": 1,
+            "stale": 3,
+            "refreshes": 2,
+            "refresh_errors": 1,
+            "local_entries": 12,
+        }
+
+        with mock.patch("analytics.views.cache_stats", return_value=counters):
+            response = self.client.get(reverse("analytics:dashboard"))
+
+        self.assertEqual(response.context["catalog_cache_stats"], counters)
+        self.assertContains(response, "41 of 42")
+        self.assertContains(response, "(2 refreshed, 1 failed)")
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_dashboard_can_show_approximate_visitors(self):
+        staff = get_user_model().objects.create_user(
+            "staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(staff)
+
+        response = self.client.get(
+            reverse("analytics:dashboard"),
+            {"visitors": "approximate"},
+        )
+
+        self.assertEqual(response.context["visitor_count_mode"], "approximate")
+        self.assertEqual(response.context["visitors_today"], 2)
+        self.assertEqual(response.context["visitors_7_days"], 3)
+
+    def test_migration_backfills_missing_rollups(self):
+        incremental = self._snapshot()
+
+        for model in (
+            PageHourRollup,
+            ReferrerDayRollup,
+            DeviceDayRollup,
+            DailyVisitor,
+        ):
+            model.objects.all().delete()
+
+        migration = import_module("analytics.migrations.0008_backfill_rollups")
+        migration.backfill_rollups(apps, None)
+
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_rebuild_keeps_sketches(self):
+        today = timezone.localdate()
+        before = visitor_estimate(today - timedelta(days=7))
+
+        rebuild_rollups(today - timedelta(days=3), today)
+
+        self.assertEqual(visitor_estimate(today - timedelta(days=7)), before)
+
+
+class HyperLogLogTests(SimpleTestCase):
+    """
+    The sketch should land within three standard errors
+    (3 * 1.04 / sqrt(2**p)) of the true distinct count.
+    """
+
+    def _sketch(self, keys, precision=12):
+        sketch = HyperLogLog(precision)
+
+        for key in keys:
+            sketch.add(key)
+
+        return sketch
+
+    def test_error_stays_within_bound(self):
+        for precision in (10, 12):
+            bound = 3 * 1.04 / (2 ** precision) ** 0.5
+
+            for distinct in (1000, 10000, 100000):
+                with self.subTest(precision=precision, distinct=distinct):
+                    sketch = self._sketch(
+                        (f"visitor-{n}" for n in range(distinct)),
+                        precision,
+                    )
+
+                    error = abs(sketch.count() - distinct) / distinct
+
+                    self.assertLess(error, bound)
+
+    def test_duplicates_are_not_counted_twice(self):
+        sketch = self._sketch(f"visitor-{n % 500}" for n in range(5000))
+
+        self.assertEqual(
+            sketch.count(),
+            self._sketch(f"visitor-{n}" for n in range(500)).count(),
+        )
+
+    def test_merge_matches_union(self):
+        first = self._sketch(f"visitor-{n}" for n in range(0, 6000))
+        second = self._sketch(f"visitor-{n}" for n in range(4000, 10000))
+        union = self._sketch(f"visitor-{n}" for n in range(10000))
+
+        self.assertEqual(first.merge(second).registers, union.registers)
+
+    def test_round_trips_through_bytes(self):
+        sketch = self._sketch((f"visitor-{n}" for n in range(100)), 10)
+
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+
+        self.assertEqual(restored.precision, 10)
+        self.assertEqual(restored.count(), sketch.count())
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=40)
+
+        ingest_pageviews(
+            [
+                _pageview(timestamp=self.old, visitor_key="a" * 32),
+                _pageview(timestamp=self.old, visitor_key="b" * 32),
+                _pageview(
+                    timestamp=self.old - timedelta(days=1),
+                    visitor_key="c" * 32,
+                ),
+                _pageview(),
+            ]
+        )
+
+        archive = tempfile.TemporaryDirectory()
+        self.addCleanup(archive.cleanup)
+        self.archive_dir = archive.name
+
+    def _prune(self, *args):
+        out = StringIO()
+
+        call_command(
+            "prune_pageviews",
+            "--days=30",
+            f"--archive-dir={self.archive_dir}",
+            "--chunk-size=2",
+            *args,
+            stdout=out,
+        )
+
+        return out.getvalue()
+
+    def _archived(self, pattern):
+        return sorted(Path(self.archive_dir).glob(f"pageviews/day=*/{pattern}"))
+
+    def test_prune_archives_and_keeps_rollup_totals(self):
+        self._prune()
+
+        self.assertEqual(PageView.objects.count(), 1)
+        self.assertEqual(
+            sum(PageHourRollup.objects.values_list("views", flat=True)),
+            4,
+        )
+
+        rows = []
+
+        for path in self._archived("*.jsonl.gz"):
+            with gzip.open(path, "rt") as archive:
+                rows.extend(json.loads(line) for line in archive)
+
+        self.assertEqual(
+            sorted(row["visitor_key"][0] for row in rows),
+            ["a", "b", "c"],
+        )
+
+    def test_columnar_archive(self):
+        self._prune("--format=columnar")
+
+        columns = []
+
+        for path in self._archived("*.columns.json.gz"):
+            with gzip.open(path, "rt") as archive:
+                columns.append(json.load(archive))
+
+        self.assertEqual(sum(part["rows"] for part in columns), 3)
+        self.assertEqual(
+            sorted(
+                key[0]
+                for part in columns
+                for key in part["columns"]["visitor_key"]
+            ),
+            ["a", "b", "c"],
+        )
+
+    def test_table_size_is_only_reported_after_vacuuming(self):
+        with mock.patch("analytics.retention.vacuum_table") as vacuum:
+            output = self._prune()
+
+            vacuum.assert_not_called()
+            self.assertNotIn("reclaimed", output)
+            self.assertIn("Moved 3 page views", output)
+
+            ingest_pageviews([_pageview(timestamp=self.old)])
+            output = self._prune("--vacuum")
+
+            vacuum.assert_called_once_with()
+            self.assertIn("reclaimed", output)
+
+    def test_dry_run_changes_nothing(self):
+        self._prune("--dry-run")
+
+        self.assertEqual(PageView.objects.count(), 4)
+        self.assertEqual(self._archived("*"), [])
+
+    def test_interrupted_prune_keeps_rollups(self):
+        archive_chunk = _archive_chunk
+        calls = []
+
+        def fail_second_chunk(*args):
+            calls.append(args)
+
+            if len(calls) == 2:
+                raise OSError("Disk full")
+
+            return archive_chunk(*args)
+
+        # The first chunk removes one of the two views on the newer
+        # expired day, leaving that day half deleted.
+        with mock.patch(
+            "analytics.retention._archive_chunk",
+            side_effect=fail_second_chunk,
+        ):
+            with self.assertRaises(OSError):
+                self._prune()
+
+        self.assertEqual(PageView.objects.count(), 2)
+
+        call_command(
+            "rebuild_analytics_rollups",
+            "--days=60",
+            stdout=StringIO(),
+        )
+        self._prune()
+
+        self.assertEqual(PageView.objects.count(), 1)
+        self.assertEqual(
+            sum(PageHourRollup.objects.values_list("views", flat=True)),
+            4,
+        )
+        self.assertEqual(
+            sum(
+                PageHourRollup.objects.filter(
+                    hour__date=timezone.localdate(self.old),
+                ).values_list("views", flat=True)
+            ),
+            2,
+        )
+
+    def test_days_without_rollups_are_rolled_up_before_pruning(self):
+        # Recorded before the rollup tables existed.
+        older = self.old - timedelta(days=5)
+
+        PageView.objects.bulk_create(
+            [
+                PageView(**_pageview(timestamp=older, visitor_key="d" * 32)),
+                PageView(**_pageview(timestamp=older, visitor_key="e" * 32)),
+            ]
+        )
+
+        self._prune()
+
+        self.assertEqual(PageView.objects.count(), 1)
+        self.assertEqual(
+            sum(PageHourRollup.objects.values_list("views", flat=True)),
+            6,
+        )
+        self.assertEqual(
+            DailyVisitor.objects.filter(
+                day=timezone.localdate(older),
+                path="",
+            ).count(),
+            2,
+        )
+
+    def test_rebuild_leaves_pruned_days_alone(self):
+        self._prune()
+
+        call_command(
+            "rebuild_analytics_rollups",
+            "--days=60",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            sum(PageHourRollup.objects.values_list("views", flat=True)),
+            4,
+        )
+
+
+class ClassifierTests(SimpleTestCase):
+    def test_long_user_agents_are_truncated_before_caching(self):
+        _classify.cache_clear()
+
+        for n in range(3):
+            classify("Mozilla/5.0 Firefox/127.0 " + "a" * 8000 + str(n))
+
+        info = _classify.cache_info()
+
+        self.assertEqual((info.currsize, info.hits), (1, 2))
+
+    def test_classifies_browsers(self):
+        cases = {
+            (
+                "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) "
+                "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 "
+                "Mobile/15E148 Safari/604.1"
+            ): ("mobile", "safari"),
+            (
+                "Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) "
+                "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 "
+                "Mobile/15E148 Safari/604.1"
+            ): ("tablet", "safari"),
+            (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                "AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0"
+            ): ("desktop", "edge"),
+            (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:127.0) "
+                "Gecko/20100101 Firefox/127.0"
+            ): ("desktop", "firefox"),
+            "": ("other", "other"),
+        }
+
+        for user_agent, (device, family) in cases.items():
+            with self.subTest(user_agent=user_agent):
+                self.assertEqual(
+                    classify(user_agent),
+                    (False, device, family),
+                )
+
+    def test_detects_bots(self):
+        for user_agent in (
+            "Mozilla/5.0 (compatible; Googlebot/2.1; "
+            "+http://www.google.com/bot.html)",
+            "facebookexternalhit/1.1",
+            "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; "
+            "compatible; GPTBot/1.2; +https://openai.com/gptbot)",
+            "python-requests/2.32.3",
+        ):
+            with self.subTest(user_agent=user_agent):
+                self.assertTrue(classify(user_agent).is_bot)
+
+    def test_pattern_matches_every_marker_whole(self):
+        for marker in load_bot_markers():
+            with self.subTest(marker=marker):
+                match = UA_PATTERN.search(f"mozilla/5.0 ({marker} 1.0)")
+
+                self.assertEqual(UA_TOKENS[match.group()], "bot")
+
+
+@override_settings(ANALYTICS_INGEST="direct", ANALYTICS_SAMPLE_RATE=1.0)
+class AnalyticsMiddlewareTests(TestCase):
+    def setUp(self):
+        middleware_metrics.reset()
+        self.factory = RequestFactory(
+            HTTP_USER_AGENT="Mozilla/5.0 (Windows NT 10.0) Firefox/127.0",
+        )
+
+        patcher = mock.patch.object(PageViewBuffer, "_ensure_started")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.buffer = PageViewBuffer()
+
+        patcher = mock.patch("analytics.events.pageview_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, path):
+        middleware = AnalyticsMiddleware(lambda request: HttpResponse())
+        return middleware(self.factory.get(path))
+
+    def test_records_storefront_page_views(self):
+        self._get("/shop/")
+
+        self.assertEqual(PageView.objects.get().path, "/shop/")
+        self.assertEqual(middleware_metrics.stats()["recorded"], 1)
+        self.assertEqual(middleware_metrics.stats()["timed"], 1)
+
+    def test_visitor_sketches_are_left_to_the_buffer(self):
+        self._get("/shop/")
+
+        self.assertEqual(DailyVisitor.objects.count(), 2)
+        self.assertFalse(VisitorSketch.objects.exists())
+        self.assertEqual(self.buffer.stats()["pending"], 1)
+
+        self.buffer.flush()
+
+        self.assertEqual(PageView.objects.count(), 1)
+        self.assertEqual(
+            sorted(VisitorSketch.objects.values_list("path", flat=True)),
+            ["", "/shop/"],
+        )
+        self.assertEqual(visitor_estimate(timezone.localdate()), 1)
+
+    def test_ignored_paths_skip_all_analytics_work(self):
+        with mock.patch("analytics.middleware.classify") as classify_mock:
+            for path in ("/static/css/site.css", "/admin/", "/favicon.ico"):
+                self._get(path)
+
+        classify_mock.assert_not_called()
+        self.assertFalse(PageView.objects.exists())
+        self.assertEqual(middleware_metrics.stats()["ignored"], 3)
+        self.assertEqual(middleware_metrics.stats()["timed"], 0)
+
+    @override_settings(ANALYTICS_IGNORED_PATHS=["/shop/webhooks/"])
+    def test_ignored_paths_extend_from_settings(self):
+        self._get("/shop/webhooks/shopify/")
+        self._get("/shop/")
+
+        self.assertEqual(
+            list(PageView.objects.values_list("path", flat=True)),
+            ["/shop/"],
+        )
+
+    @override_settings(ANALYTICS_SAMPLE_RATE=0.0)
+    def test_sampling_skips_page_views(self):
+        self._get("/shop/")
+
+        self.assertFalse(PageView.objects.exists())
+        self.assertEqual(middleware_metrics.stats()["sampled_out"], 1)
+
+    def test_errors_are_logged_and_counted(self):
+        with mock.patch(
+            "analytics.events.ingest_records",
+            side_effect=RuntimeError("database down"),
+        ):
+            with self.assertLogs("analytics.middleware", "ERROR"):
+                response = self._get("/shop/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(middleware_metrics.stats()["errors"], 1)
+
+    def test_ignored_path_trie(self):
+        trie = _ignored_path_trie(["/shop/webhooks/", "/shop/", "/robots.txt"])
+
+        self.assertTrue(_is_ignored(trie, "/shop/lace-trim-jacket/"))
+        self.assertTrue(_is_ignored(trie, "/robots.txt"))
+        self.assertFalse(_is_ignored(trie, "/"))
+        self.assertFalse(_is_ignored(trie, "/about/"))
+
+
+class VisitorKeyTests(SimpleTestCase):
+    def test_keys_are_stable_within_a_day(self):
+        keys = VisitorKeys()
+
+        first = keys.key("81.2.69.160", "Firefox")
+
+        self.assertEqual(keys.key("81.2.69.160", "Firefox"), first)
+        self.assertEqual(VisitorKeys().key("81.2.69.160", "Firefox"), first)
+        self.assertNotEqual(keys.key("81.2.69.161", "Firefox"), first)
+        self.assertEqual(len(first), 32)
+
+    def test_keys_rotate_at_midnight(self):
+        keys = VisitorKeys()
+
+        with mock.patch(
+            "analytics.visitor_keys.timezone.localdate",
+            return_value=date(2026, 3, 1),
+        ):
+            monday = keys.key("81.2.69.160", "Firefox")
+
+        # Pretend midnight has passed.
+        keys._rotate_at = 0
+
+        with mock.patch(
+            "analytics.visitor_keys.timezone.localdate",
+            return_value=date(2026, 3, 2),
+        ):
+            tuesday = keys.key("81.2.69.160", "Firefox")
+
+        self.assertNotEqual(monday, tuesday)
+
+    def test_recent_results_are_bounded(self):
+        keys = VisitorKeys(cache_size=2)
+
+        for n in range(5):
+            keys.key(f"81.2.69.{n}", "Firefox")
+
+        self.assertEqual(len(keys._recent), 2)
+
+    def test_long_headers_are_truncated_before_caching(self):
+        keys = VisitorKeys()
+
+        first = keys.key("81.2.69.160" * 100, "Firefox/127.0 " + "a" * 8000)
+        second = keys.key("81.2.69.160" * 100, "Firefox/127.0 " + "a" * 9000)
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            [(len(ip), len(user_agent)) for ip, user_agent in keys._recent],
+            [(MAX_IP_LENGTH, MAX_USER_AGENT_LENGTH)],
+        )
+
+
+class SpoolTests(TestCase):
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+
+        self.writer = SpoolWriter(self.spool_dir)
+
+    def _at(self, seconds):
+        return mock.patch("analytics.spool.time.time", return_value=seconds)
+
+    def test_consumer_loads_closed_segments(self):
+        recorded_at = timezone.now() - timedelta(minutes=1)
+
+        with self._at(1_000_000):
+            for key in "ab":
+                self.writer.append(
+                    **_pageview(timestamp=recorded_at, visitor_key=key * 32)
+                )
+
+        (segment,) = Path(self.spool_dir).glob("*.spool")
+
+        # A worker killed mid-write leaves half a record behind.
+        with open(segment, "ab") as spool:
+            spool.write(HEADER.pack(100) + b'{"path"')
+
+        with self._at(1_000_000):
+            self.assertEqual(closed_segments(self.spool_dir), [])
+
+        call_command(
+            "analytics_ingest",
+            f"--spool-dir={self.spool_dir}",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            sorted(PageView.objects.values_list("visitor_key", flat=True)),
+            ["a" * 32, "b" * 32],
+        )
+        self.assertEqual(PageView.objects.first().timestamp, recorded_at)
+        self.assertEqual(
+            sum(PageHourRollup.objects.values_list("views", flat=True)),
+            2,
+        )
+        self.assertFalse(segment.exists())
+
+    def test_writer_starts_a_new_segment_each_period(self):
+        with self._at(1_000_000):
+            self.writer.append(**_pageview())
+
+        with self._at(1_000_000 + SEGMENT_SECONDS):
+            self.writer.append(**_pageview())
+
+        self.assertEqual(len(list(Path(self.spool_dir).glob("*.spool"))), 2)
+
+    def test_previous_segment_gets_a_grace_period(self):
+        start = 1_000_000 - 1_000_000 % SEGMENT_SECONDS
+
+        with self._at(start):
+            self.writer.append(**_pageview())
+
+        (segment,) = Path(self.spool_dir).glob("*.spool")
+
+        for now, expected in (
+            (start + SEGMENT_SECONDS, []),
+            (start + 2 * SEGMENT_SECONDS - 1, []),
+            (start + 2 * SEGMENT_SECONDS, [segment]),
+        ):
+            with self.subTest(now=now - start):
+                self.assertEqual(
+                    closed_segments(self.spool_dir, now=now),
+                    expected,
+                )
+
+    @override_settings(ANALYTICS_INGEST="spool")
+    def test_middleware_spools_page_views(self):
+        middleware = AnalyticsMiddleware(lambda request: HttpResponse())
+
+        with mock.patch("analytics.events.spool_writer", self.writer):
+            middleware(RequestFactory().get("/shop/"))
+
+        self.assertFalse(PageView.objects.exists())
+        self.assertEqual(len(list(Path(self.spool_dir).glob("*.spool"))), 1)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "analytics-traffic-tests",
+        },
+    },
+)
+class TrafficSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        now = timezone.now()
+
+        ingest_pageviews(
+            [
+                _pageview(timestamp=now, visitor_key="a" * 32),
+                _pageview(timestamp=now, visitor_key="a" * 32),
+                _pageview(
+                    timestamp=now,
+                    path="/about/",
+                    device="mobile",
+                    visitor_key="b" * 32,
+                ),
+                _pageview(
+                    timestamp=now - timedelta(days=2),
+                    visitor_key="c" * 32,
+                ),
+            ]
+        )
+
+        staff = get_user_model().objects.create_user(
+            "staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(staff)
+
+        self.url = reverse("analytics:traffic")
+        self.today = timezone.localdate()
+
+    def _series(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_daily_series_from_rollups(self):
+        data = self._series(
+            start=(self.today - timedelta(days=6)).isoformat(),
+            end=self.today.isoformat(),
+        )
+
+        self.assertEqual(data["source"], "rollups")
+        self.assertEqual(len(data["series"]), 7)
+        self.assertEqual(
+            data["series"][-1],
+            {"t": self.today.isoformat(), "pageviews": 3, "visitors": 2},
+        )
+        self.assertEqual(data["series"][-3]["pageviews"], 1)
+        self.assertEqual(data["series"][0]["pageviews"], 0)
+
+    def test_hourly_series_covers_every_hour(self):
+        data = self._series(
+            start=self.today.isoformat(),
+            end=self.today.isoformat(),
+            bucket="hour",
+        )
+
+        self.assertIn(len(data["series"]), (23, 24, 25))
+        self.assertEqual(
+            sum(point["pageviews"] for point in data["series"]),
+            3,
+        )
+
+    def test_filters_use_raw_page_views(self):
+        data = self._series(device="mobile")
+
+        self.assertEqual(data["source"], "pageviews")
+        self.assertEqual(
+            sum(point["pageviews"] for point in data["series"]),
+            1,
+        )
+
+        data = self._series(path="/shop/")
+
+        self.assertEqual(
+            sum(point["visitors"] for point in data["series"]),
+            2,
+        )
+
+    def test_conditional_requests_get_not_modified(self):
+        response = self.client.get(self.url)
+
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(
+            self.url,
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_series_is_cached(self):
+        self._series()
+
+        with self.assertNumQueries(2):
+            # Session and user lookups only.
+            self._series()
+
+    def test_rejects_bad_ranges(self):
+        for params in (
+            {"start": "yesterday"},
+            {"bucket": "week"},
+            {"start": "2026-01-10", "end": "2026-01-01"},
+            {"start": "2025-01-01", "end": "2026-01-01", "bucket": "hour"},
+            {"device": "toaster"},
+            {"start": "9999-12-31", "end": "9999-12-31"},
+            {"end": "0001-01-01"},
+            {"start": "0001-01-01", "end": "0001-01-01"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ANALYTICS_INGEST="buffered")
+class FunnelTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(PageViewBuffer, "_ensure_started")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.buffer = PageViewBuffer()
+
+        patcher = mock.patch("analytics.events.pageview_buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _checkout(self, handles):
+        session = self.client.session
+        session["shopify_checkout_url"] = "https://checkout.example/1"
+        session["shopify_cart_handles"] = handles
+        session.save()
+
+        return self.client.get(reverse("catalog:checkout"))
+
+    def test_checkout_redirect_is_buffered(self):
+        response = self._checkout(["taisho-silk-haori", "lace-trim-jacket"])
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(FunnelEvent.objects.exists())
+        self.assertEqual(self.buffer.stats()["pending"], 2)
+
+        self.buffer.flush()
+
+        self.assertEqual(
+            sorted(
+                FunnelDayRollup.objects.values_list(
+                    "event", "product_handle", "count"
+                )
+            ),
+            [
+                ("checkout_redirect", "lace-trim-jacket", 1),
+                ("checkout_redirect", "taisho-silk-haori", 1),
+            ],
+        )
+
+    def test_bots_are_not_counted(self):
+        self.client.get(
+            reverse("catalog:checkout"),
+            HTTP_USER_AGENT="Googlebot/2.1",
+        )
+
+        self.assertEqual(self.buffer.stats()["enqueued"], 0)
+
+    def test_product_and_collection_funnels(self):
+        lace = Collection.objects.create(name="Lace", slug="lace")
+        product = Product.objects.create(
+            name="Lace Trim Jacket",
+            slug="lace-trim-jacket",
+            price=120,
+        )
+        product.collections.add(lace)
+
+        now = timezone.now()
+
+        def event(name, handle="lace-trim-jacket"):
+            return {
+                "timestamp": now,
+                "event": name,
+                "product_handle": handle,
+                "visitor_key": "a" * 32,
+            }
+
+        ingest_records(
+            [event("view_product")] * 4
+            + [event("add_to_bag")] * 2
+            + [event("checkout_redirect")]
+            + [event("view_product", "taisho-silk-haori")]
+        )
+
+        since = timezone.localdate() - timedelta(days=7)
+
+        self.assertEqual(
+            product_funnels(since)[0],
+            {
+                "name": "lace-trim-jacket",
+                "views": 4,
+                "adds": 2,
+                "removes": 0,
+                "checkouts": 1,
+                "add_rate": 50.0,
+                "checkout_rate": 50.0,
+            },
+        )
+        self.assertEqual(
+            [
+                (funnel["name"], funnel["views"])
+                for funnel in collection_funnels(since)
+            ],
+            [("Lace", 4)],
+        )
+
+        rebuild_rollups(timezone.localdate(), timezone.localdate())
+
+        self.assertEqual(product_funnels(since)[0]["views"], 4)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every analytics query the dashboard and the traffic API
+    run, and fail if any of them reads a whole analytics table.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+        now = timezone.now()
+
+        ingest_pageviews(
+            [
+                _pageview(
+                    timestamp=now - timedelta(hours=hours),
+                    path=f"/page-{hours % 5}/",
+                    referrer_host="instagram.com" if hours % 2 else "",
+                    device="mobile" if hours % 3 else "desktop",
+                    visitor_key=f"{hours % 7:032d}",
+                )
+                for hours in range(48)
+            ]
+        )
+
+        staff = get_user_model().objects.create_user(
+            "staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(staff)
+
+    def _plans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tiny test tables are cheapest to scan; make the
+                # planner show what it would do on a large one.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                return [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _full_scans(self, plan):
+        if connection.vendor == "postgresql":
+            return [
+                line
+                for line in plan
+                if "Seq Scan on analytics_" in line
+            ]
+
+        # SQLite: "SCAN <table>" reads every row; "SEARCH" uses an index.
+        return [
+            line
+            for line in plan
+            if line.startswith("SCAN analytics_")
+        ]
+
+    def _assert_no_full_scans(self, fetch):
+        plans = []
+
+        with CaptureQueriesContext(connection) as queries:
+            fetch()
+
+        checked = 0
+
+        for query in queries.captured_queries:
+            sql = query["sql"]
+
+            if not sql.startswith("SELECT") or '"analytics_' not in sql:
+                continue
+
+            checked += 1
+            plan = self._plans(sql)
+
+            with self.subTest(sql=sql):
+                self.assertEqual(self._full_scans(plan), [], plan)
+
+            plans.extend(plan)
+
+        self.assertTrue(checked)
+
+        return plans
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_dashboard_queries_use_indexes(self):
+        self._assert_no_full_scans(
+            lambda: self.client.get(reverse("analytics:dashboard"))
+        )
+
+    @override_settings(STORAGES=TEST_STORAGES)
+    def test_approximate_dashboard_queries_use_indexes(self):
+        self._assert_no_full_scans(
+            lambda: self.client.get(
+                reverse("analytics:dashboard"),
+                {"visitors": "approximate"},
+            )
+        )
+
+    def test_traffic_series_queries_use_indexes(self):
+        for params in (
+            {},
+            {"bucket": "hour"},
+            {"path": "/page-1/"},
+            {"path": "/page-1/", "bucket": "hour"},
+            {"referrer": "instagram.com"},
+            {"device": "mobile", "bucket": "hour"},
+        ):
+            with self.subTest(params=params):
+                self._assert_no_full_scans(
+                    lambda: self.client.get(
+                        reverse("analytics:traffic"),
+                        params,
+                    )
+                )
+
+    def test_filters_search_their_own_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Checks SQLite's plan wording.")
+
+        for params, searched in (
+            ({"path": "/page-1/", "bucket": "hour"}, "path=?"),
+            ({"referrer": "instagram.com"}, "referrer_host=?"),
+            ({"device": "mobile", "bucket": "hour"}, "device=?"),
+        ):
+            with self.subTest(params=params):
+                plans = self._assert_no_full_scans(
+                    lambda: self.client.get(
+                        reverse("analytics:traffic"),
+                        params,
+                    )
+                )
+
+                self.assertTrue(
+                    any(
+                        "COVERING INDEX" in line and searched in line
+                        for line in plans
+                    ),
+                    plans,
+                )
@@ -12,4 +12,9 @@ urlpatterns = [
         views.dashboard,
         name="dashboard",
     ),
+    path(
+        "api/traffic/",
+        views.traffic,
+        name="traffic",
+    ),
 ]
\ No newline at end of file
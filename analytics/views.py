@@ -1,106 +1,334 @@
-from datetime import timedelta
+import hashlib
+import json
+import time as clock
+from datetime import datetime, time, timedelta
 
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from anarchy_and_lace.page_cache import page_cache_stats
+from catalog.fragments import fragment_metrics
+from catalog.shopify import cache_stats
+
+from .buffer import pageview_buffer
+from .funnels import collection_funnels, product_funnels
+from .metrics import middleware_metrics
+from .models import (
+    DailyVisitor,
+    DeviceDayRollup,
+    PageHourRollup,
+    PageView,
+    ReferrerDayRollup,
+)
+from .rollups import visitor_estimate
+from .series import BUCKETS, MAX_RANGE_DAYS, parse_day, traffic_series
+
+
+VISITOR_COUNT_MODES = ("exact", "approximate")
+
+
+def _total_views(since):
+    return (
+        PageHourRollup.objects
+        .filter(hour__gte=since)
+        .aggregate(total=Sum("views"))["total"]
+        or 0
+    )
+
+
+def _visitor_days(since_day, mode):
+    if mode == "approximate":
+        return visitor_estimate(since_day)
+
+    return (
+        DailyVisitor.objects
+        .filter(
+            day__gte=since_day,
+            path="",
+        )
+        .count()
+    )
 
-from .models import PageView
 
 @staff_member_required
 def dashboard(request):
+    mode = request.GET.get(
+        "visitors",
+        settings.ANALYTICS_VISITOR_COUNTS,
+    )
+
+    if mode not in VISITOR_COUNT_MODES:
+        mode = "exact"
+
     now = timezone.now()
     today = timezone.localdate()
 
+    start_of_today = timezone.make_aware(
+        datetime.combine(today, time.min)
+    )
+
+    # Rolling windows start on the hour, the
+    # granularity of the page view rollup.
     seven_days_ago = (
         now - timedelta(days=7)
-    )
+    ).replace(minute=0, second=0, microsecond=0)
 
     thirty_days_ago = (
         now - timedelta(days=30)
-    )
-
-    all_views = PageView.objects.all()
+    ).replace(minute=0, second=0, microsecond=0)
 
-    today_views = all_views.filter(
-        timestamp__date=today
+    seven_days_ago_day = timezone.localdate(
+        seven_days_ago
     )
 
-    seven_day_views = all_views.filter(
-        timestamp__gte=seven_days_ago
-    )
-
-    thirty_day_views = all_views.filter(
-        timestamp__gte=thirty_days_ago
-    )
-
-    top_pages = (
-        seven_day_views
+    top_pages = list(
+        PageHourRollup.objects
+        .filter(hour__gte=seven_days_ago)
         .values("path")
         .annotate(
-            views=Count("id"),
-            visitors=Count(
-                "visitor_key",
-                distinct=True,
-            ),
+            views=Sum("views"),
         )
         .order_by("-views")[:10]
     )
 
+    if mode == "approximate":
+        page_visitors = {
+            page["path"]: visitor_estimate(
+                seven_days_ago_day,
+                path=page["path"],
+            )
+            for page in top_pages
+        }
+
+    else:
+        page_visitors = dict(
+            DailyVisitor.objects
+            .filter(
+                day__gte=seven_days_ago_day,
+                path__in=[
+                    page["path"]
+                    for page in top_pages
+                ],
+            )
+            .values("path")
+            .annotate(
+                visitors=Count("id")
+            )
+            .values_list("path", "visitors")
+        )
+
+    for page in top_pages:
+        page["visitors"] = page_visitors.get(
+            page["path"],
+            0,
+        )
+
     referrers = (
-        seven_day_views
+        ReferrerDayRollup.objects
+        .filter(day__gte=seven_days_ago_day)
         .exclude(referrer_host="")
         .values("referrer_host")
         .annotate(
-            visits=Count("id")
+            visits=Sum("visits")
         )
         .order_by("-visits")[:10]
     )
 
     devices = (
-        seven_day_views
+        DeviceDayRollup.objects
+        .filter(day__gte=seven_days_ago_day)
         .values("device")
         .annotate(
-            visits=Count("id")
+            visits=Sum("visits")
         )
         .order_by("-visits")
     )
 
     context = {
-        "pageviews_today": (
-            today_views.count()
+        "pageviews_today": _total_views(
+            start_of_today
         ),
-        "visitors_today": (
-            today_views
-            .values("visitor_key")
-            .distinct()
-            .count()
+        "visitors_today": _visitor_days(
+            today,
+            mode,
         ),
 
-        "pageviews_7_days": (
-            seven_day_views.count()
+        "pageviews_7_days": _total_views(
+            seven_days_ago
         ),
-        "visitors_7_days": (
-            seven_day_views
-            .values(
-                "timestamp__date",
-                "visitor_key",
-            )
-            .distinct()
-            .count()
+        "visitors_7_days": _visitor_days(
+            seven_days_ago_day,
+            mode,
         ),
 
-        "pageviews_30_days": (
-            thirty_day_views.count()
+        "pageviews_30_days": _total_views(
+            thirty_days_ago
         ),
 
         "top_pages": top_pages,
         "referrers": referrers,
         "devices": devices,
+
+        "funnel_tables": [
+            ("Product", product_funnels(seven_days_ago_day)),
+            ("Collection", collection_funnels(seven_days_ago_day)),
+        ],
+
+        "visitor_count_mode": mode,
+
+        "buffer_stats": pageview_buffer.stats(),
+        "middleware_stats": middleware_metrics.stats(),
+        "page_cache_stats": page_cache_stats(),
+        "catalog_cache_stats": cache_stats(),
+        "fragment_stats": fragment_metrics.stats(),
+        "sample_rate": settings.ANALYTICS_SAMPLE_RATE,
     }
 
     return render(
         request,
         "analytics/dashboard.html",
         context,
-    )
\ No newline at end of file
+    )
+
+
+@staff_member_required
+@require_GET
+def traffic(request):
+    """
+    Page views and visitors per hour or day as JSON, for the charts.
+
+    Query parameters: ``start`` and ``end`` (local dates, inclusive,
+    default the last 7 days), ``bucket`` ("hour" or "day") and the
+    optional filters ``path``, ``referrer`` and ``device``.
+    """
+
+    today = timezone.localdate()
+
+    try:
+        end_day = parse_day(request.GET.get("end"), today)
+        start_day = parse_day(
+            request.GET.get("start"),
+            end_day - timedelta(days=6),
+        )
+    except ValueError:
+        return JsonResponse(
+            {"error": "start and end must be dates (YYYY-MM-DD)."},
+            status=400,
+        )
+    except OverflowError:
+        return JsonResponse(
+            {"error": "start and end are out of range."},
+            status=400,
+        )
+
+    bucket = request.GET.get("bucket", "day")
+
+    if bucket not in BUCKETS:
+        return JsonResponse(
+            {"error": "bucket must be hour or day."},
+            status=400,
+        )
+
+    if start_day > end_day:
+        return JsonResponse(
+            {"error": "start must not be after end."},
+            status=400,
+        )
+
+    if (end_day - start_day).days >= MAX_RANGE_DAYS[bucket]:
+        return JsonResponse(
+            {
+                "error": (
+                    f"{bucket} buckets cover at most "
+                    f"{MAX_RANGE_DAYS[bucket]} days."
+                ),
+            },
+            status=400,
+        )
+
+    device = request.GET.get("device") or None
+
+    if device is not None and device not in dict(PageView.DEVICE_CHOICES):
+        return JsonResponse(
+            {"error": "Unknown device."},
+            status=400,
+        )
+
+    filters = {
+        "path": request.GET.get("path") or None,
+        "referrer_host": request.GET.get("referrer") or None,
+        "device": device,
+    }
+
+    params = json.dumps(
+        [start_day.isoformat(), end_day.isoformat(), bucket, filters],
+        sort_keys=True,
+    )
+    cache_key = (
+        "analytics:traffic:"
+        + hashlib.sha256(params.encode("utf-8")).hexdigest()
+    )
+
+    # Ranges that include today are still filling up.
+    ttl = (
+        settings.ANALYTICS_SERIES_CACHE_TTL
+        if end_day >= today
+        else settings.ANALYTICS_SERIES_CACHE_TTL * 60
+    )
+
+    cached = cache.get(cache_key)
+
+    if cached is None:
+        try:
+            series = traffic_series(start_day, end_day, bucket, **filters)
+        except OverflowError:
+            # The first and last representable dates have no day
+            # before or after them to bound the range with.
+            return JsonResponse(
+                {"error": "start and end are out of range."},
+                status=400,
+            )
+
+        body = json.dumps(
+            series,
+            separators=(",", ":"),
+        )
+
+        digest = hashlib.md5(
+            body.encode("utf-8"),
+            usedforsecurity=False,
+        ).hexdigest()
+
+        cached = {
+            "body": body,
+            "etag": f'"{digest}"',
+            "last_modified": int(clock.time()),
+        }
+
+        cache.set(cache_key, cached, ttl)
+
+    response = get_conditional_response(
+        request,
+        etag=cached["etag"],
+        last_modified=cached["last_modified"],
+    )
+
+    if response is None:
+        response = HttpResponse(
+            cached["body"],
+            content_type="application/json",
+        )
+
+    response["ETag"] = cached["etag"]
+    response["Last-Modified"] = http_date(cached["last_modified"])
+    response["Cache-Control"] = f"private, max-age={ttl}"
+
+    return response
@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .classify import MAX_USER_AGENT_LENGTH
+
+
+# The longest textual IPv6 address, with an embedded IPv4 address.
+MAX_IP_LENGTH = 45
+
+
+class VisitorKeys:
+    """
+    Derive anonymous daily visitor keys from (ip, user agent).
+
+    Once per local day a key is derived from SECRET_KEY and the date;
+    each request then needs a single keyed BLAKE2b hash. The day key
+    is dropped at local midnight along with the cache of recent
+    results, so keys from different days can't be linked, and without
+    SECRET_KEY a key can't be traced back to an IP address.
+    """
+
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._day_key = None
+        self._rotate_at = 0.0
+
+    def _rotate(self):
+        today = timezone.localdate()
+
+        self._day_key = hmac.new(
+            settings.SECRET_KEY.encode("utf-8"),
+            f"analytics-visitor|{today.isoformat()}".encode("utf-8"),
+            hashlib.sha256,
+        ).digest()
+
+        self._rotate_at = timezone.make_aware(
+            datetime.combine(today + timedelta(days=1), time.min)
+        ).timestamp()
+
+        self._recent.clear()
+
+    def key(self, ip, user_agent):
+        # Bounded like classify()'s cache key, so made-up headers
+        # can't make each cached identity kilobytes long.
+        ip = ip[:MAX_IP_LENGTH]
+        user_agent = user_agent[:MAX_USER_AGENT_LENGTH]
+
+        identity = (ip, user_agent)
+
+        with self._lock:
+            if clock.time() >= self._rotate_at:
+                self._rotate()
+
+            visitor_key = self._recent.get(identity)
+
+            if visitor_key is not None:
+                self._recent.move_to_end(identity)
+                return visitor_key
+
+            day_key = self._day_key
+
+        visitor_key = hashlib.blake2b(
+            f"{ip}|{user_agent}".encode("utf-8"),
+            key=day_key,
+            digest_size=16,
+        ).hexdigest()
+
+        with self._lock:
+            # Skip caching if midnight passed while hashing.
+            if day_key is self._day_key:
+                self._recent[identity] = visitor_key
+
+                if len(self._recent) > self.cache_size:
+                    self._recent.popitem(last=False)
+
+        return visitor_key
+
+
+visitor_keys = VisitorKeys()
+
+
+def client_ip(request):
+    forwarded = request.META.get(
+        "HTTP_X_FORWARDED_FOR",
+        "",
+    )
+
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+
+    return request.META.get(
+        "REMOTE_ADDR",
+        "",
+    )
+
+
+def request_visitor_key(request):
+    """
+    Create a one-way anonymous visitor identifier.
+
+    It changes every day, preventing long-term visitor tracking.
+    Raw IP addresses and user-agent strings are not stored.
+    """
+
+    return visitor_keys.key(
+        client_ip(request),
+        request.META.get(
+            "HTTP_USER_AGENT",
+            "",
+        ),
+    )
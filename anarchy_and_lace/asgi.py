@@ -13,4 +13,34 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'anarchy_and_lace.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from catalog.shopify_async import aclose_client  # noqa: E402
+
+
+async def _lifespan(receive, send):
+    """
+    Answer the server's lifespan events, which Django doesn't handle.
+
+    On shutdown the worker's Storefront API client is closed, so its
+    keep-alive connections are released rather than dropped.
+    """
+
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+
+        elif message['type'] == 'lifespan.shutdown':
+            await aclose_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,367 @@
+"""
+Full-page cache for anonymous storefront pages.
+
+Routes listed in ``PAGE_CACHE_TTLS`` are served from the cache for
+anonymous GET requests, skipping the view, Shopify and template
+rendering. The only per-visitor parts of those pages are the bag count,
+flash messages and CSRF token, so:
+
+* the cache key varies on the path, the query parameters in
+  ``PAGE_CACHE_QUERY_PARAMS``, the bag quantity held in the session and
+  the cookies in ``PAGE_CACHE_VARY_COOKIES``;
+* requests with any other query parameter are never cached, so
+  arbitrary query strings can't fill the cache or miss it on purpose;
+* requests with messages waiting, or that add any, are never cached;
+* CSRF tokens are swapped for a placeholder when a page is stored and
+  a token for the current visitor is filled in when it is served.
+
+``purge_pages()`` drops every cached page by moving to a new key
+generation; the catalogue sync calls it. ``purge_pages(paths)`` moves
+only those paths to a new generation, so the Shopify webhook can drop
+the pages showing a changed product and leave the rest cached.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+
+
+GENERATION_KEY = "page-cache:generation"
+
+PATH_GENERATION_KEY = "page-cache:path-generation:{}"
+
+CSRF_PLACEHOLDER = b"page-cache-csrf-token"
+
+# The hidden input rendered by {% csrf_token %}.
+CSRF_INPUT = re.compile(
+    rb'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")'
+)
+
+CART_QUANTITY_KEY = "shopify_cart_quantity"
+
+
+_hit_hooks = {}
+
+_counters = {
+    "hits": 0,
+    "misses": 0,
+    "stored": 0,
+    "bypassed": 0,
+}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def page_cache_stats():
+    """
+    Return this worker's hit, miss, store and bypass counters.
+    """
+
+    with _counters_lock:
+        return dict(_counters)
+
+
+def on_hit(view_name, hook):
+    """
+    Call ``hook(request, match)`` whenever ``view_name`` is served from
+    the cache, for side effects the skipped view would have had.
+    """
+
+    _hit_hooks.setdefault(view_name, []).append(hook)
+
+
+def _cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _path_generation_key(path):
+    digest = hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+    return PATH_GENERATION_KEY.format(digest)
+
+
+def purge_pages(paths=None):
+    """
+    Make cached pages unreachable, e.g. after a catalogue change.
+
+    Without ``paths`` every page goes; otherwise only the pages at those
+    paths, whatever their query string, bag quantity or cookies. Old
+    entries are not deleted; they expire with their TTL.
+    """
+
+    generation = time.time_ns()
+
+    if paths is None:
+        _cache().set(GENERATION_KEY, generation, timeout=None)
+        return
+
+    _cache().set_many(
+        {_path_generation_key(path): generation for path in paths},
+        timeout=None,
+    )
+
+
+def _route(request):
+    """
+    Return ``(match, ttl)`` if the request may use the cache.
+    """
+
+    if not settings.PAGE_CACHE_ENABLED or request.method != "GET":
+        return None
+
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+
+    ttl = settings.PAGE_CACHE_TTLS.get(match.view_name)
+
+    if not ttl:
+        return None
+
+    if any(
+        name not in settings.PAGE_CACHE_QUERY_PARAMS
+        for name in request.GET
+    ):
+        _count("bypassed")
+        return None
+
+    return match, ttl
+
+
+def _generations(cache, request):
+    """
+    Return the site-wide and per-path generations for ``request``.
+    """
+
+    path_key = _path_generation_key(request.path)
+    generations = cache.get_many([GENERATION_KEY, path_key])
+
+    generation = generations.get(GENERATION_KEY)
+
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+
+    return generation, generations.get(path_key, 0)
+
+
+async def _agenerations(cache, request):
+    path_key = _path_generation_key(request.path)
+    generations = await cache.aget_many([GENERATION_KEY, path_key])
+
+    generation = generations.get(GENERATION_KEY)
+
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+
+    return generation, generations.get(path_key, 0)
+
+
+def _page_key(request, generations, cart_quantity):
+    generation, path_generation = generations
+
+    vary = json.dumps(
+        [
+            request.path,
+            path_generation,
+            sorted(request.GET.lists()),
+            cart_quantity or 0,
+            [
+                request.COOKIES.get(name, "")
+                for name in settings.PAGE_CACHE_VARY_COOKIES
+            ],
+        ]
+    )
+
+    digest = hashlib.sha256(vary.encode("utf-8")).hexdigest()
+
+    return f"page-cache:{generation}:{digest}"
+
+
+def _entry(request, response):
+    """
+    Return the cacheable form of ``response``, or None.
+    """
+
+    if (
+        response.status_code != 200
+        or response.streaming
+        or "text/html" not in response.get("Content-Type", "")
+        or response.cookies
+    ):
+        return None
+
+    cache_control = response.get("Cache-Control", "")
+
+    if "private" in cache_control or "no-store" in cache_control:
+        return None
+
+    # The page may show the session or messages as changed by the view.
+    if request.session.modified:
+        return None
+
+    storage = getattr(request, "_messages", None)
+
+    if storage is not None and storage.added_new:
+        return None
+
+    return {
+        "content": CSRF_INPUT.sub(
+            rb"\g<1>" + CSRF_PLACEHOLDER + rb"\g<2>",
+            response.content,
+        ),
+        "headers": list(response.headers.items()),
+    }
+
+
+def _response(request, entry):
+    content = entry["content"]
+
+    if CSRF_PLACEHOLDER in content:
+        # Also makes CsrfViewMiddleware send the CSRF cookie.
+        content = content.replace(
+            CSRF_PLACEHOLDER,
+            get_token(request).encode("ascii"),
+        )
+
+    response = HttpResponse(content)
+
+    for header, value in entry["headers"]:
+        response[header] = value
+
+    return response
+
+
+class PageCacheMiddleware:
+    """
+    Serve anonymous GETs of the routes in ``PAGE_CACHE_TTLS`` from cache.
+
+    Goes after the CSRF, auth and messages middleware, so cached pages
+    still get a CSRF cookie, and after AnalyticsMiddleware, so cache
+    hits are still counted as page views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        route = _route(request)
+
+        if route is None:
+            return self.get_response(request)
+
+        match, ttl = route
+        session = request.session
+
+        if (
+            CookieStorage.cookie_name in request.COOKIES
+            or SESSION_KEY in session
+            or SessionStorage.session_key in session
+        ):
+            _count("bypassed")
+            return self.get_response(request)
+
+        cache = _cache()
+
+        key = _page_key(
+            request,
+            _generations(cache, request),
+            session.get(CART_QUANTITY_KEY),
+        )
+
+        entry = cache.get(key)
+
+        if entry is not None:
+            _count("hits")
+
+            for hook in _hit_hooks.get(match.view_name, ()):
+                hook(request, match)
+
+            return _response(request, entry)
+
+        _count("misses")
+
+        response = self.get_response(request)
+
+        entry = _entry(request, response)
+
+        if entry is not None:
+            cache.set(key, entry, ttl)
+            _count("stored")
+
+        return response
+
+    async def __acall__(self, request):
+        route = _route(request)
+
+        if route is None:
+            return await self.get_response(request)
+
+        match, ttl = route
+        session = request.session
+
+        if (
+            CookieStorage.cookie_name in request.COOKIES
+            or await session.ahas_key(SESSION_KEY)
+            or await session.ahas_key(SessionStorage.session_key)
+        ):
+            _count("bypassed")
+            return await self.get_response(request)
+
+        cache = _cache()
+
+        key = _page_key(
+            request,
+            await _agenerations(cache, request),
+            await session.aget(CART_QUANTITY_KEY),
+        )
+
+        entry = await cache.aget(key)
+
+        if entry is not None:
+            _count("hits")
+
+            for hook in _hit_hooks.get(match.view_name, ()):
+                await sync_to_async(hook)(request, match)
+
+            return _response(request, entry)
+
+        _count("misses")
+
+        response = await self.get_response(request)
+
+        entry = _entry(request, response)
+
+        if entry is not None:
+            await cache.aset(key, entry, ttl)
+            _count("stored")
+
+        return response
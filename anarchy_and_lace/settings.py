@@ -37,6 +37,13 @@ def env_int(name: str, default: int) -> int:
         return default
 
 
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, str(default)))
+    except (TypeError, ValueError):
+        return default
+
+
 def env_list(
     name: str,
     default: list[str] | None = None,
@@ -185,7 +192,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "anarchy_and_lace.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -194,6 +201,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 
     "analytics.middleware.AnalyticsMiddleware",
+    "anarchy_and_lace.page_cache.PageCacheMiddleware",
 ]
 
 
@@ -208,16 +216,31 @@ WSGI_APPLICATION = "anarchy_and_lace.wsgi.application"
 
 # ---------------------------------------------------------------------------
 # Templates
+#
+# Outside DEBUG compiled templates are kept by the cached loader, and
+# gunicorn.conf.py compiles the storefront templates as each worker boots
+# (see anarchy_and_lace.template_warmup). The app_directories loader
+# replaces APP_DIRS, which can't be combined with explicit loaders.
 # ---------------------------------------------------------------------------
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ("django.template.loaders.cached.Loader", TEMPLATE_LOADERS),
+    ]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [
             BASE_DIR / "templates",
         ],
-        "APP_DIRS": True,
         "OPTIONS": {
+            "loaders": TEMPLATE_LOADERS,
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -266,6 +289,269 @@ else:
     }
 
 
+# ---------------------------------------------------------------------------
+# Catalogue
+#
+# "shopify" reads storefront pages from the Storefront API.
+# "database" serves them from the local mirror (see catalog.sync).
+# ---------------------------------------------------------------------------
+
+CATALOG_SOURCE = os.environ.get(
+    "CATALOG_SOURCE",
+    "shopify",
+)
+
+# Serve the storefront views that call Shopify as async views
+# (catalog.async_views). Enable together with the ASGI entry point:
+#   gunicorn anarchy_and_lace.asgi:application -k uvicorn_worker.UvicornWorker
+# Under WSGI each async view would run in its own short-lived event loop.
+CATALOG_ASYNC_VIEWS = env_bool("CATALOG_ASYNC_VIEWS", False)
+
+
+# ---------------------------------------------------------------------------
+# Caches
+#
+# "default" is shared by every worker. CACHE_BACKEND picks it:
+#   "redis"   any Redis-protocol server at REDIS_URL (the default when
+#             REDIS_URL is set), shared across dynos.
+#   "file"    files in CACHE_DIR, shared by the workers on one host.
+#   "locmem"  per-process memory, for local development and tests.
+# "local" is always per-process, for data that never changes under the
+# same key and is read too often for a network round trip.
+#
+# Keys are prefixed with the release, so a deploy never reads entries
+# pickled by older code.
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+CACHE_BACKEND = os.environ.get(
+    "CACHE_BACKEND",
+    "redis" if REDIS_URL else "locmem",
+)
+
+CACHE_KEY_PREFIX = os.environ.get(
+    "CACHE_KEY_PREFIX",
+    # Set by Heroku's runtime dyno metadata.
+    os.environ.get("HEROKU_RELEASE_VERSION", "dev"),
+)
+
+CACHE_DEFAULT_TIMEOUT = env_int(
+    "CACHE_DEFAULT_TIMEOUT",
+    300,
+)
+
+if CACHE_BACKEND == "redis":
+    if not REDIS_URL:
+        raise ImproperlyConfigured(
+            "REDIS_URL must be configured when CACHE_BACKEND is redis."
+        )
+
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "OPTIONS": {
+            "serializer": (
+                "anarchy_and_lace.cache_serializers.CompressedPickleSerializer"
+            ),
+        },
+    }
+
+    # Heroku Data for Redis serves TLS with a self-signed certificate.
+    if REDIS_URL.startswith("rediss://") and not env_bool(
+        "REDIS_VERIFY_CERTIFICATE",
+        True,
+    ):
+        DEFAULT_CACHE["OPTIONS"]["ssl_cert_reqs"] = None
+
+elif CACHE_BACKEND == "file":
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "CACHE_DIR",
+            str(BASE_DIR / "cache"),
+        ),
+        "OPTIONS": {
+            "MAX_ENTRIES": env_int("CACHE_MAX_ENTRIES", 10000),
+        },
+    }
+
+elif CACHE_BACKEND == "locmem":
+    DEFAULT_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    }
+
+else:
+    raise ImproperlyConfigured(
+        f"Unknown CACHE_BACKEND {CACHE_BACKEND!r}; "
+        "use redis, file or locmem."
+    )
+
+CACHES = {
+    "default": {
+        **DEFAULT_CACHE,
+        "KEY_PREFIX": CACHE_KEY_PREFIX,
+        "TIMEOUT": CACHE_DEFAULT_TIMEOUT,
+    },
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "local",
+        "KEY_PREFIX": CACHE_KEY_PREFIX,
+        "OPTIONS": {
+            "MAX_ENTRIES": env_int("LOCAL_CACHE_MAX_ENTRIES", 2000),
+        },
+    },
+}
+
+
+# ---------------------------------------------------------------------------
+# Page cache
+#
+# Anonymous GETs of the routes in PAGE_CACHE_TTLS (seconds per URL name)
+# are served from the cache by anarchy_and_lace.page_cache. Catalogue
+# webhooks and syncs purge every cached page.
+# ---------------------------------------------------------------------------
+
+PAGE_CACHE_ENABLED = env_bool(
+    "PAGE_CACHE_ENABLED",
+    not DEBUG,
+)
+
+PAGE_CACHE_ALIAS = os.environ.get(
+    "PAGE_CACHE_ALIAS",
+    "default",
+)
+
+PAGE_CACHE_TTLS = {
+    "home:home": env_int("PAGE_CACHE_HOME_TTL", 300),
+    "home:kimono_history": env_int("PAGE_CACHE_KIMONO_HISTORY_TTL", 3600),
+    "catalog:shop": env_int("PAGE_CACHE_SHOP_TTL", 3600),
+    "catalog:collection_detail": env_int("PAGE_CACHE_COLLECTION_TTL", 300),
+    "catalog:product_detail": env_int("PAGE_CACHE_PRODUCT_TTL", 300),
+}
+
+# Query parameters the cached views read; they become part of the key.
+# A request with any other query parameter skips the cache.
+PAGE_CACHE_QUERY_PARAMS = env_list(
+    "PAGE_CACHE_QUERY_PARAMS",
+)
+
+# theme.js keeps the colour theme in localStorage, so pages don't depend
+# on it today; listed so a server-rendered theme can't leak between visitors.
+PAGE_CACHE_VARY_COOKIES = env_list(
+    "PAGE_CACHE_VARY_COOKIES",
+    default=["theme"],
+)
+
+
+# ---------------------------------------------------------------------------
+# Fragment cache
+#
+# {% product_fragment %} caches product cards and galleries keyed by the
+# product's Shopify updatedAt (see catalog.fragments), so they never need
+# purging; the TTL only bounds how long unused fragments are kept. A page
+# reads dozens of fragments, so they default to the per-process cache.
+# ---------------------------------------------------------------------------
+
+FRAGMENT_CACHE_ENABLED = env_bool(
+    "FRAGMENT_CACHE_ENABLED",
+    not DEBUG,
+)
+
+FRAGMENT_CACHE_ALIAS = os.environ.get(
+    "FRAGMENT_CACHE_ALIAS",
+    "local",
+)
+
+FRAGMENT_CACHE_TTL = env_int(
+    "FRAGMENT_CACHE_TTL",
+    86400,
+)
+
+
+# ---------------------------------------------------------------------------
+# Analytics
+#
+# ANALYTICS_INGEST picks how the middleware writes page views:
+#   "buffered" queues them in memory and writes batches from a background
+#              thread. When the queue is full, new page views are dropped.
+#   "spool"    appends them to files in ANALYTICS_SPOOL_DIR, loaded by
+#              "manage.py analytics_ingest --watch" running on the same host.
+#   "direct"   writes each page view during the request, but still leaves
+#              merging visitor sketches to the buffer's batches.
+# ---------------------------------------------------------------------------
+
+ANALYTICS_BUFFERED = env_bool(
+    "ANALYTICS_BUFFERED",
+    True,
+)
+
+ANALYTICS_INGEST = os.environ.get(
+    "ANALYTICS_INGEST",
+    "buffered" if ANALYTICS_BUFFERED else "direct",
+)
+
+ANALYTICS_SPOOL_DIR = os.environ.get(
+    "ANALYTICS_SPOOL_DIR",
+    str(BASE_DIR / "spool"),
+)
+
+ANALYTICS_BUFFER_MAX_SIZE = env_int(
+    "ANALYTICS_BUFFER_MAX_SIZE",
+    10000,
+)
+
+ANALYTICS_BUFFER_BATCH_SIZE = env_int(
+    "ANALYTICS_BUFFER_BATCH_SIZE",
+    200,
+)
+
+ANALYTICS_BUFFER_FLUSH_INTERVAL = env_int(
+    "ANALYTICS_BUFFER_FLUSH_INTERVAL",
+    5,
+)
+
+# Extra path prefixes never recorded, on top of admin, analytics,
+# static and media, e.g. "/shop/webhooks/,/healthz/".
+ANALYTICS_IGNORED_PATHS = env_list(
+    "ANALYTICS_IGNORED_PATHS",
+)
+
+# Fraction of storefront page views to record, for shedding load at
+# peak times. Counts on the dashboard are then a sample, not totals.
+ANALYTICS_SAMPLE_RATE = env_float(
+    "ANALYTICS_SAMPLE_RATE",
+    1.0,
+)
+
+# "exact" counts daily visitor rows; "approximate" merges HyperLogLog
+# sketches. Staff can switch per request with ?visitors=approximate.
+ANALYTICS_VISITOR_COUNTS = os.environ.get(
+    "ANALYTICS_VISITOR_COUNTS",
+    "exact",
+)
+
+# Seconds the traffic chart API caches a series that includes today;
+# ranges that have ended are cached 60 times longer.
+ANALYTICS_SERIES_CACHE_TTL = env_int(
+    "ANALYTICS_SERIES_CACHE_TTL",
+    60,
+)
+
+# Raw page views older than this are archived and deleted by
+# "manage.py prune_pageviews"; the rollups keep their totals.
+ANALYTICS_RETENTION_DAYS = env_int(
+    "ANALYTICS_RETENTION_DAYS",
+    90,
+)
+
+ANALYTICS_ARCHIVE_DIR = os.environ.get(
+    "ANALYTICS_ARCHIVE_DIR",
+    str(BASE_DIR / "archive"),
+)
+
+
 # ---------------------------------------------------------------------------
 # Password validation
 # ---------------------------------------------------------------------------
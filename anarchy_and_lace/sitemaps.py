@@ -1,7 +1,8 @@
 from django.contrib.sitemaps import Sitemap
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 
-from catalog.shopify import get_products
+from catalog.sources import catalog_source
 
 
 class StaticSitemap(Sitemap):
@@ -56,10 +57,17 @@ class ProductSitemap(Sitemap):
 
     def items(self):
         try:
-            return get_products()
+            return catalog_source().get_products(
+                fields="sitemap"
+            )
         except Exception:
             return []
 
+    def lastmod(self, product):
+        return parse_datetime(
+            product.get("updatedAt") or ""
+        )
+
     def location(self, product):
         return reverse(
             "catalog:product_detail",
@@ -0,0 +1,86 @@
+"""
+Compile storefront templates before a worker takes traffic.
+
+In production the template engine keeps compiled templates in the
+cached loader, so only the first request to use each template pays to
+parse it. ``warm_templates()`` pays that cost up front; gunicorn.conf.py
+calls it from ``post_worker_init`` and ``manage.py compile_templates``
+reports how long each template takes.
+"""
+
+import fnmatch
+import logging
+import time
+from pathlib import Path
+
+from django.template import TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+
+
+logger = logging.getLogger(__name__)
+
+
+STOREFRONT_TEMPLATES = [
+    "base.html",
+    "catalog/*.html",
+    "home/*.html",
+]
+
+
+def _engine():
+    return engines["django"].engine
+
+
+def template_names(patterns=STOREFRONT_TEMPLATES):
+    """
+    Return the names of every template matching one of ``patterns``.
+
+    Searches the template directories and installed apps' ``templates``
+    directories, as the loaders do.
+    """
+
+    directories = [
+        *_engine().dirs,
+        *get_app_template_dirs("templates"),
+    ]
+
+    names = set()
+
+    for directory in directories:
+        for path in Path(directory).rglob("*"):
+            if not path.is_file():
+                continue
+
+            name = path.relative_to(directory).as_posix()
+
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                names.add(name)
+
+    return sorted(names)
+
+
+def warm_templates(patterns=STOREFRONT_TEMPLATES):
+    """
+    Load every template matching ``patterns`` into the template cache.
+
+    Returns ``(name, seconds, error)`` for each template. A template
+    that fails to compile is logged and skipped, so it can't stop a
+    worker from booting; its request will raise the error as usual.
+    """
+
+    engine = _engine()
+    timings = []
+
+    for name in template_names(patterns):
+        started = time.perf_counter()
+        error = None
+
+        try:
+            engine.get_template(name)
+        except TemplateSyntaxError as exc:
+            error = exc
+            logger.exception("Template %s failed to compile.", name)
+
+        timings.append((name, time.perf_counter() - started, error))
+
+    return timings
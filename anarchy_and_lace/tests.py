@@ -0,0 +1,315 @@
+import pickle
+import socketserver
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisSerializer
+from django.test import SimpleTestCase, override_settings
+
+from catalog import shopify_async
+
+from .asgi import application
+from .cache_serializers import CompressedPickleSerializer
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """
+    A minimal in-process server speaking enough of the Redis protocol
+    for Django's Redis cache backend, so it can be tested without Redis.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RedisStandInHandler)
+
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+        return key in self.data
+
+    def _set(self, key, value, args):
+        options = [arg.upper() for arg in args]
+
+        if b"NX" in options and self._live(key):
+            return None
+
+        self.data[key] = value
+        self.expires.pop(key, None)
+
+        if b"EX" in options:
+            seconds = int(args[options.index(b"EX") + 1])
+            self.expires[key] = time.monotonic() + seconds
+
+        return b"OK"
+
+    def execute(self, command, *args):
+        with self.lock:
+            if command == b"PING":
+                return b"PONG"
+
+            if command == b"HELLO":
+                return {b"server": b"redis", b"proto": int(args[0])}
+
+            if command == b"GET":
+                return self.data.get(args[0]) if self._live(args[0]) else None
+
+            if command == b"MGET":
+                return [
+                    self.data.get(key) if self._live(key) else None
+                    for key in args
+                ]
+
+            if command == b"SET":
+                return self._set(args[0], args[1], args[2:])
+
+            if command == b"MSET":
+                for key, value in zip(args[::2], args[1::2]):
+                    self._set(key, value, ())
+                return b"OK"
+
+            if command == b"DEL":
+                deleted = [key for key in args if self._live(key)]
+
+                for key in deleted:
+                    del self.data[key]
+                    self.expires.pop(key, None)
+
+                return len(deleted)
+
+            if command == b"EXISTS":
+                return sum(1 for key in args if self._live(key))
+
+            if command == b"INCRBY":
+                value = int(self.data[args[0]]) + int(args[1])
+                self.data[args[0]] = str(value).encode()
+                return value
+
+            if command == b"EXPIRE":
+                if not self._live(args[0]):
+                    return 0
+                self.expires[args[0]] = time.monotonic() + int(args[1])
+                return 1
+
+            if command == b"PERSIST":
+                return int(self.expires.pop(args[0], None) is not None)
+
+            if command == b"FLUSHDB":
+                self.data.clear()
+                self.expires.clear()
+                return b"OK"
+
+        return Exception(f"unknown command '{command.decode()}'")
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+
+        if not line:
+            return None
+
+        count = int(line[1:])
+        parts = []
+
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+
+        return parts
+
+    def _encode(self, reply):
+        # Replies use RESP3, which redis-py asks for with HELLO 3.
+        if reply is None:
+            return b"_\r\n"
+
+        if isinstance(reply, Exception):
+            return f"-ERR {reply}\r\n".encode()
+
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+
+        if isinstance(reply, dict):
+            return b"%%%d\r\n" % len(reply) + b"".join(
+                self._encode(key) + self._encode(value)
+                for key, value in reply.items()
+            )
+
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(
+                self._encode(item) for item in reply
+            )
+
+        if reply in (b"OK", b"PONG", b"QUEUED"):
+            return b"+" + reply + b"\r\n"
+
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    def handle(self):
+        # Commands queued by MULTI for EXEC, as sent by pipelines.
+        queued = None
+
+        while True:
+            parts = self._read_command()
+
+            if not parts:
+                return
+
+            command = parts[0].upper()
+
+            if command == b"MULTI":
+                queued = []
+                reply = b"OK"
+            elif command == b"EXEC":
+                reply = [
+                    self.server.execute(*queued_parts)
+                    for queued_parts in queued
+                ]
+                queued = None
+            elif queued is not None:
+                queued.append([command, *parts[1:]])
+                reply = b"QUEUED"
+            else:
+                reply = self.server.execute(command, *parts[1:])
+
+            self.wfile.write(self._encode(reply))
+
+
+class CompressedPickleSerializerTests(SimpleTestCase):
+    def setUp(self):
+        self.serializer = CompressedPickleSerializer()
+
+        self.collection = {
+            "handle": "lace",
+            "products": {
+                "nodes": [
+                    {
+                        "handle": f"taisho-silk-haori-{n}",
+                        "title": "Taisho Silk Haori",
+                        "updatedAt": "2026-10-12T13:21:09Z",
+                    }
+                    for n in range(50)
+                ],
+            },
+        }
+
+    def test_large_values_are_compressed(self):
+        data = self.serializer.dumps(self.collection)
+
+        self.assertTrue(data.startswith(CompressedPickleSerializer.marker))
+        self.assertLess(
+            len(data),
+            len(pickle.dumps(self.collection)) / 4,
+        )
+        self.assertEqual(self.serializer.loads(data), self.collection)
+
+    def test_small_values_and_integers_are_stored_as_is(self):
+        self.assertEqual(
+            self.serializer.dumps({"handle": "lace"}),
+            RedisSerializer().dumps({"handle": "lace"}),
+        )
+        self.assertEqual(self.serializer.dumps(41), 41)
+        self.assertEqual(self.serializer.loads(b"41"), 41)
+
+    def test_reads_values_from_the_default_serializer(self):
+        data = RedisSerializer().dumps(self.collection)
+
+        self.assertEqual(self.serializer.loads(data), self.collection)
+
+
+class RedisCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.server = RedisStandIn()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def _cache_settings(self, release):
+        return {
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": self.server.url,
+                "KEY_PREFIX": release,
+                "OPTIONS": {
+                    "serializer": (
+                        "anarchy_and_lace.cache_serializers."
+                        "CompressedPickleSerializer"
+                    ),
+                },
+            },
+        }
+
+    def test_values_round_trip_compressed(self):
+        collection = {
+            "handle": "lace",
+            "products": [f"taisho-silk-haori-{n}" for n in range(100)],
+        }
+
+        with override_settings(CACHES=self._cache_settings("v41")):
+            cache = caches["default"]
+
+            cache.set("shopify:collection:lace", collection, 60)
+            cache.set("hits", 1)
+            cache.incr("hits")
+
+            self.assertEqual(cache.get("shopify:collection:lace"), collection)
+            self.assertEqual(cache.get("hits"), 2)
+            self.assertTrue(cache.add("lock", "token", 5))
+            self.assertFalse(cache.add("lock", "other", 5))
+
+        stored = self.server.data[b"v41:1:shopify:collection:lace"]
+
+        self.assertTrue(stored.startswith(CompressedPickleSerializer.marker))
+
+    def test_releases_do_not_share_keys(self):
+        with override_settings(CACHES=self._cache_settings("v41")):
+            caches["default"].set("shopify:product:haori", "old", 60)
+
+        with override_settings(CACHES=self._cache_settings("v42")):
+            self.assertIsNone(caches["default"].get("shopify:product:haori"))
+
+
+class LifespanTests(SimpleTestCase):
+    async def test_shutdown_closes_the_storefront_client(self):
+        client = shopify_async.get_client()
+
+        events = iter(
+            [
+                {"type": "lifespan.startup"},
+                {"type": "lifespan.shutdown"},
+            ]
+        )
+        sent = []
+
+        async def receive():
+            return next(events)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await application({"type": "lifespan"}, receive, send)
+
+        self.assertTrue(client.is_closed)
+        self.assertEqual(
+            sent,
+            ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+        )
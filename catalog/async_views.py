@@ -0,0 +1,267 @@
+"""
+Async versions of the catalogue views, enabled by ``CATALOG_ASYNC_VIEWS``.
+
+They behave exactly like ``catalog.views`` but await the Storefront API
+through ``catalog.shopify_async``, so under ASGI a worker keeps serving
+other requests while Shopify responds. Templates are rendered off the
+event loop because the auth context processor may hit the database.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from analytics.events import arecord_funnel_event
+from analytics.models import FunnelEvent
+
+from .bag_session import aclear_cart, added_handles, astore_cart
+from .shopify_async import (
+    add_cart_line,
+    create_cart,
+    get_bag_variant,
+    get_cart,
+    remove_cart_line,
+)
+from .sources import async_catalog_source
+from .views import CANONICAL_SITE_URL
+
+
+_render = sync_to_async(render)
+
+
+async def product_detail(request, slug):
+    product = await async_catalog_source().get_product_by_handle(slug)
+
+    if not product:
+        raise Http404("Product not found.")
+
+    await arecord_funnel_event(
+        request,
+        FunnelEvent.VIEW_PRODUCT,
+        product["handle"],
+    )
+
+    product_path = reverse(
+        "catalog:product_detail",
+        kwargs={
+            "slug": product["handle"],
+        },
+    )
+
+    canonical_url = (
+        f"{CANONICAL_SITE_URL}{product_path}"
+    )
+
+    return await _render(
+        request,
+        "catalog/product_detail.html",
+        {
+            "product": product,
+            "canonical_url": canonical_url,
+            "active_menu_item": "shop",
+        },
+    )
+
+
+async def collection_detail(request, collection_handle):
+    collection = await async_catalog_source().get_collection_by_handle(
+        collection_handle
+    )
+
+    if not collection:
+        raise Http404("Collection not found.")
+
+    return await _render(
+        request,
+        "catalog/collection_detail.html",
+        {
+            "collection": collection,
+            "products": collection["products"]["nodes"],
+            "active_menu_item": "shop",
+        },
+    )
+
+
+async def add_to_bag(request, slug):
+    if request.method != "POST":
+        return redirect(
+            "catalog:product_detail",
+            slug=slug,
+        )
+
+    try:
+        variant = await get_bag_variant(
+            slug,
+            variant_id=request.POST.get("variant_id"),
+        )
+    except RuntimeError:
+        variant = None
+
+    if not variant or not variant.get(
+        "availableForSale"
+    ):
+        messages.error(
+            request,
+            "This piece is no longer available.",
+        )
+
+        return redirect(
+            "catalog:product_detail",
+            slug=slug,
+        )
+
+    variant_id = variant["id"]
+
+    cart_id = await request.session.aget(
+        "shopify_cart_id"
+    )
+
+    try:
+        if cart_id:
+            cart = await add_cart_line(
+                cart_id,
+                variant_id,
+                quantity=1,
+            )
+
+        else:
+            cart = await create_cart(
+                variant_id,
+                quantity=1,
+            )
+
+        await astore_cart(
+            request.session,
+            cart,
+            added_handles(
+                await request.session.aget("shopify_cart_handles"),
+                slug,
+            ),
+        )
+
+        await arecord_funnel_event(
+            request,
+            FunnelEvent.ADD_TO_BAG,
+            slug,
+        )
+
+        messages.success(
+            request,
+            f"{variant['title']} added to your bag.",
+        )
+
+    except RuntimeError:
+        messages.error(
+            request,
+            (
+                "We couldn't add that piece to your bag. "
+                "Please try again."
+            ),
+        )
+
+    return redirect(
+        "catalog:product_detail",
+        slug=slug,
+    )
+
+
+async def bag(request):
+    cart_id = await request.session.aget(
+        "shopify_cart_id"
+    )
+
+    if not cart_id:
+        return await _render(
+            request,
+            "catalog/bag.html",
+            {
+                "cart": None,
+                "active_menu_item": "shop",
+            },
+        )
+
+    try:
+        cart = await get_cart(cart_id)
+
+    except RuntimeError:
+        cart = None
+
+    if not cart:
+        await aclear_cart(request.session)
+
+    else:
+        await astore_cart(request.session, cart)
+
+    return await _render(
+        request,
+        "catalog/bag.html",
+        {
+            "cart": cart,
+            "active_menu_item": "shop",
+        },
+    )
+
+
+async def remove_from_bag(request, line_id):
+    if request.method != "POST":
+        return redirect("catalog:bag")
+
+    cart_id = await request.session.aget(
+        "shopify_cart_id"
+    )
+
+    if not cart_id:
+        return redirect("catalog:bag")
+
+    try:
+        cart = await remove_cart_line(
+            cart_id,
+            line_id,
+        )
+
+        await arecord_funnel_event(
+            request,
+            FunnelEvent.REMOVE,
+            request.POST.get("product_handle", ""),
+        )
+
+        if cart["totalQuantity"] == 0:
+            await aclear_cart(request.session)
+
+        else:
+            await astore_cart(request.session, cart)
+
+    except RuntimeError:
+        messages.error(
+            request,
+            "We couldn't remove that piece from your bag.",
+        )
+
+    return redirect("catalog:bag")
+
+
+async def checkout(request):
+    checkout_url = await request.session.aget(
+        "shopify_checkout_url"
+    )
+
+    if not checkout_url:
+        messages.info(
+            request,
+            "Your bag is empty.",
+        )
+
+        return redirect("catalog:shop")
+
+    handles = await request.session.aget("shopify_cart_handles")
+
+    for handle in handles or [""]:
+        await arecord_funnel_event(
+            request,
+            FunnelEvent.CHECKOUT_REDIRECT,
+            handle,
+        )
+
+    return redirect(checkout_url)
@@ -0,0 +1,82 @@
+"""
+The Shopify cart as remembered in the Django session.
+
+``catalog.views`` and ``catalog.async_views`` both keep the cart id,
+checkout URL, bag quantity and product handles in the session; these
+helpers do it in one place, with ``a``-prefixed versions for the
+async session API.
+"""
+
+
+CART_SESSION_KEYS = (
+    "shopify_cart_id",
+    "shopify_checkout_url",
+    "shopify_cart_quantity",
+    "shopify_cart_handles",
+)
+
+
+def cart_handles(cart):
+    """
+    Return the handles of the products in ``cart``'s lines.
+    """
+
+    return [
+        line["merchandise"]["product"]["handle"]
+        for line in cart["lines"]["nodes"]
+        if line.get("merchandise", {}).get("product")
+    ]
+
+
+def added_handles(handles, slug):
+    """
+    Return ``handles`` with ``slug`` appended if it isn't there yet.
+    """
+
+    handles = handles or []
+
+    return handles if slug in handles else [*handles, slug]
+
+
+def _cart_values(cart, handles):
+    # Handles let checkout attribute the redirect to products
+    # without fetching the cart again.
+    return {
+        "shopify_cart_id": cart["id"],
+        "shopify_checkout_url": cart["checkoutUrl"],
+        "shopify_cart_quantity": cart["totalQuantity"],
+        "shopify_cart_handles": (
+            cart_handles(cart) if handles is None else handles
+        ),
+    }
+
+
+def store_cart(session, cart, handles=None):
+    """
+    Remember ``cart`` in the session.
+
+    ``handles`` defaults to the products in the cart's lines; pass them
+    when the cart was returned without its lines.
+    """
+
+    for key, value in _cart_values(cart, handles).items():
+        session[key] = value
+
+
+async def astore_cart(session, cart, handles=None):
+    for key, value in _cart_values(cart, handles).items():
+        await session.aset(key, value)
+
+
+def clear_cart(session):
+    """
+    Remove all Shopify cart information from the session.
+    """
+
+    for key in CART_SESSION_KEYS:
+        session.pop(key, None)
+
+
+async def aclear_cart(session):
+    for key in CART_SESSION_KEYS:
+        await session.apop(key, None)
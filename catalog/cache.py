@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """
+    Two-tier cache for Shopify catalogue reads.
+
+    The first tier is a small in-process LRU, the second is the shared
+    Django cache. Entries carry a fresh and a stale deadline: fresh
+    entries are returned as-is, stale entries are returned immediately
+    while a single background refresh replaces them.
+
+    The local tier only keeps an entry for ``local_ttl`` seconds, which
+    bounds how long other workers can serve an entry after it has been
+    invalidated in the shared tier.
+
+    The ``a``-prefixed methods are the asyncio equivalents used by
+    ``catalog.shopify_async``; both share the same entries and counters.
+    """
+
+    def __init__(
+        self,
+        alias="default",
+        max_entries=512,
+        local_ttl=30,
+    ):
+        self.alias = alias
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_tasks = set()
+
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        """
+        Return a snapshot of the hit, miss and stale counters.
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+            counters["local_entries"] = len(self._local)
+
+        return counters
+
+    def _local_get(self, key, now):
+        with self._lock:
+            item = self._local.get(key)
+
+            if item is None:
+                return None
+
+            entry, local_expires = item
+
+            if now >= local_expires:
+                del self._local[key]
+                return None
+
+            self._local.move_to_end(key)
+
+            return entry
+
+    def _local_set(self, key, entry, now):
+        local_expires = min(
+            now + self.local_ttl,
+            entry[2],
+        )
+
+        with self._lock:
+            self._local[key] = (entry, local_expires)
+            self._local.move_to_end(key)
+
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get_entry(self, key):
+        """
+        Return the raw ``(value, fresh_until, stale_until)`` entry.
+        """
+
+        now = time.time()
+
+        entry = self._local_get(key, now)
+
+        if entry is None:
+            entry = self.shared.get(key)
+
+            if entry is not None:
+                self._local_set(key, entry, now)
+
+        if entry is not None and now >= entry[2]:
+            return None
+
+        return entry
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        now = time.time()
+
+        entry = (
+            value,
+            now + ttl,
+            now + ttl + stale_ttl,
+        )
+
+        self.shared.set(
+            key,
+            entry,
+            timeout=ttl + stale_ttl,
+        )
+
+        self._local_set(key, entry, now)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+
+        if not keys:
+            return
+
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+        self.shared.delete_many(keys)
+
+    def get_or_fetch(self, key, fetch, ttl, stale_ttl=0):
+        """
+        Return the cached value for ``key``, calling ``fetch`` on a miss.
+
+        ``None`` results are never cached, so a missing product or
+        collection is looked up again on the next request.
+        """
+
+        entry = self.get_entry(key)
+
+        if entry is not None:
+            value, fresh_until, _stale_until = entry
+
+            if time.time() < fresh_until:
+                self._count("hits")
+                return value
+
+            self._count("stale")
+            self._refresh_in_background(key, fetch, ttl, stale_ttl)
+
+            return value
+
+        self._count("misses")
+
+        value = fetch()
+
+        if value is not None:
+            self.set(key, value, ttl, stale_ttl)
+
+        return value
+
+    def _refresh_in_background(self, key, fetch, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+
+            self._refreshing.add(key)
+
+        thread = threading.Thread(
+            target=self._refresh,
+            args=(key, fetch, ttl, stale_ttl),
+            daemon=True,
+        )
+
+        thread.start()
+
+    def _refresh(self, key, fetch, ttl, stale_ttl):
+        try:
+            value = fetch()
+
+            if value is not None:
+                self.set(key, value, ttl, stale_ttl)
+
+            self._count("refreshes")
+
+        except Exception:
+            # The stale entry keeps being served until it expires,
+            # so a Shopify hiccup never reaches the storefront.
+            self._count("refresh_errors")
+            logger.warning(
+                "Background refresh failed for %s",
+                key,
+                exc_info=True,
+            )
+
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def aget_entry(self, key):
+        now = time.time()
+
+        entry = self._local_get(key, now)
+
+        if entry is None:
+            entry = await self.shared.aget(key)
+
+            if entry is not None:
+                self._local_set(key, entry, now)
+
+        if entry is not None and now >= entry[2]:
+            return None
+
+        return entry
+
+    async def aset(self, key, value, ttl, stale_ttl=0):
+        now = time.time()
+
+        entry = (
+            value,
+            now + ttl,
+            now + ttl + stale_ttl,
+        )
+
+        await self.shared.aset(
+            key,
+            entry,
+            timeout=ttl + stale_ttl,
+        )
+
+        self._local_set(key, entry, now)
+
+    async def aget_or_fetch(self, key, fetch, ttl, stale_ttl=0):
+        """
+        Like ``get_or_fetch``, with ``fetch`` a coroutine function.
+
+        Stale entries are refreshed in a task on the running event loop
+        rather than in a thread.
+        """
+
+        entry = await self.aget_entry(key)
+
+        if entry is not None:
+            value, fresh_until, _stale_until = entry
+
+            if time.time() < fresh_until:
+                self._count("hits")
+                return value
+
+            self._count("stale")
+            self._arefresh_in_background(key, fetch, ttl, stale_ttl)
+
+            return value
+
+        self._count("misses")
+
+        value = await fetch()
+
+        if value is not None:
+            await self.aset(key, value, ttl, stale_ttl)
+
+        return value
+
+    def _arefresh_in_background(self, key, fetch, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+
+            self._refreshing.add(key)
+
+        task = asyncio.ensure_future(
+            self._arefresh(key, fetch, ttl, stale_ttl)
+        )
+
+        # The loop only keeps weak references to tasks.
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _arefresh(self, key, fetch, ttl, stale_ttl):
+        try:
+            value = await fetch()
+
+            if value is not None:
+                await self.aset(key, value, ttl, stale_ttl)
+
+            self._count("refreshes")
+
+        except Exception:
+            self._count("refresh_errors")
+            logger.warning(
+                "Background refresh failed for %s",
+                key,
+                exc_info=True,
+            )
+
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,92 @@
+"""
+Cached template fragments for product cards and galleries.
+
+``{% product_fragment %}`` (catalog/templatetags/catalog_fragments.py)
+stores the rendered markup for one product under a key made from the
+fragment name, the product handle and its Shopify ``updatedAt``, so an
+edited product gets new keys and never needs purging. Fragments still
+help on pages the page cache can't serve, e.g. ones showing messages.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def fragment_key(name, product):
+    """
+    Return the cache key for ``product``'s ``name`` fragment, or None if
+    the product can't be cached because it has no ``updatedAt``.
+    """
+
+    handle = product.get("handle")
+    updated_at = product.get("updatedAt")
+
+    if not handle or not updated_at:
+        return None
+
+    # Selling the last unit doesn't touch the product's updatedAt, so
+    # availability is part of the key too.
+    variant = product.get("selectedOrFirstAvailableVariant") or {}
+    available = int(bool(variant.get("availableForSale")))
+
+    return f"fragment:{name}:{handle}:{updated_at}:{available}"
+
+
+def fragment_cache():
+    return caches[settings.FRAGMENT_CACHE_ALIAS]
+
+
+class FragmentMetrics:
+    """
+    Count fragment cache hits and misses and time spent rendering them.
+
+    Hit timings cover the cache read, miss timings the read, the render
+    and the write, so together they show what the cache saves per card.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "uncached": 0,
+        }
+        self._seconds = {
+            "hits": 0.0,
+            "misses": 0.0,
+            "uncached": 0.0,
+        }
+
+    def observe(self, name, started):
+        seconds = time.perf_counter() - started
+
+        with self._lock:
+            self._counters[name] += 1
+            self._seconds[name] += seconds
+
+    def stats(self):
+        """
+        Return a snapshot of this worker's counters, timings and hit ratio.
+        """
+
+        with self._lock:
+            stats = dict(self._counters)
+            seconds = dict(self._seconds)
+
+        for name, total in seconds.items():
+            count = stats[name]
+            stats[f"{name}_avg_ms"] = total / count * 1000 if count else 0.0
+
+        looked_up = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / looked_up if looked_up else 0.0
+
+        return stats
+
+
+fragment_metrics = FragmentMetrics()
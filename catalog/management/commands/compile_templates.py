@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from anarchy_and_lace.template_warmup import STOREFRONT_TEMPLATES, warm_templates
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the storefront templates, as gunicorn does when a "
+        "worker boots, and report how long each one takes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "patterns",
+            nargs="*",
+            default=STOREFRONT_TEMPLATES,
+            help=(
+                "Template name patterns such as 'catalog/*.html'. "
+                "Defaults to the storefront templates."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        timings = warm_templates(options["patterns"])
+
+        if not timings:
+            raise CommandError("No templates match those patterns.")
+
+        failed = []
+
+        for name, seconds, error in timings:
+            if error is None:
+                self.stdout.write(f"{seconds * 1000:8.2f} ms  {name}")
+            else:
+                failed.append(name)
+                self.stdout.write(
+                    self.style.ERROR(f"  failed     {name}: {error}")
+                )
+
+        total = sum(seconds for _, seconds, _ in timings)
+
+        self.stdout.write(
+            f"{total * 1000:8.2f} ms  total for {len(timings)} templates"
+        )
+
+        if failed:
+            raise CommandError(
+                f"{len(failed)} templates failed to compile: "
+                + ", ".join(failed)
+            )
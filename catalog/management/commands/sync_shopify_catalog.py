@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.models import CatalogSyncState
+from catalog.sync import BATCH_SIZE, sync_catalog
+
+
+STATE_NAME = "shopify_catalog"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mirror Shopify products into the local catalogue. "
+        "By default only products updated since the last sync are fetched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help=(
+                "Fetch the whole catalogue and mark products "
+                "missing from Shopify as inactive."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without writing anything.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        state, _ = CatalogSyncState.objects.get_or_create(
+            name=STATE_NAME,
+        )
+
+        full = options["full"] or state.high_water_mark is None
+        dry_run = options["dry_run"]
+
+        if full:
+            self.stdout.write("Running a full catalogue sync.")
+        else:
+            self.stdout.write(
+                f"Syncing products updated since {state.high_water_mark:%Y-%m-%d %H:%M:%S %Z}."
+            )
+
+        report = sync_catalog(
+            since=state.high_water_mark,
+            full=full,
+            dry_run=dry_run,
+            batch_size=options["batch_size"],
+        )
+
+        self._write_diff(report)
+        self._write_timings(report)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: nothing was written."))
+            return
+
+        now = timezone.now()
+
+        state.high_water_mark = report["high_water_mark"]
+        state.last_run_at = now
+
+        if full:
+            state.last_full_run_at = now
+
+        state.save()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synced {report['seen']} products: "
+                f"{len(report['created'])} created, "
+                f"{len(report['updated'])} updated, "
+                f"{report['unchanged']} unchanged, "
+                f"{len(report['deactivated'])} deactivated, "
+                f"{len(report['skipped'])} skipped."
+            )
+        )
+
+    def _write_diff(self, report):
+        for label, prefix in (
+            ("created", "+"),
+            ("updated", "~"),
+            ("deactivated", "-"),
+            ("skipped", "!"),
+        ):
+            for handle in report[label]:
+                self.stdout.write(f"  {prefix} {handle}")
+
+    def _write_timings(self, report):
+        self.stdout.write("Timings:")
+
+        for phase, seconds in report["timings"].items():
+            self.stdout.write(f"  {phase:<11} {seconds:8.3f}s")
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.10 on 2026-10-18 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='shopify_id',
+            field=models.CharField(blank=True, max_length=80, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='description_html',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_alt_text',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_url',
+            field=models.URLField(blank=True, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='shopify_id',
+            field=models.CharField(blank=True, max_length=80, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='shopify_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_url',
+            field=models.URLField(blank=True, max_length=1000),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='products/'),
+        ),
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shopify_id', models.CharField(max_length=80, unique=True)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('sku', models.CharField(blank=True, max_length=255)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('currency_code', models.CharField(default='GBP', max_length=3)),
+                ('available_for_sale', models.BooleanField(default=False)),
+                ('selected_options', models.JSONField(blank=True, default=list)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='catalog.product')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
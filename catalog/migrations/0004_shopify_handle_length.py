@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_catalog_sync_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='collection',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,157 @@
+"""
+Serve catalogue reads from the local Shopify mirror.
+
+These functions mirror the read surface of ``catalog.shopify`` and
+return the same Storefront-shaped dictionaries, so templates render
+identically whichever source is active.
+"""
+
+from .models import Collection, Product
+
+
+def _mirrored_products():
+    return (
+        Product.objects
+        .filter(
+            is_active=True,
+            shopify_id__isnull=False,
+        )
+        .prefetch_related(
+            "variants",
+            "images",
+        )
+    )
+
+
+def _variant_dict(variant):
+    return {
+        "id": variant.shopify_id,
+        "sku": variant.sku,
+        "availableForSale": variant.available_for_sale,
+        "price": {
+            "amount": str(variant.price),
+            "currencyCode": variant.currency_code,
+        },
+        "selectedOptions": variant.selected_options,
+    }
+
+
+def _product_dict(product):
+    variants = list(product.variants.all())
+
+    variant = next(
+        (
+            variant
+            for variant in variants
+            if variant.available_for_sale
+        ),
+        variants[0] if variants else None,
+    )
+
+    featured_image = None
+
+    if product.image_url:
+        featured_image = {
+            "url": product.image_url,
+            "altText": product.image_alt_text,
+        }
+
+    return {
+        "id": product.shopify_id,
+        "title": product.name,
+        "handle": product.slug,
+        "updatedAt": (
+            product.shopify_updated_at.isoformat()
+            if product.shopify_updated_at
+            else None
+        ),
+        "description": product.description,
+        "descriptionHtml": product.description_html,
+        "availableForSale": any(
+            variant.available_for_sale
+            for variant in variants
+        ),
+        "featuredImage": featured_image,
+        "images": {
+            "nodes": [
+                {
+                    "url": image.image_url or image.image.url,
+                    "altText": image.alt_text,
+                }
+                for image in product.images.all()
+            ],
+        },
+        "selectedOrFirstAvailableVariant": (
+            _variant_dict(variant) if variant else None
+        ),
+    }
+
+
+def get_products(fields="card"):
+    """
+    Return mirrored products available in the storefront.
+    """
+
+    if fields == "sitemap":
+        return [
+            {
+                "handle": handle,
+                "updatedAt": (
+                    updated_at.isoformat() if updated_at else None
+                ),
+            }
+            for handle, updated_at in (
+                Product.objects
+                .filter(
+                    is_active=True,
+                    shopify_id__isnull=False,
+                )
+                .values_list("slug", "shopify_updated_at")
+            )
+        ]
+
+    return [
+        _product_dict(product)
+        for product in _mirrored_products()
+    ]
+
+
+def get_product_by_handle(handle, fields="detail"):
+    """
+    Return a single mirrored product using its handle.
+    """
+
+    product = _mirrored_products().filter(slug=handle).first()
+
+    if product is None:
+        return None
+
+    return _product_dict(product)
+
+
+def get_collection_by_handle(handle):
+    """
+    Return a mirrored collection and the products within it.
+    """
+
+    collection = Collection.objects.filter(slug=handle).first()
+
+    if collection is None:
+        return None
+
+    products = _mirrored_products().filter(
+        collections=collection,
+    )
+
+    return {
+        "id": collection.shopify_id,
+        "title": collection.name,
+        "handle": collection.slug,
+        "description": collection.description,
+        "products": {
+            "nodes": [
+                _product_dict(product)
+                for product in products
+            ],
+        },
+    }
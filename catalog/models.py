@@ -4,9 +4,13 @@ from django.utils.text import slugify
 
 class Collection(models.Model):
     name = models.CharField(max_length=80, unique=True)
-    slug = models.SlugField(max_length=90, unique=True, blank=True)
+    # Long enough for any Shopify handle, which can be up to 255 characters.
+    slug = models.SlugField(max_length=255, unique=True, blank=True)
     description = models.TextField(blank=True)
 
+    # Set for collections mirrored from Shopify; the slug is the Shopify handle.
+    shopify_id = models.CharField(max_length=80, unique=True, blank=True, null=True)
+
     class Meta:
         ordering = ["name"]
 
@@ -24,7 +28,8 @@ class Product(models.Model):
     image = models.ImageField(upload_to="products/", blank=True, null=True)
 
     name = models.CharField(max_length=120)
-    slug = models.SlugField(max_length=140, unique=True, blank=True)
+    # Long enough for any Shopify handle, which can be up to 255 characters.
+    slug = models.SlugField(max_length=255, unique=True, blank=True)
 
     description = models.TextField()
     price = models.DecimalField(max_digits=8, decimal_places=2)
@@ -41,6 +46,14 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     collections = models.ManyToManyField(Collection, blank=True, related_name="products")
 
+    # Shopify mirror fields. The slug is the Shopify handle and
+    # shopify_updated_at drives change detection during sync.
+    shopify_id = models.CharField(max_length=80, unique=True, blank=True, null=True)
+    shopify_updated_at = models.DateTimeField(blank=True, null=True)
+    description_html = models.TextField(blank=True)
+    image_url = models.URLField(max_length=1000, blank=True)
+    image_alt_text = models.CharField(max_length=255, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -63,7 +76,8 @@ class ProductImage(models.Model):
     it lets you add multiple images later.
     """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
-    image = models.ImageField(upload_to="products/")
+    image = models.ImageField(upload_to="products/", blank=True)
+    image_url = models.URLField(max_length=1000, blank=True)  # Shopify CDN image
     alt_text = models.CharField(max_length=120, blank=True)
     is_primary = models.BooleanField(default=False)
     sort_order = models.PositiveSmallIntegerField(default=0)
@@ -81,3 +95,40 @@ class ProductImage(models.Model):
                 is_primary=False
             )
         super().save(*args, **kwargs)
+
+
+class ProductVariant(models.Model):
+    """
+    A Shopify variant mirrored for a product.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
+    shopify_id = models.CharField(max_length=80, unique=True)
+    title = models.CharField(max_length=255, blank=True)
+    sku = models.CharField(max_length=255, blank=True)
+    price = models.DecimalField(max_digits=8, decimal_places=2)
+    currency_code = models.CharField(max_length=3, default="GBP")
+    available_for_sale = models.BooleanField(default=False)
+    selected_options = models.JSONField(default=list, blank=True)
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position", "id"]
+
+    def __str__(self) -> str:
+        return f"{self.product.name} - {self.title}"
+
+
+class CatalogSyncState(models.Model):
+    """
+    Bookkeeping for the Shopify catalogue sync.
+
+    ``high_water_mark`` is the latest Shopify ``updatedAt`` applied to the
+    mirror; delta syncs only request products updated since then.
+    """
+    name = models.CharField(max_length=40, unique=True)
+    high_water_mark = models.DateTimeField(blank=True, null=True)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_full_run_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} (up to {self.high_water_mark})"
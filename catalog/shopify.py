@@ -1,41 +1,179 @@
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import TieredCache
 
 
 SHOPIFY_STORE_DOMAIN = os.getenv("SHOPIFY_STORE_DOMAIN")
 SHOPIFY_STOREFRONT_TOKEN = os.getenv("SHOPIFY_STOREFRONT_TOKEN")
 SHOPIFY_API_VERSION = os.getenv("SHOPIFY_API_VERSION", "2026-07")
+SHOPIFY_WEBHOOK_SECRET = os.getenv("SHOPIFY_WEBHOOK_SECRET")
+
+# Full GraphQL endpoint, overriding the one built from the store domain.
+# tools/bench_asgi_load.py uses it to point the site at a local stub.
+SHOPIFY_STOREFRONT_URL = os.getenv("SHOPIFY_STOREFRONT_URL")
+
+# Connection pool and timeout tuning for the Storefront API transport.
+# The connect timeout is kept short so a Shopify outage fails fast,
+# while the read timeout allows for slower GraphQL responses.
+SHOPIFY_POOL_SIZE = int(os.getenv("SHOPIFY_POOL_SIZE", "10"))
+SHOPIFY_CONNECT_TIMEOUT = float(os.getenv("SHOPIFY_CONNECT_TIMEOUT", "3.05"))
+SHOPIFY_READ_TIMEOUT = float(os.getenv("SHOPIFY_READ_TIMEOUT", "10"))
+
+# Products requested per page when walking the catalogue.
+# The Storefront API allows up to 250.
+SHOPIFY_PAGE_SIZE = int(os.getenv("SHOPIFY_PAGE_SIZE", "50"))
+
+# Catalogue read caching. Each query type has its own freshness window;
+# once that passes, entries are still served for SHOPIFY_CACHE_STALE_TTL
+# seconds while a background refresh replaces them. Cart reads and
+# mutations are never cached.
+SHOPIFY_CACHE_TTLS = {
+    "products": int(os.getenv("SHOPIFY_PRODUCTS_CACHE_TTL", "300")),
+    "product": int(os.getenv("SHOPIFY_PRODUCT_CACHE_TTL", "300")),
+    "collection": int(os.getenv("SHOPIFY_COLLECTION_CACHE_TTL", "300")),
+}
+SHOPIFY_CACHE_STALE_TTL = int(os.getenv("SHOPIFY_CACHE_STALE_TTL", "3600"))
+
+# How long add_to_bag trusts the indexed variant availability before
+# re-checking it with a minimal query.
+SHOPIFY_VARIANT_INDEX_TTL = int(os.getenv("SHOPIFY_VARIANT_INDEX_TTL", "120"))
+
+catalog_cache = TieredCache(
+    alias=os.getenv("SHOPIFY_CACHE_ALIAS", "default"),
+    max_entries=int(os.getenv("SHOPIFY_LOCAL_CACHE_ENTRIES", "512")),
+    local_ttl=int(os.getenv("SHOPIFY_LOCAL_CACHE_TTL", "30")),
+)
+
+# Identical concurrent catalogue queries share one upstream request.
+# With SHOPIFY_SHARED_SINGLE_FLIGHT enabled, a lock in the shared cache
+# extends this across gunicorn workers.
+SHOPIFY_SHARED_SINGLE_FLIGHT = os.getenv(
+    "SHOPIFY_SHARED_SINGLE_FLIGHT",
+    "",
+).strip().lower() in {"1", "true", "yes", "on"}
+SHOPIFY_SINGLE_FLIGHT_TIMEOUT = SHOPIFY_CONNECT_TIMEOUT + SHOPIFY_READ_TIMEOUT
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """
+    Create a pooled, keep-alive HTTP session for the Storefront API.
+    """
+
+    session = requests.Session()
+
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=SHOPIFY_POOL_SIZE,
+    )
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers.update(
+        {
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+    )
+
+    return session
+
+
+def get_session():
+    """
+    Return the shared Storefront API session for this worker process.
+
+    The session is rebuilt after a fork so gunicorn workers never
+    share sockets inherited from the master process.
+    """
+
+    global _session, _session_pid
+
+    pid = os.getpid()
+
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+
+    return _session
+
+
+def _storefront_url():
+    if SHOPIFY_STOREFRONT_URL:
+        return SHOPIFY_STOREFRONT_URL
+
+    return (
+        f"https://{SHOPIFY_STORE_DOMAIN}"
+        f"/api/{SHOPIFY_API_VERSION}/graphql.json"
+    )
 
 
-def shopify_query(query, variables=None):
+def shopify_query(query, variables=None, coalesce=False):
     """
     Send a GraphQL request to the Shopify Storefront API.
+
+    Read-only queries may pass ``coalesce=True`` so that concurrent
+    identical requests share a single upstream call. Mutations must
+    never be coalesced.
     """
 
+    if not coalesce:
+        return _send_query(query, variables)
+
+    key = _flight_key(query, variables)
+
+    if SHOPIFY_SHARED_SINGLE_FLIGHT:
+        return _single_flight(
+            key,
+            lambda: _shared_single_flight(key, query, variables),
+        )
+
+    return _single_flight(
+        key,
+        lambda: _send_query(query, variables),
+    )
+
+
+def _send_query(query, variables=None):
     if not SHOPIFY_STORE_DOMAIN or not SHOPIFY_STOREFRONT_TOKEN:
         raise RuntimeError(
             "Shopify environment variables are not configured."
         )
 
-    url = (
-        f"https://{SHOPIFY_STORE_DOMAIN}"
-        f"/api/{SHOPIFY_API_VERSION}/graphql.json"
-    )
-
     headers = {
-        "Content-Type": "application/json",
         "X-Shopify-Storefront-Access-Token": SHOPIFY_STOREFRONT_TOKEN,
     }
 
-    response = requests.post(
-        url,
+    response = get_session().post(
+        _storefront_url(),
         headers=headers,
         json={
             "query": query,
             "variables": variables or {},
         },
-        timeout=10,
+        timeout=(
+            SHOPIFY_CONNECT_TIMEOUT,
+            SHOPIFY_READ_TIMEOUT,
+        ),
     )
 
     response.raise_for_status()
@@ -48,406 +186,1192 @@ def shopify_query(query, variables=None):
     return payload["data"]
 
 
-PRODUCT_FIELDS = """
-    id
-    title
-    handle
-    description
-    descriptionHtml
-    availableForSale
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
-    featuredImage {
-        url
-        altText
-    }
 
-    images(first: 20) {
-        nodes {
-            url
-            altText
-        }
-    }
+_flights = {}
+_flights_lock = threading.Lock()
 
-    selectedOrFirstAvailableVariant {
-        price {
-            amount
-            currencyCode
-        }
 
-        availableForSale
+def _flight_key(query, variables):
+    raw = json.dumps(
+        [query, variables or {}],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
 
-        selectedOptions {
-            name
-            value
-        }
-    }
-"""
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
-def get_products():
-    """
-    Return products available through the Shopify storefront.
+def _single_flight(key, func):
     """
+    Run ``func`` once per key for all threads in this process.
 
-    query = f"""
-    query GetProducts {{
-      products(first: 50) {{
-        nodes {{
-          {PRODUCT_FIELDS}
-        }}
-      }}
-    }}
+    The first caller does the work; callers arriving while it is in
+    flight wait for its result or re-raise its exception.
     """
 
-    data = shopify_query(query)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        if not flight.done.wait(SHOPIFY_SINGLE_FLIGHT_TIMEOUT):
+            raise RuntimeError(
+                "Timed out waiting for a coalesced Shopify request."
+            )
+
+        if flight.error is not None:
+            raise flight.error
 
-    return data["products"]["nodes"]
+        return flight.result
 
+    try:
+        flight.result = func()
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
 
-def get_product_by_handle(handle):
+        flight.done.set()
+
+    return flight.result
+
+
+def _flight_error(exc):
     """
-    Return a single Shopify product using its handle.
+    Describe a leader's exception so followers in other workers can
+    raise it again.
     """
 
-    query = f"""
-    query GetProduct($handle: String!) {{
-      product(handle: $handle) {{
-        {PRODUCT_FIELDS}
-      }}
-    }}
+    return (
+        "error",
+        type(exc).__module__,
+        type(exc).__qualname__,
+        str(exc),
+    )
+
+
+def _raise_flight_error(module, qualname, message):
     """
+    Raise the exception a leader published with ``_flight_error()``.
 
-    data = shopify_query(
-        query,
-        {
-            "handle": handle,
-        },
-    )
+    The leader's exception type is used when its module is already
+    imported here and it can be built from the message alone, as
+    RuntimeError and the requests exceptions can. Anything else,
+    e.g. an httpx error published by an async worker, is raised as
+    RuntimeError, which the views already handle.
+    """
 
-    return data["product"]
+    error_class = sys.modules.get(module)
 
+    for name in qualname.split("."):
+        error_class = getattr(error_class, name, None)
 
-def get_collection_by_handle(handle):
+    error = None
+
+    if isinstance(error_class, type) and issubclass(error_class, Exception):
+        try:
+            error = error_class(message)
+        except TypeError:
+            pass
+
+    raise error or RuntimeError(message)
+
+
+def _shared_single_flight(key, query, variables):
     """
-    Return a Shopify collection and the products within it.
+    Coalesce a query across worker processes via the shared cache.
+
+    The worker that wins ``cache.add`` on the lock key sends the
+    request and publishes the outcome under a token-specific key.
+    Other workers poll for that outcome and fall back to their own
+    request if the leader disappears.
     """
 
-    query = f"""
-    query GetCollection($handle: String!) {{
-      collection(handle: $handle) {{
-        id
-        title
-        handle
-        description
+    shared = catalog_cache.shared
 
-        products(first: 50) {{
-          nodes {{
-            {PRODUCT_FIELDS}
-          }}
-        }}
-      }}
-    }}
-    """
+    lock_key = f"shopify:flight-lock:{key}"
+    lock_timeout = int(SHOPIFY_SINGLE_FLIGHT_TIMEOUT) + 1
 
-    data = shopify_query(
-        query,
-        {
-            "handle": handle,
-        },
+    token = uuid.uuid4().hex
+
+    if shared.add(lock_key, token, timeout=lock_timeout):
+        result_key = f"shopify:flight-result:{token}"
+
+        try:
+            result = _send_query(query, variables)
+        except Exception as exc:
+            shared.set(result_key, _flight_error(exc), timeout=lock_timeout)
+            raise
+        else:
+            shared.set(result_key, ("ok", result), timeout=lock_timeout)
+        finally:
+            # A slow request can outlive the lock, which another
+            # worker may since have taken; leave theirs in place.
+            if shared.get(lock_key) == token:
+                shared.delete(lock_key)
+
+        return result
+
+    leader_token = shared.get(lock_key)
+    deadline = time.monotonic() + SHOPIFY_SINGLE_FLIGHT_TIMEOUT
+
+    while leader_token and time.monotonic() < deadline:
+        result_key = f"shopify:flight-result:{leader_token}"
+
+        leader_finished = shared.get(lock_key) != leader_token
+
+        outcome = shared.get(result_key)
+
+        if outcome is not None:
+            if outcome[0] == "error":
+                _raise_flight_error(*outcome[1:])
+
+            return outcome[1]
+
+        if leader_finished:
+            # The lock was released without a result being
+            # published, so the leader went away mid-request.
+            break
+
+        time.sleep(0.05)
+
+    return _send_query(query, variables)
+
+
+def _cached(kind, key, fetch):
+    return catalog_cache.get_or_fetch(
+        key,
+        fetch,
+        ttl=SHOPIFY_CACHE_TTLS[kind],
+        stale_ttl=SHOPIFY_CACHE_STALE_TTL,
     )
 
-    return data["collection"]
 
+def products_cache_key(fields="card"):
+    return f"shopify:products:{fields}"
 
-def create_cart(variant_id, quantity=1):
+
+def product_cache_key(handle, fields="detail"):
+    return f"shopify:product:{fields}:{handle}"
+
+
+def collection_cache_key(handle):
+    return f"shopify:collection:{handle}"
+
+
+def product_id_index_key(product_id):
+    return f"shopify:product-id:{product_id}"
+
+
+def product_collections_index_key(handle):
+    return f"shopify:product-collections:{handle}"
+
+
+def variant_index_key(handle):
+    return f"shopify:variant:{handle}"
+
+
+def _numeric_id(shopify_id):
     """
-    Create a new Shopify cart containing a product variant.
+    Return the numeric part of a Shopify ID.
+
+    Storefront responses use global IDs such as
+    ``gid://shopify/Product/123`` whereas webhooks send ``123``.
     """
 
-    query = """
-    mutation CartCreate($lines: [CartLineInput!]) {
-      cartCreate(
-        input: {
-          lines: $lines
-        }
-      ) {
-        cart {
-          id
-          checkoutUrl
-          totalQuantity
+    return str(shopify_id).rsplit("/", 1)[-1]
 
-          lines(first: 20) {
-            nodes {
-              id
-              quantity
-
-              merchandise {
-                ... on ProductVariant {
-                  id
-                  title
-
-                  product {
-                    title
-                    handle
-                  }
-
-                  price {
-                    amount
-                    currencyCode
-                  }
-                }
-              }
-            }
-          }
-        }
 
-        userErrors {
-          field
-          message
-        }
-      }
-    }
+def _index_products(products, collection_handle=None):
     """
+    Record which cache entries a product appears in.
 
-    data = shopify_query(
-        query,
+    The webhook view uses these indexes to evict only the entries
+    affected by a product change instead of flushing the cache.
+    """
+
+    shared = catalog_cache.shared
+
+    shared.set_many(
         {
-            "lines": [
-                {
-                    "merchandiseId": variant_id,
-                    "quantity": quantity,
-                }
-            ]
+            product_id_index_key(_numeric_id(product["id"])): product["handle"]
+            for product in products
+            if product.get("id") and product.get("handle")
         },
+        timeout=None,
     )
 
-    result = data["cartCreate"]
+    _index_variants(products)
 
-    if result["userErrors"]:
-        raise RuntimeError(result["userErrors"])
+    if not collection_handle:
+        return
 
-    return result["cart"]
+    keys = [
+        product_collections_index_key(product["handle"])
+        for product in products
+        if product.get("handle")
+    ]
 
+    existing = shared.get_many(keys)
 
-def add_cart_line(cart_id, variant_id, quantity=1):
+    updates = {}
+
+    for key in keys:
+        handles = set(existing.get(key, ()))
+
+        if collection_handle not in handles:
+            handles.add(collection_handle)
+            updates[key] = sorted(handles)
+
+    if updates:
+        shared.set_many(updates, timeout=None)
+
+
+def _index_variants(products):
     """
-    Add another product variant to an existing Shopify cart.
+    Record the add-to-bag variant for each product.
     """
 
-    query = """
-    mutation CartLinesAdd(
-      $cartId: ID!,
-      $lines: [CartLineInput!]!
-    ) {
-      cartLinesAdd(
-        cartId: $cartId,
-        lines: $lines
-      ) {
-        cart {
-          id
-          checkoutUrl
-          totalQuantity
+    indexed_at = time.time()
 
-          lines(first: 20) {
-            nodes {
-              id
-              quantity
-
-              merchandise {
-                ... on ProductVariant {
-                  id
-                  title
-
-                  product {
-                    title
-                    handle
-                  }
-
-                  price {
-                    amount
-                    currencyCode
-                  }
-                }
-              }
-            }
-          }
-        }
+    entries = {}
+
+    for product in products:
+        variant = product.get("selectedOrFirstAvailableVariant")
+
+        if not variant or not variant.get("id") or not product.get("handle"):
+            continue
 
-        userErrors {
-          field
-          message
+        entries[variant_index_key(product["handle"])] = {
+            "id": variant["id"],
+            "title": product.get("title", ""),
+            "availableForSale": bool(variant.get("availableForSale")),
+            "indexed_at": indexed_at,
         }
-      }
-    }
+
+    if entries:
+        catalog_cache.shared.set_many(
+            entries,
+            timeout=SHOPIFY_CACHE_STALE_TTL,
+        )
+
+
+def get_variant_availability(handle):
+    """
+    Return the add-to-bag variant for a product straight from Shopify.
+
+    This bypasses the catalogue cache and only requests the variant id
+    and availability, refreshing the variant index on the way.
     """
 
     data = shopify_query(
-        query,
+        _variant_query(),
         {
-            "cartId": cart_id,
-            "lines": [
-                {
-                    "merchandiseId": variant_id,
-                    "quantity": quantity,
-                }
-            ],
+            "handle": handle,
         },
+        coalesce=True,
     )
 
-    result = data["cartLinesAdd"]
+    product = data["product"]
 
-    if result["userErrors"]:
-        raise RuntimeError(result["userErrors"])
+    if not product:
+        catalog_cache.shared.delete(variant_index_key(handle))
+        return None
 
-    return result["cart"]
+    _index_variants([product])
 
+    return _bag_variant(product)
 
-def get_cart(cart_id):
-    """
-    Return the current Shopify cart, including line items and totals.
-    """
 
-    query = """
-    query GetCart($cartId: ID!) {
-      cart(id: $cartId) {
-        id
-        checkoutUrl
-        totalQuantity
+def _bag_variant(product):
+    variant = product.get("selectedOrFirstAvailableVariant")
 
-        cost {
-          subtotalAmount {
-            amount
-            currencyCode
-          }
+    if not variant:
+        return None
 
-          totalAmount {
-            amount
-            currencyCode
-          }
-        }
+    return {
+        "id": variant["id"],
+        "title": product["title"],
+        "availableForSale": bool(variant.get("availableForSale")),
+    }
 
-        lines(first: 50) {
-          nodes {
-            id
-            quantity
 
-            merchandise {
-              ... on ProductVariant {
-                id
-                title
+def _fresh_variant_entry(entry, variant_id):
+    return bool(
+        entry
+        and (not variant_id or entry["id"] == variant_id)
+        and time.time() - entry["indexed_at"] < SHOPIFY_VARIANT_INDEX_TTL
+    )
 
-                price {
-                  amount
-                  currencyCode
-                }
 
-                product {
-                  title
-                  handle
+def get_bag_variant(handle, variant_id=None):
+    """
+    Return the variant to add to the bag for a product.
 
-                  featuredImage {
-                    url
-                    altText
-                  }
-                }
-              }
-            }
-          }
-        }
-      }
-    }
+    A recently indexed variant matching ``variant_id`` is returned
+    without contacting Shopify. Anything else falls back to
+    ``get_variant_availability``.
     """
 
-    data = shopify_query(
-        query,
-        {
-            "cartId": cart_id,
-        },
-    )
+    entry = catalog_cache.shared.get(variant_index_key(handle))
 
-    return data["cart"]
+    if _fresh_variant_entry(entry, variant_id):
+        return entry
 
+    return get_variant_availability(handle)
 
-def remove_cart_line(cart_id, line_id):
+
+def product_handles(product_id=None, handle=None):
     """
-    Remove a line item from an existing Shopify cart.
+    Return the handles a product may be cached under.
+
+    Either the numeric Shopify product ID or the handle may be given;
+    deletion webhooks only carry the ID, so the handle is recovered
+    from the index written when the product was cached.
     """
 
-    query = """
-    mutation CartLinesRemove(
-      $cartId: ID!,
-      $lineIds: [ID!]!
-    ) {
-      cartLinesRemove(
-        cartId: $cartId,
-        lineIds: $lineIds
-      ) {
-        cart {
-          id
-          checkoutUrl
-          totalQuantity
+    handles = set()
 
-          cost {
-            subtotalAmount {
-              amount
-              currencyCode
-            }
+    if handle:
+        handles.add(handle)
 
-            totalAmount {
-              amount
-              currencyCode
-            }
-          }
+    if product_id is not None:
+        indexed_handle = catalog_cache.shared.get(
+            product_id_index_key(_numeric_id(product_id))
+        )
 
-          lines(first: 50) {
-            nodes {
-              id
-              quantity
-
-              merchandise {
-                ... on ProductVariant {
-                  id
-                  title
-
-                  price {
-                    amount
-                    currencyCode
-                  }
-
-                  product {
-                    title
-                    handle
-
-                    featuredImage {
-                      url
-                      altText
-                    }
-                  }
-                }
-              }
-            }
-          }
-        }
+        if indexed_handle:
+            handles.add(indexed_handle)
 
-        userErrors {
-          field
-          message
-        }
-      }
-    }
+    return handles
+
+
+def product_collection_handles(handles):
+    """
+    Return the handles of the cached collections containing any of
+    the products in ``handles``.
     """
 
-    data = shopify_query(
-        query,
-        {
-            "cartId": cart_id,
-            "lineIds": [line_id],
-        },
+    memberships = catalog_cache.shared.get_many(
+        [
+            product_collections_index_key(product_handle)
+            for product_handle in handles
+        ]
+    )
+
+    return {
+        collection_handle
+        for collection_handles in memberships.values()
+        for collection_handle in collection_handles
+    }
+
+
+def invalidate_product(product_id=None, handle=None):
+    """
+    Evict every cached catalogue read that contains a product.
+
+    The product is found as for ``product_handles()``.
+    """
+
+    handles = product_handles(product_id, handle)
+
+    keys = {
+        products_cache_key(fields)
+        for fields in PRODUCT_FRAGMENTS
+    }
+
+    for product_handle in handles:
+        keys.update(
+            product_cache_key(product_handle, fields)
+            for fields in PRODUCT_FRAGMENTS
+        )
+
+        keys.add(variant_index_key(product_handle))
+
+    keys.update(
+        collection_cache_key(collection_handle)
+        for collection_handle in product_collection_handles(handles)
+    )
+
+    catalog_cache.delete_many(keys)
+
+    return keys
+
+
+def invalidate_collection(handle):
+    """
+    Evict the cached read for a single collection.
+    """
+
+    if not handle:
+        return set()
+
+    keys = {collection_cache_key(handle)}
+
+    catalog_cache.delete_many(keys)
+
+    return keys
+
+
+def cache_stats():
+    """
+    Return hit, miss and stale counters for catalogue read caching.
+    """
+
+    return catalog_cache.stats()
+
+
+# Each page type requests only the product fields it renders.
+# Queries splice in ``...<FragmentName>`` and append the fragment text.
+PRODUCT_FRAGMENTS = {
+    # Grid views: product_list, collection_detail and the home page.
+    "card": """
+    fragment ProductCard on Product {
+      id
+      title
+      handle
+      updatedAt
+      availableForSale
+
+      featuredImage {
+        url
+        altText
+      }
+
+      selectedOrFirstAvailableVariant {
+        id
+        availableForSale
+
+        price {
+          amount
+          currencyCode
+        }
+
+        selectedOptions {
+          name
+          value
+        }
+      }
+    }
+    """,
+
+    # Full product page.
+    "detail": """
+    fragment ProductDetail on Product {
+      id
+      title
+      handle
+      updatedAt
+      description
+      descriptionHtml
+      availableForSale
+
+      featuredImage {
+        url
+        altText
+      }
+
+      images(first: 20) {
+        nodes {
+          url
+          altText
+        }
+      }
+
+      selectedOrFirstAvailableVariant {
+        id
+        sku
+        availableForSale
+
+        price {
+          amount
+          currencyCode
+        }
+
+        selectedOptions {
+          name
+          value
+        }
+      }
+    }
+    """,
+
+    # ProductSitemap only needs a URL and a last-modified date.
+    "sitemap": """
+    fragment ProductSitemap on Product {
+      id
+      handle
+      updatedAt
+    }
+    """,
+
+    # Everything the local catalogue mirror stores (see catalog.sync).
+    "mirror": """
+    fragment ProductMirror on Product {
+      id
+      title
+      handle
+      updatedAt
+      description
+      descriptionHtml
+
+      featuredImage {
+        url
+        altText
+      }
+
+      images(first: 20) {
+        nodes {
+          url
+          altText
+        }
+      }
+
+      variants(first: 100) {
+        nodes {
+          id
+          title
+          sku
+          availableForSale
+
+          price {
+            amount
+            currencyCode
+          }
+
+          selectedOptions {
+            name
+            value
+          }
+        }
+      }
+
+      collections(first: 50) {
+        nodes {
+          id
+          title
+          handle
+          description
+        }
+      }
+    }
+    """,
+
+    # Enough to add a product to the bag.
+    "bag": """
+    fragment ProductBag on Product {
+      id
+      title
+      handle
+
+      selectedOrFirstAvailableVariant {
+        id
+        availableForSale
+      }
+    }
+    """,
+}
+
+
+def _fragment(fields):
+    """
+    Return the ``(spread, definition)`` pair for a named field set.
+    """
+
+    definition = PRODUCT_FRAGMENTS[fields]
+    name = definition.split()[1]
+
+    return f"...{name}", definition
+
+
+def _products_query(fields, sort_key=None):
+    spread, fragment = _fragment(fields)
+
+    # Without a sort key Shopify returns products in its default order,
+    # which the storefront pages rely on.
+    sort = f",\n        sortKey: {sort_key}" if sort_key else ""
+
+    return f"""
+    query GetProducts(
+      $first: Int!,
+      $after: String,
+      $query: String
+    ) {{
+      products(
+        first: $first,
+        after: $after,
+        query: $query{sort}
+      ) {{
+        nodes {{
+          {spread}
+        }}
+
+        pageInfo {{
+          hasNextPage
+          endCursor
+        }}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _product_query(fields):
+    spread, fragment = _fragment(fields)
+
+    return f"""
+    query GetProduct($handle: String!) {{
+      product(handle: $handle) {{
+        {spread}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _variant_query():
+    spread, fragment = _fragment("bag")
+
+    return f"""
+    query GetProductVariant($handle: String!) {{
+      product(handle: $handle) {{
+        {spread}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _collection_query():
+    spread, fragment = _fragment("card")
+
+    return f"""
+    query GetCollection(
+      $handle: String!,
+      $first: Int!,
+      $after: String
+    ) {{
+      collection(handle: $handle) {{
+        id
+        title
+        handle
+        description
+
+        products(first: $first, after: $after) {{
+          nodes {{
+            {spread}
+          }}
+
+          pageInfo {{
+            hasNextPage
+            endCursor
+          }}
+        }}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+COLLECTION_QUERY = _collection_query()
+
+
+def _iter_pages(fetch_page, after=None):
+    """
+    Yield nodes from a paginated GraphQL connection.
+
+    ``fetch_page(cursor)`` returns a connection with ``nodes`` and
+    ``pageInfo``. The next page is requested in the background while
+    the caller consumes the current one, so at most two pages are held
+    in memory at a time.
+    """
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fetch_page, after)
+
+        while future is not None:
+            connection = future.result()
+            page_info = connection["pageInfo"]
+
+            future = None
+
+            if page_info["hasNextPage"]:
+                future = executor.submit(
+                    fetch_page,
+                    page_info["endCursor"],
+                )
+
+            yield from connection["nodes"]
+
+
+def iter_products(
+    page_size=None,
+    after=None,
+    fields="card",
+    search=None,
+    sort_key=None,
+):
+    """
+    Stream every storefront product, one page at a time.
+
+    ``search`` is passed through as the Storefront ``query`` filter,
+    e.g. ``updated_at:>='2026-01-01T00:00:00Z'``, and ``sort_key`` as
+    the ``sortKey`` argument, e.g. ``UPDATED_AT``.
+    """
+
+    query = _products_query(fields, sort_key)
+
+    def fetch_page(cursor):
+        data = shopify_query(
+            query,
+            {
+                "first": page_size or SHOPIFY_PAGE_SIZE,
+                "after": cursor,
+                "query": search,
+            },
+            coalesce=True,
+        )
+
+        return data["products"]
+
+    return _iter_pages(fetch_page, after)
+
+
+def get_products(fields="card"):
+    """
+    Return products available through the Shopify storefront.
+    """
+
+    def fetch():
+        products = list(iter_products(fields=fields))
+
+        _index_products(products)
+
+        return products
+
+    return _cached(
+        "products",
+        products_cache_key(fields),
+        fetch,
+    )
+
+
+def get_product_by_handle(handle, fields="detail"):
+    """
+    Return a single Shopify product using its handle.
+    """
+
+    query = _product_query(fields)
+
+    def fetch():
+        data = shopify_query(
+            query,
+            {
+                "handle": handle,
+            },
+            coalesce=True,
+        )
+
+        product = data["product"]
+
+        if product:
+            _index_products([product])
+
+        return product
+
+    return _cached(
+        "product",
+        product_cache_key(handle, fields),
+        fetch,
     )
 
-    result = data["cartLinesRemove"]
 
+def _collection_page(handle, first, after=None):
+    data = shopify_query(
+        COLLECTION_QUERY,
+        {
+            "handle": handle,
+            "first": first,
+            "after": after,
+        },
+        coalesce=True,
+    )
+
+    return data["collection"]
+
+
+def iter_collection_products(handle, page_size=None, after=None):
+    """
+    Stream every product in a collection, one page at a time.
+    """
+
+    def fetch_page(cursor):
+        collection = _collection_page(
+            handle,
+            page_size or SHOPIFY_PAGE_SIZE,
+            cursor,
+        )
+
+        if not collection:
+            return {
+                "nodes": [],
+                "pageInfo": {
+                    "hasNextPage": False,
+                    "endCursor": None,
+                },
+            }
+
+        return collection["products"]
+
+    return _iter_pages(fetch_page, after)
+
+
+def get_collection_by_handle(handle):
+    """
+    Return a Shopify collection and the products within it.
+    """
+
+    def fetch():
+        collection = _collection_page(
+            handle,
+            SHOPIFY_PAGE_SIZE,
+        )
+
+        if not collection:
+            return None
+
+        connection = collection["products"]
+        products = list(connection["nodes"])
+
+        if connection["pageInfo"]["hasNextPage"]:
+            products.extend(
+                iter_collection_products(
+                    handle,
+                    after=connection["pageInfo"]["endCursor"],
+                )
+            )
+
+        collection["products"] = {
+            "nodes": products,
+        }
+
+        _index_products(
+            products,
+            collection_handle=handle,
+        )
+
+        return collection
+
+    return _cached(
+        "collection",
+        collection_cache_key(handle),
+        fetch,
+    )
+
+
+# Cart queries are plain strings so catalog.shopify_async can send
+# exactly the same documents.
+CART_CREATE_MUTATION = """
+mutation CartCreate($lines: [CartLineInput!]) {
+  cartCreate(
+    input: {
+      lines: $lines
+    }
+  ) {
+    cart {
+      id
+      checkoutUrl
+      totalQuantity
+
+      lines(first: 20) {
+        nodes {
+          id
+          quantity
+
+          merchandise {
+            ... on ProductVariant {
+              id
+              title
+
+              product {
+                title
+                handle
+              }
+
+              price {
+                amount
+                currencyCode
+              }
+            }
+          }
+        }
+      }
+    }
+
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+
+CART_LINES_ADD_MUTATION = """
+mutation CartLinesAdd(
+  $cartId: ID!,
+  $lines: [CartLineInput!]!
+) {
+  cartLinesAdd(
+    cartId: $cartId,
+    lines: $lines
+  ) {
+    cart {
+      id
+      checkoutUrl
+      totalQuantity
+
+      lines(first: 20) {
+        nodes {
+          id
+          quantity
+
+          merchandise {
+            ... on ProductVariant {
+              id
+              title
+
+              product {
+                title
+                handle
+              }
+
+              price {
+                amount
+                currencyCode
+              }
+            }
+          }
+        }
+      }
+    }
+
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+
+CART_QUERY = """
+query GetCart($cartId: ID!) {
+  cart(id: $cartId) {
+    id
+    checkoutUrl
+    totalQuantity
+
+    cost {
+      subtotalAmount {
+        amount
+        currencyCode
+      }
+
+      totalAmount {
+        amount
+        currencyCode
+      }
+    }
+
+    lines(first: 50) {
+      nodes {
+        id
+        quantity
+
+        merchandise {
+          ... on ProductVariant {
+            id
+            title
+
+            price {
+              amount
+              currencyCode
+            }
+
+            product {
+              title
+              handle
+
+              featuredImage {
+                url
+                altText
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+CART_LINES_REMOVE_MUTATION = """
+mutation CartLinesRemove(
+  $cartId: ID!,
+  $lineIds: [ID!]!
+) {
+  cartLinesRemove(
+    cartId: $cartId,
+    lineIds: $lineIds
+  ) {
+    cart {
+      id
+      checkoutUrl
+      totalQuantity
+
+      cost {
+        subtotalAmount {
+          amount
+          currencyCode
+        }
+
+        totalAmount {
+          amount
+          currencyCode
+        }
+      }
+
+      lines(first: 50) {
+        nodes {
+          id
+          quantity
+
+          merchandise {
+            ... on ProductVariant {
+              id
+              title
+
+              price {
+                amount
+                currencyCode
+              }
+
+              product {
+                title
+                handle
+
+                featuredImage {
+                  url
+                  altText
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+
+def _cart_result(result):
     if result["userErrors"]:
         raise RuntimeError(result["userErrors"])
 
-    return result["cart"]
\ No newline at end of file
+    return result["cart"]
+
+
+def create_cart(variant_id, quantity=1):
+    """
+    Create a new Shopify cart containing a product variant.
+    """
+
+    data = shopify_query(
+        CART_CREATE_MUTATION,
+        {
+            "lines": [
+                {
+                    "merchandiseId": variant_id,
+                    "quantity": quantity,
+                }
+            ]
+        },
+    )
+
+    return _cart_result(data["cartCreate"])
+
+
+def add_cart_line(cart_id, variant_id, quantity=1):
+    """
+    Add another product variant to an existing Shopify cart.
+    """
+
+    data = shopify_query(
+        CART_LINES_ADD_MUTATION,
+        {
+            "cartId": cart_id,
+            "lines": [
+                {
+                    "merchandiseId": variant_id,
+                    "quantity": quantity,
+                }
+            ],
+        },
+    )
+
+    return _cart_result(data["cartLinesAdd"])
+
+
+def get_cart(cart_id):
+    """
+    Return the current Shopify cart, including line items and totals.
+    """
+
+    data = shopify_query(
+        CART_QUERY,
+        {
+            "cartId": cart_id,
+        },
+    )
+
+    return data["cart"]
+
+
+def remove_cart_line(cart_id, line_id):
+    """
+    Remove a line item from an existing Shopify cart.
+    """
+
+    data = shopify_query(
+        CART_LINES_REMOVE_MUTATION,
+        {
+            "cartId": cart_id,
+            "lineIds": [line_id],
+        },
+    )
+
+    return _cart_result(data["cartLinesRemove"])
\ No newline at end of file
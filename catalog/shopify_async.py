@@ -0,0 +1,575 @@
+"""
+asyncio client for the Shopify Storefront API.
+
+Mirrors the read and cart functions of ``catalog.shopify`` for the
+async catalogue views. Queries, cache keys, the catalogue cache and
+its indexes are shared with the synchronous client, so both kinds of
+view read and invalidate the same entries. Configuration is read from
+``catalog.shopify`` at call time.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+import weakref
+from functools import partial
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from . import shopify
+
+
+# Requests a single event loop keeps open to the Storefront API at once.
+# Unlike the threaded pool this is not bounded by worker threads, so it
+# can be much larger than SHOPIFY_POOL_SIZE.
+SHOPIFY_ASYNC_POOL_SIZE = int(os.getenv("SHOPIFY_ASYNC_POOL_SIZE", "100"))
+
+
+# Clients and in-flight requests belong to the event loop that created
+# them. uvicorn runs one loop per worker process, created after the fork,
+# so nothing is shared with the master process either.
+_clients = weakref.WeakKeyDictionary()
+_flights = weakref.WeakKeyDictionary()
+
+
+def _build_client():
+    """
+    Create a pooled, keep-alive HTTP client for the Storefront API.
+    """
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=SHOPIFY_ASYNC_POOL_SIZE,
+            max_keepalive_connections=SHOPIFY_ASYNC_POOL_SIZE,
+        ),
+        timeout=httpx.Timeout(
+            shopify.SHOPIFY_READ_TIMEOUT,
+            connect=shopify.SHOPIFY_CONNECT_TIMEOUT,
+        ),
+        headers={
+            "Content-Type": "application/json",
+        },
+    )
+
+
+def get_client():
+    """
+    Return the Storefront API client for the running event loop.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    client = _clients.get(loop)
+
+    if client is None:
+        client = _clients[loop] = _build_client()
+
+    return client
+
+
+async def aclose_client():
+    """
+    Close the running event loop's client, if it has one.
+    """
+
+    client = _clients.pop(asyncio.get_running_loop(), None)
+
+    if client is not None:
+        await client.aclose()
+
+
+async def shopify_query(query, variables=None, coalesce=False):
+    """
+    Send a GraphQL request to the Shopify Storefront API.
+
+    As with ``catalog.shopify.shopify_query``, read-only queries may
+    pass ``coalesce=True`` so concurrent identical requests share one
+    upstream call. Mutations must never be coalesced.
+    """
+
+    if not coalesce:
+        return await _send_query(query, variables)
+
+    key = shopify._flight_key(query, variables)
+
+    if shopify.SHOPIFY_SHARED_SINGLE_FLIGHT:
+        return await _single_flight(
+            key,
+            lambda: _shared_single_flight(key, query, variables),
+        )
+
+    return await _single_flight(
+        key,
+        lambda: _send_query(query, variables),
+    )
+
+
+async def _send_query(query, variables=None):
+    if not shopify.SHOPIFY_STORE_DOMAIN or not shopify.SHOPIFY_STOREFRONT_TOKEN:
+        raise RuntimeError(
+            "Shopify environment variables are not configured."
+        )
+
+    response = await get_client().post(
+        shopify._storefront_url(),
+        headers={
+            "X-Shopify-Storefront-Access-Token": (
+                shopify.SHOPIFY_STOREFRONT_TOKEN
+            ),
+        },
+        json={
+            "query": query,
+            "variables": variables or {},
+        },
+    )
+
+    response.raise_for_status()
+
+    payload = response.json()
+
+    if payload.get("errors"):
+        raise RuntimeError(payload["errors"])
+
+    return payload["data"]
+
+
+def _flight_done(flights, key, task):
+    if flights.get(key) is task:
+        del flights[key]
+
+    # Mark the outcome as retrieved even if every waiter gave up,
+    # so asyncio doesn't log it as never retrieved.
+    if not task.cancelled():
+        task.exception()
+
+
+async def _single_flight(key, func):
+    """
+    Await ``func()`` once per key for all tasks on this event loop.
+
+    The first caller starts the request as its own task; everyone,
+    the first caller included, waits on a shielded reference to it, so
+    one client disconnecting doesn't cancel the request for the rest.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    flights = _flights.get(loop)
+
+    if flights is None:
+        flights = _flights[loop] = {}
+
+    task = flights.get(key)
+
+    if task is None:
+        task = asyncio.ensure_future(func())
+        flights[key] = task
+        task.add_done_callback(partial(_flight_done, flights, key))
+
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(task),
+            shopify.SHOPIFY_SINGLE_FLIGHT_TIMEOUT,
+        )
+    except TimeoutError:
+        raise RuntimeError(
+            "Timed out waiting for a coalesced Shopify request."
+        ) from None
+
+
+async def _shared_single_flight(key, query, variables):
+    """
+    Coalesce a query across worker processes via the shared cache.
+
+    The same protocol as ``catalog.shopify._shared_single_flight``,
+    so sync and async workers coalesce with each other.
+    """
+
+    shared = shopify.catalog_cache.shared
+
+    lock_key = f"shopify:flight-lock:{key}"
+    lock_timeout = int(shopify.SHOPIFY_SINGLE_FLIGHT_TIMEOUT) + 1
+
+    token = uuid.uuid4().hex
+
+    if await shared.aadd(lock_key, token, timeout=lock_timeout):
+        result_key = f"shopify:flight-result:{token}"
+
+        try:
+            result = await _send_query(query, variables)
+        except Exception as exc:
+            await shared.aset(
+                result_key,
+                shopify._flight_error(exc),
+                timeout=lock_timeout,
+            )
+            raise
+        else:
+            await shared.aset(
+                result_key,
+                ("ok", result),
+                timeout=lock_timeout,
+            )
+        finally:
+            if await shared.aget(lock_key) == token:
+                await shared.adelete(lock_key)
+
+        return result
+
+    leader_token = await shared.aget(lock_key)
+    deadline = time.monotonic() + shopify.SHOPIFY_SINGLE_FLIGHT_TIMEOUT
+
+    while leader_token and time.monotonic() < deadline:
+        result_key = f"shopify:flight-result:{leader_token}"
+
+        leader_finished = await shared.aget(lock_key) != leader_token
+
+        outcome = await shared.aget(result_key)
+
+        if outcome is not None:
+            if outcome[0] == "error":
+                shopify._raise_flight_error(*outcome[1:])
+
+            return outcome[1]
+
+        if leader_finished:
+            break
+
+        await asyncio.sleep(0.05)
+
+    return await _send_query(query, variables)
+
+
+async def _cached(kind, key, fetch):
+    return await shopify.catalog_cache.aget_or_fetch(
+        key,
+        fetch,
+        ttl=shopify.SHOPIFY_CACHE_TTLS[kind],
+        stale_ttl=shopify.SHOPIFY_CACHE_STALE_TTL,
+    )
+
+
+# Index writes go to the shared cache only; they don't need the
+# request's thread.
+_index_products = sync_to_async(
+    shopify._index_products,
+    thread_sensitive=False,
+)
+_index_variants = sync_to_async(
+    shopify._index_variants,
+    thread_sensitive=False,
+)
+
+
+async def _iter_pages(fetch_page, after=None):
+    """
+    Yield nodes from a paginated GraphQL connection.
+
+    The next page is requested while the caller consumes the current
+    one, like ``catalog.shopify._iter_pages`` but without a thread.
+    """
+
+    pending = asyncio.ensure_future(fetch_page(after))
+
+    try:
+        while pending is not None:
+            connection = await pending
+            page_info = connection["pageInfo"]
+
+            pending = None
+
+            if page_info["hasNextPage"]:
+                pending = asyncio.ensure_future(
+                    fetch_page(page_info["endCursor"])
+                )
+
+            for node in connection["nodes"]:
+                yield node
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def iter_products(
+    page_size=None,
+    after=None,
+    fields="card",
+    search=None,
+    sort_key=None,
+):
+    """
+    Stream every storefront product, one page at a time.
+    """
+
+    query = shopify._products_query(fields, sort_key)
+
+    async def fetch_page(cursor):
+        data = await shopify_query(
+            query,
+            {
+                "first": page_size or shopify.SHOPIFY_PAGE_SIZE,
+                "after": cursor,
+                "query": search,
+            },
+            coalesce=True,
+        )
+
+        return data["products"]
+
+    return _iter_pages(fetch_page, after)
+
+
+async def get_products(fields="card"):
+    """
+    Return products available through the Shopify storefront.
+    """
+
+    async def fetch():
+        products = [
+            product
+            async for product in iter_products(fields=fields)
+        ]
+
+        await _index_products(products)
+
+        return products
+
+    return await _cached(
+        "products",
+        shopify.products_cache_key(fields),
+        fetch,
+    )
+
+
+async def get_product_by_handle(handle, fields="detail"):
+    """
+    Return a single Shopify product using its handle.
+    """
+
+    query = shopify._product_query(fields)
+
+    async def fetch():
+        data = await shopify_query(
+            query,
+            {
+                "handle": handle,
+            },
+            coalesce=True,
+        )
+
+        product = data["product"]
+
+        if product:
+            await _index_products([product])
+
+        return product
+
+    return await _cached(
+        "product",
+        shopify.product_cache_key(handle, fields),
+        fetch,
+    )
+
+
+async def get_variant_availability(handle):
+    """
+    Return the add-to-bag variant for a product straight from Shopify.
+    """
+
+    data = await shopify_query(
+        shopify._variant_query(),
+        {
+            "handle": handle,
+        },
+        coalesce=True,
+    )
+
+    product = data["product"]
+
+    if not product:
+        await shopify.catalog_cache.shared.adelete(
+            shopify.variant_index_key(handle)
+        )
+        return None
+
+    await _index_variants([product])
+
+    return shopify._bag_variant(product)
+
+
+async def get_bag_variant(handle, variant_id=None):
+    """
+    Return the variant to add to the bag for a product.
+
+    A recently indexed variant matching ``variant_id`` is returned
+    without contacting Shopify.
+    """
+
+    entry = await shopify.catalog_cache.shared.aget(
+        shopify.variant_index_key(handle)
+    )
+
+    if shopify._fresh_variant_entry(entry, variant_id):
+        return entry
+
+    return await get_variant_availability(handle)
+
+
+async def _collection_page(handle, first, after=None):
+    data = await shopify_query(
+        shopify.COLLECTION_QUERY,
+        {
+            "handle": handle,
+            "first": first,
+            "after": after,
+        },
+        coalesce=True,
+    )
+
+    return data["collection"]
+
+
+def iter_collection_products(handle, page_size=None, after=None):
+    """
+    Stream every product in a collection, one page at a time.
+    """
+
+    async def fetch_page(cursor):
+        collection = await _collection_page(
+            handle,
+            page_size or shopify.SHOPIFY_PAGE_SIZE,
+            cursor,
+        )
+
+        if not collection:
+            return {
+                "nodes": [],
+                "pageInfo": {
+                    "hasNextPage": False,
+                    "endCursor": None,
+                },
+            }
+
+        return collection["products"]
+
+    return _iter_pages(fetch_page, after)
+
+
+async def get_collection_by_handle(handle):
+    """
+    Return a Shopify collection and the products within it.
+    """
+
+    async def fetch():
+        collection = await _collection_page(
+            handle,
+            shopify.SHOPIFY_PAGE_SIZE,
+        )
+
+        if not collection:
+            return None
+
+        connection = collection["products"]
+        products = list(connection["nodes"])
+
+        if connection["pageInfo"]["hasNextPage"]:
+            products.extend(
+                [
+                    product
+                    async for product in iter_collection_products(
+                        handle,
+                        after=connection["pageInfo"]["endCursor"],
+                    )
+                ]
+            )
+
+        collection["products"] = {
+            "nodes": products,
+        }
+
+        await _index_products(
+            products,
+            collection_handle=handle,
+        )
+
+        return collection
+
+    return await _cached(
+        "collection",
+        shopify.collection_cache_key(handle),
+        fetch,
+    )
+
+
+async def create_cart(variant_id, quantity=1):
+    """
+    Create a new Shopify cart containing a product variant.
+    """
+
+    data = await shopify_query(
+        shopify.CART_CREATE_MUTATION,
+        {
+            "lines": [
+                {
+                    "merchandiseId": variant_id,
+                    "quantity": quantity,
+                }
+            ]
+        },
+    )
+
+    return shopify._cart_result(data["cartCreate"])
+
+
+async def add_cart_line(cart_id, variant_id, quantity=1):
+    """
+    Add another product variant to an existing Shopify cart.
+    """
+
+    data = await shopify_query(
+        shopify.CART_LINES_ADD_MUTATION,
+        {
+            "cartId": cart_id,
+            "lines": [
+                {
+                    "merchandiseId": variant_id,
+                    "quantity": quantity,
+                }
+            ],
+        },
+    )
+
+    return shopify._cart_result(data["cartLinesAdd"])
+
+
+async def get_cart(cart_id):
+    """
+    Return the current Shopify cart, including line items and totals.
+    """
+
+    data = await shopify_query(
+        shopify.CART_QUERY,
+        {
+            "cartId": cart_id,
+        },
+    )
+
+    return data["cart"]
+
+
+async def remove_cart_line(cart_id, line_id):
+    """
+    Remove a line item from an existing Shopify cart.
+    """
+
+    data = await shopify_query(
+        shopify.CART_LINES_REMOVE_MUTATION,
+        {
+            "cartId": cart_id,
+            "lineIds": [line_id],
+        },
+    )
+
+    return shopify._cart_result(data["cartLinesRemove"])
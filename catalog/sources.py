@@ -0,0 +1,41 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import mirror, shopify, shopify_async
+
+
+def catalog_source():
+    """
+    Return the module storefront pages read the catalogue from.
+
+    ``CATALOG_SOURCE = "database"`` serves pages from the local mirror
+    kept up to date by ``catalog.sync``; anything else reads Shopify.
+    """
+
+    if settings.CATALOG_SOURCE == "database":
+        return mirror
+
+    return shopify
+
+
+class _AsyncMirror:
+    """
+    The local mirror with its ORM reads moved off the event loop.
+    """
+
+    def __getattr__(self, name):
+        return sync_to_async(getattr(mirror, name))
+
+
+async_mirror = _AsyncMirror()
+
+
+def async_catalog_source():
+    """
+    Return the awaitable equivalent of ``catalog_source()``.
+    """
+
+    if settings.CATALOG_SOURCE == "database":
+        return async_mirror
+
+    return shopify_async
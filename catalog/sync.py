@@ -0,0 +1,426 @@
+import time
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from anarchy_and_lace.page_cache import purge_pages
+
+from .models import Collection, Product, ProductImage, ProductVariant
+from .shopify import _numeric_id, iter_products
+
+
+BATCH_SIZE = 100
+
+PRODUCT_UPDATE_FIELDS = [
+    "slug",
+    "name",
+    "description",
+    "description_html",
+    "price",
+    "sku",
+    "stock_qty",
+    "is_active",
+    "shopify_updated_at",
+    "image_url",
+    "image_alt_text",
+    "updated_at",
+]
+
+VARIANT_UPDATE_FIELDS = [
+    "product",
+    "title",
+    "sku",
+    "price",
+    "currency_code",
+    "available_for_sale",
+    "selected_options",
+    "position",
+]
+
+
+def _batches(nodes, size):
+    batch = []
+
+    for node in nodes:
+        batch.append(node)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _changed(nodes):
+    """
+    Split a batch of Shopify products into changed, unchanged and
+    conflicting products.
+
+    Products are matched on ``shopify_id``. A product is unchanged when
+    the mirror already holds it, active, with the same Shopify
+    ``updatedAt``. It conflicts when its handle is the slug of another
+    product, e.g. one created in the admin, which the sync must not
+    overwrite.
+    """
+
+    rows = Product.objects.filter(
+        Q(shopify_id__in=[node["id"] for node in nodes])
+        | Q(slug__in=[node["handle"] for node in nodes]),
+    ).values_list("shopify_id", "slug", "shopify_updated_at", "is_active")
+
+    known = {}
+    slug_owners = {}
+
+    for shopify_id, slug, updated_at, is_active in rows:
+        slug_owners[slug] = shopify_id
+
+        if shopify_id is not None:
+            known[shopify_id] = (updated_at, is_active)
+
+    changed = []
+    conflicts = []
+
+    for node in nodes:
+        if slug_owners.get(node["handle"], node["id"]) != node["id"]:
+            conflicts.append(node)
+            continue
+
+        if known.get(node["id"]) == (
+            parse_datetime(node["updatedAt"]),
+            True,
+        ):
+            continue
+
+        changed.append(node)
+
+    return changed, known, conflicts
+
+
+def _product_row(node):
+    variants = node["variants"]["nodes"]
+    featured = node.get("featuredImage") or {}
+
+    return Product(
+        slug=node["handle"],
+        name=node["title"][:120],
+        description=node.get("description") or "",
+        description_html=node.get("descriptionHtml") or "",
+        price=Decimal(variants[0]["price"]["amount"]) if variants else Decimal("0"),
+        sku=f"shopify-{_numeric_id(node['id'])}",
+        stock_qty=sum(1 for variant in variants if variant["availableForSale"]),
+        is_active=True,
+        shopify_id=node["id"],
+        shopify_updated_at=parse_datetime(node["updatedAt"]),
+        image_url=featured.get("url") or "",
+        image_alt_text=(featured.get("altText") or "")[:255],
+    )
+
+
+def _collection_rows(nodes):
+    """
+    Return the Shopify collections of ``nodes`` as unsaved Collections.
+
+    Collection names are unique but Shopify titles are not, so a title
+    already used by another collection gets the handle appended.
+    Collections whose handle is the slug of a collection created in the
+    admin are left out.
+    """
+
+    collections = {}
+
+    for node in nodes:
+        for collection in node["collections"]["nodes"]:
+            collections[collection["id"]] = collection
+
+    if not collections:
+        return []
+
+    names = [collection["title"][:80] for collection in collections.values()]
+    handles = [collection["handle"] for collection in collections.values()]
+
+    existing = Collection.objects.filter(
+        Q(name__in=names) | Q(slug__in=handles),
+    ).values_list("shopify_id", "name", "slug")
+
+    name_owners = {name: shopify_id for shopify_id, name, _ in existing}
+    slug_owners = {slug: shopify_id for shopify_id, _, slug in existing}
+
+    rows = []
+    used_names = set()
+
+    for shopify_id, collection in collections.items():
+        handle = collection["handle"]
+
+        if slug_owners.get(handle, shopify_id) != shopify_id:
+            continue
+
+        name = collection["title"][:80]
+
+        if name_owners.get(name, shopify_id) != shopify_id or name in used_names:
+            suffix = f" ({handle})"
+            name = collection["title"][: max(80 - len(suffix), 0)] + suffix
+            name = name[-80:]
+
+        used_names.add(name)
+
+        rows.append(
+            Collection(
+                slug=handle,
+                name=name,
+                description=collection.get("description") or "",
+                shopify_id=shopify_id,
+            )
+        )
+
+    return rows
+
+
+@transaction.atomic
+def _apply(nodes):
+    """
+    Upsert a batch of changed products and everything hanging off them.
+    """
+
+    collections = _collection_rows(nodes)
+
+    if collections:
+        Collection.objects.bulk_create(
+            collections,
+            update_conflicts=True,
+            unique_fields=["shopify_id"],
+            update_fields=["slug", "name", "description"],
+        )
+
+    Product.objects.bulk_create(
+        [_product_row(node) for node in nodes],
+        update_conflicts=True,
+        unique_fields=["shopify_id"],
+        update_fields=PRODUCT_UPDATE_FIELDS,
+    )
+
+    product_ids = dict(
+        Product.objects.filter(
+            shopify_id__in=[node["id"] for node in nodes],
+        ).values_list("shopify_id", "id")
+    )
+
+    collection_ids = dict(
+        Collection.objects.filter(
+            shopify_id__in=[collection.shopify_id for collection in collections],
+        ).values_list("shopify_id", "id")
+    )
+
+    variants = []
+    images = []
+    memberships = []
+
+    for node in nodes:
+        product_id = product_ids[node["id"]]
+
+        for position, variant in enumerate(node["variants"]["nodes"]):
+            variants.append(
+                ProductVariant(
+                    product_id=product_id,
+                    shopify_id=variant["id"],
+                    title=(variant.get("title") or "")[:255],
+                    sku=(variant.get("sku") or "")[:255],
+                    price=Decimal(variant["price"]["amount"]),
+                    currency_code=variant["price"]["currencyCode"],
+                    available_for_sale=variant["availableForSale"],
+                    selected_options=variant.get("selectedOptions") or [],
+                    position=position,
+                )
+            )
+
+        for position, image in enumerate(node["images"]["nodes"]):
+            images.append(
+                ProductImage(
+                    product_id=product_id,
+                    image_url=image["url"],
+                    alt_text=(image.get("altText") or "")[:120],
+                    is_primary=position == 0,
+                    sort_order=position,
+                )
+            )
+
+        for collection in node["collections"]["nodes"]:
+            if collection["id"] not in collection_ids:
+                continue
+
+            memberships.append(
+                Product.collections.through(
+                    product_id=product_id,
+                    collection_id=collection_ids[collection["id"]],
+                )
+            )
+
+    ids = product_ids.values()
+
+    ProductVariant.objects.filter(product_id__in=ids).exclude(
+        shopify_id__in=[variant.shopify_id for variant in variants],
+    ).delete()
+
+    if variants:
+        ProductVariant.objects.bulk_create(
+            variants,
+            update_conflicts=True,
+            unique_fields=["shopify_id"],
+            update_fields=VARIANT_UPDATE_FIELDS,
+        )
+
+    # Only Shopify-hosted images are replaced; anything uploaded
+    # through the admin is left alone.
+    ProductImage.objects.filter(product_id__in=ids, image="").delete()
+    ProductImage.objects.bulk_create(images)
+
+    # Memberships of collections created in the admin are kept.
+    Product.collections.through.objects.filter(
+        product_id__in=ids,
+        collection__shopify_id__isnull=False,
+    ).delete()
+    Product.collections.through.objects.bulk_create(
+        memberships,
+        ignore_conflicts=True,
+    )
+
+
+def _timed(iterable, timings, phase):
+    """
+    Yield from ``iterable``, adding time spent waiting on it to ``phase``.
+    """
+
+    iterator = iter(iterable)
+
+    while True:
+        start = time.perf_counter()
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[phase] += time.perf_counter() - start
+
+        yield item
+
+
+def sync_catalog(
+    since=None,
+    full=False,
+    dry_run=False,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Mirror the Shopify catalogue into the local catalogue tables.
+
+    With ``since``, only products Shopify reports as updated at or after
+    that time are requested. Products whose ``updatedAt`` matches the
+    mirror are skipped either way, so only real changes are written.
+
+    A ``full`` sync also marks mirrored products that Shopify no longer
+    returns as inactive. Products whose handle is already the slug of a
+    product created in the admin are skipped and reported. Returns a
+    report of affected handles, the new high-water mark and the time
+    spent in each phase.
+    """
+
+    report = {
+        "seen": 0,
+        "created": [],
+        "updated": [],
+        "unchanged": 0,
+        "deactivated": [],
+        "skipped": [],
+        "high_water_mark": since,
+        "timings": {
+            "fetch": 0.0,
+            "diff": 0.0,
+            "write": 0.0,
+            "deactivate": 0.0,
+        },
+    }
+
+    timings = report["timings"]
+
+    search = None
+
+    if since and not full:
+        search = f"updated_at:>='{since.astimezone(dt_timezone.utc):%Y-%m-%dT%H:%M:%SZ}'"
+
+    products = _timed(
+        iter_products(
+            page_size=batch_size,
+            fields="mirror",
+            search=search,
+            sort_key="UPDATED_AT",
+        ),
+        timings,
+        "fetch",
+    )
+
+    seen_ids = set()
+
+    for batch in _batches(products, batch_size):
+        start = time.perf_counter()
+
+        changed, known, conflicts = _changed(batch)
+
+        report["seen"] += len(batch)
+        report["unchanged"] += len(batch) - len(changed) - len(conflicts)
+        report["skipped"].extend(node["handle"] for node in conflicts)
+
+        for node in batch:
+            seen_ids.add(node["id"])
+
+            updated_at = parse_datetime(node["updatedAt"])
+
+            if (
+                report["high_water_mark"] is None
+                or updated_at > report["high_water_mark"]
+            ):
+                report["high_water_mark"] = updated_at
+
+        for node in changed:
+            if node["id"] in known:
+                report["updated"].append(node["handle"])
+            else:
+                report["created"].append(node["handle"])
+
+        timings["diff"] += time.perf_counter() - start
+
+        if changed and not dry_run:
+            start = time.perf_counter()
+            _apply(changed)
+            timings["write"] += time.perf_counter() - start
+
+    if full:
+        start = time.perf_counter()
+
+        missing = (
+            Product.objects
+            .filter(
+                is_active=True,
+                shopify_id__isnull=False,
+            )
+            .exclude(shopify_id__in=seen_ids)
+        )
+
+        report["deactivated"] = list(
+            missing.values_list("slug", flat=True)
+        )
+
+        if not dry_run:
+            missing.update(is_active=False)
+
+        timings["deactivate"] += time.perf_counter() - start
+
+    if not dry_run and (
+        report["created"] or report["updated"] or report["deactivated"]
+    ):
+        purge_pages()
+
+    return report
@@ -0,0 +1,86 @@
+import time
+
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from catalog.fragments import fragment_cache, fragment_key, fragment_metrics
+
+
+register = template.Library()
+
+
+class ProductFragmentNode(template.Node):
+    def __init__(self, nodelist, name, product):
+        self.nodelist = nodelist
+        self.name = name
+        self.product = product
+
+    def render(self, context):
+        started = time.perf_counter()
+
+        product = self.product.resolve(context)
+
+        key = None
+
+        if settings.FRAGMENT_CACHE_ENABLED and isinstance(product, dict):
+            key = fragment_key(self.name, product)
+
+        if key is None:
+            content = self.nodelist.render(context)
+            fragment_metrics.observe("uncached", started)
+            return content
+
+        cache = fragment_cache()
+
+        content = cache.get(key)
+
+        if content is not None:
+            fragment_metrics.observe("hits", started)
+            return mark_safe(content)
+
+        content = self.nodelist.render(context)
+        cache.set(key, str(content), settings.FRAGMENT_CACHE_TTL)
+        fragment_metrics.observe("misses", started)
+
+        return content
+
+
+@register.tag
+def product_fragment(parser, token):
+    """
+    Cache the enclosed markup for one product until it changes in Shopify.
+
+    Usage::
+
+        {% load catalog_fragments %}
+        {% product_fragment "collection-card" product %}
+          ...
+        {% endproduct_fragment %}
+
+    The name must be unique per block of markup. The enclosed template
+    may only depend on the product, never on the request or visitor.
+    """
+
+    bits = token.split_contents()
+
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' takes a fragment name and a product."
+        )
+
+    name = bits[1]
+
+    if not (name[0] == name[-1] and name[0] in "'\""):
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' fragment name must be a quoted string."
+        )
+
+    nodelist = parser.parse(("endproduct_fragment",))
+    parser.delete_first_token()
+
+    return ProductFragmentNode(
+        nodelist,
+        name[1:-1],
+        parser.compile_filter(bits[2]),
+    )
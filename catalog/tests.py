@@ -1,3 +1,1480 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import io
+import json
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from anarchy_and_lace import page_cache
+
+from . import async_views, mirror, shopify, shopify_async
+from .cache import TieredCache
+from .fragments import fragment_metrics
+from .models import CatalogSyncState, Collection, Product
+from .sync import sync_catalog
+
+
+WEBHOOK_SECRET = "test-webhook-secret"
+
+# Rendering pages needs static URLs without a collectstatic manifest.
+TEST_STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.InMemoryStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+
+# Payloads recorded from Shopify webhook deliveries, trimmed to the
+# fields the storefront reads.
+PRODUCTS_UPDATE_PAYLOAD = {
+    "id": 8123456789012,
+    "title": "Taisho Silk Haori",
+    "handle": "taisho-silk-haori",
+    "status": "active",
+    "updated_at": "2026-10-12T14:21:09+01:00",
+    "variants": [
+        {
+            "id": 44123456789012,
+            "product_id": 8123456789012,
+            "price": "185.00",
+        }
+    ],
+}
+
+PRODUCTS_DELETE_PAYLOAD = {
+    "id": 8123456789012,
+}
+
+COLLECTIONS_UPDATE_PAYLOAD = {
+    "id": 612345678901,
+    "handle": "lace",
+    "title": "Lace",
+    "updated_at": "2026-10-12T14:25:44+01:00",
+}
+
+
+def _product(handle, product_id):
+    return {
+        "id": f"gid://shopify/Product/{product_id}",
+        "handle": handle,
+        "title": handle.replace("-", " ").title(),
+    }
+
+
+def _page(nodes, end_cursor=None):
+    return {
+        "nodes": nodes,
+        "pageInfo": {
+            "hasNextPage": end_cursor is not None,
+            "endCursor": end_cursor,
+        },
+    }
+
+
+class ShopifyWebhookTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        shopify.catalog_cache._local.clear()
+
+        self.haori = _product("taisho-silk-haori", 8123456789012)
+        self.jacket = _product("lace-trim-jacket", 8123456789013)
+
+        responses = {
+            "GetProducts": {
+                "products": _page([self.haori, self.jacket]),
+            },
+        }
+
+        products = {
+            "taisho-silk-haori": self.haori,
+            "lace-trim-jacket": self.jacket,
+        }
+
+        collections = {
+            "lace": [self.haori],
+            "anarchy": [self.jacket],
+        }
+
+        def fake_query(query, variables=None, coalesce=False):
+            if "query GetProduct(" in query:
+                return {
+                    "product": products[variables["handle"]],
+                }
+
+            if "query GetCollection(" in query:
+                handle = variables["handle"]
+
+                return {
+                    "collection": {
+                        "handle": handle,
+                        "products": _page(collections[handle]),
+                    },
+                }
+
+            if "query GetProducts(" in query:
+                return responses["GetProducts"]
+
+            raise AssertionError("Unexpected query")
+
+        patcher = mock.patch.object(
+            shopify,
+            "shopify_query",
+            side_effect=fake_query,
+        )
+        self.shopify_query = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        secret_patcher = mock.patch(
+            "catalog.views.SHOPIFY_WEBHOOK_SECRET",
+            WEBHOOK_SECRET,
+        )
+        secret_patcher.start()
+        self.addCleanup(secret_patcher.stop)
+
+        # Warm the cache the way the storefront views would.
+        shopify.get_products()
+        shopify.get_product_by_handle("taisho-silk-haori")
+        shopify.get_product_by_handle("lace-trim-jacket")
+        shopify.get_collection_by_handle("lace")
+        shopify.get_collection_by_handle("anarchy")
+
+    def _deliver(self, topic, payload, secret=WEBHOOK_SECRET):
+        body = json.dumps(payload).encode("utf-8")
+
+        signature = base64.b64encode(
+            hmac.new(
+                secret.encode("utf-8"),
+                body,
+                hashlib.sha256,
+            ).digest()
+        ).decode("ascii")
+
+        return self.client.post(
+            reverse("catalog:shopify_webhook"),
+            data=body,
+            content_type="application/json",
+            headers={
+                "X-Shopify-Topic": topic,
+                "X-Shopify-Hmac-Sha256": signature,
+            },
+        )
+
+    def _cached(self, key):
+        return cache.get(key) is not None
+
+    def test_rejects_invalid_signature(self):
+        response = self._deliver(
+            "products/update",
+            PRODUCTS_UPDATE_PAYLOAD,
+            secret="wrong-secret",
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(
+            self._cached(shopify.product_cache_key("taisho-silk-haori"))
+        )
+
+    def test_rejects_malformed_signatures(self):
+        for signature in ("not base64!", "c2lnbmF0dXJlé"):
+            with self.subTest(signature=signature):
+                response = self.client.post(
+                    reverse("catalog:shopify_webhook"),
+                    data=json.dumps(PRODUCTS_UPDATE_PAYLOAD),
+                    content_type="application/json",
+                    headers={
+                        "X-Shopify-Topic": "products/update",
+                        "X-Shopify-Hmac-Sha256": signature,
+                    },
+                )
+
+                self.assertEqual(response.status_code, 401)
+
+    def test_rejects_payloads_that_are_not_objects(self):
+        response = self._deliver(
+            "products/update",
+            [PRODUCTS_UPDATE_PAYLOAD],
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(
+            self._cached(shopify.product_cache_key("taisho-silk-haori"))
+        )
+
+    def test_product_update_evicts_only_affected_entries(self):
+        response = self._deliver(
+            "products/update",
+            PRODUCTS_UPDATE_PAYLOAD,
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(
+            self._cached(shopify.product_cache_key("taisho-silk-haori"))
+        )
+        self.assertFalse(self._cached(shopify.products_cache_key()))
+        self.assertFalse(
+            self._cached(shopify.collection_cache_key("lace"))
+        )
+
+        self.assertTrue(
+            self._cached(shopify.product_cache_key("lace-trim-jacket"))
+        )
+        self.assertTrue(
+            self._cached(shopify.collection_cache_key("anarchy"))
+        )
+
+    def test_product_delete_resolves_handle_from_id(self):
+        response = self._deliver(
+            "products/delete",
+            PRODUCTS_DELETE_PAYLOAD,
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(
+            self._cached(shopify.product_cache_key("taisho-silk-haori"))
+        )
+        self.assertFalse(
+            self._cached(shopify.collection_cache_key("lace"))
+        )
+        self.assertTrue(
+            self._cached(shopify.product_cache_key("lace-trim-jacket"))
+        )
+
+    def test_collection_update_evicts_only_that_collection(self):
+        response = self._deliver(
+            "collections/update",
+            COLLECTIONS_UPDATE_PAYLOAD,
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(
+            self._cached(shopify.collection_cache_key("lace"))
+        )
+        self.assertTrue(
+            self._cached(shopify.collection_cache_key("anarchy"))
+        )
+        self.assertTrue(self._cached(shopify.products_cache_key()))
+
+    def test_evicted_product_is_fetched_again(self):
+        calls = self.shopify_query.call_count
+
+        self._deliver(
+            "products/update",
+            PRODUCTS_UPDATE_PAYLOAD,
+        )
+
+        shopify.get_product_by_handle("taisho-silk-haori")
+
+        self.assertEqual(self.shopify_query.call_count, calls + 1)
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.now = 1_000_000.0
+
+        patcher = mock.patch(
+            "catalog.cache.time",
+            SimpleNamespace(time=lambda: self.now),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.cache = TieredCache(local_ttl=30)
+
+    def _wait_for_refresh(self):
+        deadline = time.monotonic() + 5
+
+        while self.cache._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_counts_misses_then_fresh_hits(self):
+        fetch = mock.Mock(return_value="haori")
+
+        self.assertEqual(self.cache.get_or_fetch("k", fetch, ttl=60), "haori")
+        self.assertEqual(self.cache.get_or_fetch("k", fetch, ttl=60), "haori")
+
+        fetch.assert_called_once()
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_stale_value_is_served_during_a_single_refresh(self):
+        self.cache.set("k", "old", ttl=60, stale_ttl=600)
+        self.now += 120
+
+        release = threading.Event()
+        fetch = mock.Mock(side_effect=lambda: release.wait(5) and "new")
+
+        barrier = threading.Barrier(5)
+        values = []
+
+        def reader():
+            barrier.wait()
+            values.append(self.cache.get_or_fetch("k", fetch, 60, 600))
+
+        readers = [threading.Thread(target=reader) for _ in range(5)]
+
+        for thread in readers:
+            thread.start()
+
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(values, ["old"] * 5)
+
+        release.set()
+        self._wait_for_refresh()
+
+        fetch.assert_called_once()
+        self.assertEqual(self.cache.stats()["stale"], 5)
+        self.assertEqual(self.cache.stats()["refreshes"], 1)
+        self.assertEqual(self.cache.get_or_fetch("k", fetch, 60, 600), "new")
+
+    def test_failed_refresh_keeps_serving_the_stale_value(self):
+        self.cache.set("k", "old", ttl=60, stale_ttl=600)
+        self.now += 120
+
+        fetch = mock.Mock(side_effect=RuntimeError("Shopify unavailable"))
+
+        with self.assertLogs("catalog.cache", "WARNING"):
+            for _ in range(2):
+                self.assertEqual(
+                    self.cache.get_or_fetch("k", fetch, 60, 600),
+                    "old",
+                )
+                self._wait_for_refresh()
+
+        self.assertEqual(self.cache.stats()["refresh_errors"], 2)
+
+    def test_none_is_not_cached(self):
+        fetch = mock.Mock(return_value=None)
+
+        self.assertIsNone(self.cache.get_or_fetch("k", fetch, ttl=60))
+        self.assertIsNone(self.cache.get_or_fetch("k", fetch, ttl=60))
+
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_local_tier_expires_after_local_ttl(self):
+        self.cache.set("k", "old", ttl=600)
+        cache.set("k", ("new", self.now + 600, self.now + 600))
+
+        self.assertEqual(self.cache.get_entry("k")[0], "old")
+
+        self.now += 31
+
+        self.assertEqual(self.cache.get_entry("k")[0], "new")
+
+    async def test_async_counts_misses_then_fresh_hits(self):
+        fetch = mock.AsyncMock(return_value="haori")
+
+        self.assertEqual(await self.cache.aget_or_fetch("k", fetch, 60), "haori")
+        self.assertEqual(await self.cache.aget_or_fetch("k", fetch, 60), "haori")
+
+        fetch.assert_awaited_once()
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    async def test_async_stale_value_is_served_during_a_single_refresh(self):
+        await self.cache.aset("k", "old", ttl=60, stale_ttl=600)
+        self.now += 120
+
+        release = asyncio.Event()
+
+        async def refresh():
+            await release.wait()
+            return "new"
+
+        fetch = mock.AsyncMock(side_effect=refresh)
+
+        values = await asyncio.gather(
+            *(self.cache.aget_or_fetch("k", fetch, 60, 600) for _ in range(5))
+        )
+
+        self.assertEqual(values, ["old"] * 5)
+
+        release.set()
+        await asyncio.gather(*self.cache._refresh_tasks)
+
+        fetch.assert_awaited_once()
+        self.assertEqual(self.cache.stats()["refreshes"], 1)
+        self.assertEqual(
+            await self.cache.aget_or_fetch("k", fetch, 60, 600),
+            "new",
+        )
+
+    async def test_async_failed_refresh_keeps_serving_the_stale_value(self):
+        await self.cache.aset("k", "old", ttl=60, stale_ttl=600)
+        self.now += 120
+
+        fetch = mock.AsyncMock(side_effect=RuntimeError("Shopify unavailable"))
+
+        with self.assertLogs("catalog.cache", "WARNING"):
+            for _ in range(2):
+                self.assertEqual(
+                    await self.cache.aget_or_fetch("k", fetch, 60, 600),
+                    "old",
+                )
+                await asyncio.gather(*self.cache._refresh_tasks)
+
+        self.assertEqual(self.cache.stats()["refresh_errors"], 2)
+
+    async def test_async_none_is_not_cached(self):
+        fetch = mock.AsyncMock(return_value=None)
+
+        self.assertIsNone(await self.cache.aget_or_fetch("k", fetch, 60))
+        self.assertIsNone(await self.cache.aget_or_fetch("k", fetch, 60))
+
+        self.assertEqual(fetch.await_count, 2)
+
+    async def test_async_local_tier_expires_after_local_ttl(self):
+        await self.cache.aset("k", "old", ttl=600)
+        await cache.aset("k", ("new", self.now + 600, self.now + 600))
+
+        self.assertEqual((await self.cache.aget_entry("k"))[0], "old")
+
+        self.now += 31
+
+        self.assertEqual((await self.cache.aget_entry("k"))[0], "new")
+
+
+class SessionPoolTests(SimpleTestCase):
+    def setUp(self):
+        settings = {
+            "_session": None,
+            "_session_pid": None,
+            "SHOPIFY_STORE_DOMAIN": "anarchy-and-lace.myshopify.com",
+            "SHOPIFY_STOREFRONT_TOKEN": "token",
+        }
+
+        for name, value in settings.items():
+            patcher = mock.patch.object(shopify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.sessions = []
+
+        def build_session():
+            session = mock.MagicMock()
+            session.post.return_value.json.return_value = {
+                "data": {"shop": {"name": "Anarchy & Lace"}},
+            }
+            self.sessions.append(session)
+            return session
+
+        patcher = mock.patch("requests.Session", side_effect=build_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("os.getpid", return_value=100)
+        self.getpid = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _query(self):
+        return shopify.shopify_query("query Q { shop { name } }")
+
+    def test_repeated_queries_reuse_one_session(self):
+        for _ in range(3):
+            self.assertEqual(
+                self._query(),
+                {"shop": {"name": "Anarchy & Lace"}},
+            )
+
+        self.assertEqual(len(self.sessions), 1)
+        self.assertEqual(self.sessions[0].post.call_count, 3)
+
+    def test_forked_worker_builds_its_own_session(self):
+        self._query()
+
+        # A gunicorn worker forked after the master made a request.
+        self.getpid.return_value = 101
+        self._query()
+        self._query()
+
+        self.assertEqual(len(self.sessions), 2)
+        self.assertEqual(self.sessions[0].post.call_count, 1)
+        self.assertEqual(self.sessions[1].post.call_count, 2)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_identical_queries_share_one_request(self):
+        calls = []
+
+        def slow_send(query, variables=None):
+            calls.append(variables)
+            time.sleep(0.1)
+            return {"ok": True}
+
+        with mock.patch.object(shopify, "_send_query", side_effect=slow_send):
+            threads = [
+                threading.Thread(
+                    target=shopify.shopify_query,
+                    args=("query Q { shop { name } }", {"handle": "featured"}),
+                    kwargs={"coalesce": True},
+                )
+                for _ in range(10)
+            ]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_waiting_callers_receive_the_leaders_exception(self):
+        started = threading.Event()
+        errors = []
+
+        def failing_send(query, variables=None):
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("Shopify unavailable")
+
+        def call():
+            try:
+                shopify.shopify_query("query Q { shop { name } }", coalesce=True)
+            except RuntimeError as exc:
+                errors.append(str(exc))
+
+        with mock.patch.object(shopify, "_send_query", side_effect=failing_send):
+            leader = threading.Thread(target=call)
+            leader.start()
+            started.wait()
+
+            follower = threading.Thread(target=call)
+            follower.start()
+
+            leader.join()
+            follower.join()
+
+        self.assertEqual(errors, ["Shopify unavailable"] * 2)
+
+
+class SharedSingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.query = "query Q { shop { name } }"
+        self.lock_key = "shopify:flight-lock:k"
+
+    def _publish(self, outcome):
+        # Another worker is leading the flight and has finished.
+        cache.set(self.lock_key, "leader")
+        cache.set("shopify:flight-result:leader", outcome)
+
+    def test_leader_leaves_a_lock_taken_over_by_another_worker(self):
+        def slow_send(query, variables=None):
+            # The lock expired mid-request and another worker took it.
+            cache.set(self.lock_key, "other")
+            return {"ok": True}
+
+        with mock.patch.object(shopify, "_send_query", side_effect=slow_send):
+            shopify._shared_single_flight("k", self.query, None)
+
+        self.assertEqual(cache.get(self.lock_key), "other")
+
+    def test_leader_releases_its_own_lock(self):
+        with mock.patch.object(shopify, "_send_query", return_value={}):
+            shopify._shared_single_flight("k", self.query, None)
+
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_followers_raise_the_leaders_exception_type(self):
+        self._publish(
+            shopify._flight_error(requests.ConnectionError("refused"))
+        )
+
+        with self.assertRaisesMessage(requests.ConnectionError, "refused"):
+            shopify._shared_single_flight("k", self.query, None)
+
+    def test_unknown_exception_types_are_raised_as_runtime_errors(self):
+        self._publish(("error", "httpx", "HTTPStatusError", "503"))
+
+        with self.assertRaisesMessage(RuntimeError, "503"):
+            shopify._shared_single_flight("k", self.query, None)
+
+    async def test_async_followers_raise_the_leaders_exception_type(self):
+        self._publish(shopify._flight_error(ValueError("bad cursor")))
+
+        with self.assertRaisesMessage(ValueError, "bad cursor"):
+            await shopify_async._shared_single_flight("k", self.query, None)
+
+    async def test_async_leader_leaves_another_workers_lock(self):
+        async def slow_send(query, variables=None):
+            cache.set(self.lock_key, "other")
+            return {"ok": True}
+
+        with mock.patch.object(shopify_async, "_send_query", slow_send):
+            await shopify_async._shared_single_flight("k", self.query, None)
+
+        self.assertEqual(cache.get(self.lock_key), "other")
+
+
+class PaginationTests(SimpleTestCase):
+    def test_iter_products_follows_cursors_past_first_page(self):
+        pages = {
+            None: _page([{"handle": "a"}, {"handle": "b"}], "cursor-1"),
+            "cursor-1": _page([{"handle": "c"}, {"handle": "d"}], "cursor-2"),
+            "cursor-2": _page([{"handle": "e"}]),
+        }
+
+        def fake_query(query, variables=None, coalesce=False):
+            self.assertEqual(variables["first"], 2)
+            # Storefront listings keep Shopify's default order.
+            self.assertNotIn("sortKey", query)
+            return {"products": pages[variables["after"]]}
+
+        with mock.patch.object(shopify, "shopify_query", side_effect=fake_query):
+            handles = [
+                product["handle"]
+                for product in shopify.iter_products(page_size=2)
+            ]
+
+        self.assertEqual(handles, ["a", "b", "c", "d", "e"])
+
+    def _collection_pages(self):
+        handles = ["a", "b", "c", "d", "e"]
+        products = [
+            _product(handle, number)
+            for number, handle in enumerate(handles, 1)
+        ]
+
+        return handles, {
+            None: _page(products[:2], "cursor-1"),
+            "cursor-1": _page(products[2:4], "cursor-2"),
+            "cursor-2": _page(products[4:]),
+        }
+
+    def test_collection_spanning_several_pages_is_returned_in_order(self):
+        cache.clear()
+        shopify.catalog_cache._local.clear()
+
+        handles, pages = self._collection_pages()
+        cursors = []
+
+        def fake_query(query, variables=None, coalesce=False):
+            self.assertEqual(variables["handle"], "kimono-silk")
+            cursors.append(variables["after"])
+            return {
+                "collection": {
+                    "handle": "kimono-silk",
+                    "products": pages[variables["after"]],
+                },
+            }
+
+        with mock.patch.object(shopify, "shopify_query", side_effect=fake_query):
+            collection = shopify.get_collection_by_handle("kimono-silk")
+
+        self.assertEqual(
+            [product["handle"] for product in collection["products"]["nodes"]],
+            handles,
+        )
+        self.assertEqual(cursors, [None, "cursor-1", "cursor-2"])
+
+    def test_next_page_is_requested_while_the_current_one_is_consumed(self):
+        _, pages = self._collection_pages()
+        requested = threading.Event()
+
+        def fake_query(query, variables=None, coalesce=False):
+            if variables["after"] == "cursor-2":
+                requested.set()
+
+            return {"collection": {"products": pages[variables["after"]]}}
+
+        with mock.patch.object(shopify, "shopify_query", side_effect=fake_query):
+            products = shopify.iter_collection_products(
+                "kimono-silk",
+                after="cursor-1",
+            )
+
+            self.assertEqual(next(products)["handle"], "c")
+            self.assertTrue(requested.wait(1))
+
+            self.assertEqual(
+                [product["handle"] for product in products],
+                ["d", "e"],
+            )
+
+
+class AddToBagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        # Funnel events are covered in analytics.tests.
+        patcher = mock.patch("catalog.views.record_funnel_event")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.variant_id = "gid://shopify/ProductVariant/44123456789012"
+
+    def _index(self, available=True, indexed_at=None):
+        cache.set(
+            shopify.variant_index_key("taisho-silk-haori"),
+            {
+                "id": self.variant_id,
+                "title": "Taisho Silk Haori",
+                "availableForSale": available,
+                "indexed_at": indexed_at or time.time(),
+            },
+        )
+
+    def _post(self):
+        return self.client.post(
+            reverse(
+                "catalog:add_to_bag",
+                kwargs={"slug": "taisho-silk-haori"},
+            ),
+            {"variant_id": self.variant_id},
+        )
+
+    def test_fresh_index_entry_skips_product_query(self):
+        self._index()
+
+        cart = {
+            "id": "gid://shopify/Cart/1",
+            "checkoutUrl": "https://checkout.example/1",
+            "totalQuantity": 1,
+        }
+
+        with mock.patch.object(
+            shopify, "shopify_query"
+        ) as shopify_query, mock.patch(
+            "catalog.views.create_cart", return_value=cart
+        ) as create_cart:
+            response = self._post()
+
+        self.assertEqual(response.status_code, 302)
+        shopify_query.assert_not_called()
+        create_cart.assert_called_once_with(self.variant_id, quantity=1)
+
+    def test_stale_index_entry_rechecks_availability(self):
+        self._index(
+            indexed_at=time.time() - shopify.SHOPIFY_VARIANT_INDEX_TTL - 1,
+        )
+
+        sold = {
+            "product": {
+                "id": "gid://shopify/Product/8123456789012",
+                "title": "Taisho Silk Haori",
+                "handle": "taisho-silk-haori",
+                "selectedOrFirstAvailableVariant": {
+                    "id": self.variant_id,
+                    "availableForSale": False,
+                },
+            },
+        }
+
+        with mock.patch.object(
+            shopify, "shopify_query", return_value=sold
+        ) as shopify_query, mock.patch(
+            "catalog.views.create_cart"
+        ) as create_cart:
+            self._post()
+
+        shopify_query.assert_called_once()
+        self.assertIn("GetProductVariant", shopify_query.call_args.args[0])
+        create_cart.assert_not_called()
+
+
+class AsyncShopifyTests(SimpleTestCase):
+    """
+    The asyncio client against a mocked Storefront API transport.
+    """
+
+    def setUp(self):
+        cache.clear()
+        shopify.catalog_cache._local.clear()
+
+        self.requests = []
+        self.responses = {}
+
+        for name, value in (
+            ("SHOPIFY_STORE_DOMAIN", "test.myshopify.com"),
+            ("SHOPIFY_STOREFRONT_TOKEN", "test-token"),
+        ):
+            patcher = mock.patch.object(shopify, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(
+            shopify_async,
+            "_build_client",
+            lambda: httpx.AsyncClient(
+                transport=httpx.MockTransport(self._handle),
+            ),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _handle(self, request):
+        body = json.loads(request.content)
+        operation = re.search(
+            r"(?:query|mutation) (\w+)",
+            body["query"],
+        ).group(1)
+
+        self.requests.append((operation, body["variables"]))
+
+        # Long enough for concurrent callers to pile up.
+        await asyncio.sleep(0.02)
+
+        data = self.responses[operation]
+
+        if callable(data):
+            data = data(body["variables"])
+
+        return httpx.Response(200, json={"data": data})
+
+    async def test_concurrent_identical_reads_share_one_request(self):
+        haori = _product("taisho-silk-haori", 8123456789012)
+        self.responses["GetProduct"] = {"product": haori}
+
+        products = await asyncio.gather(
+            *(
+                shopify_async.get_product_by_handle("taisho-silk-haori")
+                for _ in range(20)
+            )
+        )
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(products, [haori] * 20)
+
+    async def test_reads_share_the_catalogue_cache_with_sync_client(self):
+        self.responses["GetProduct"] = {
+            "product": _product("taisho-silk-haori", 8123456789012),
+        }
+
+        await shopify_async.get_product_by_handle("taisho-silk-haori")
+
+        with mock.patch.object(shopify, "shopify_query") as shopify_query:
+            product = shopify.get_product_by_handle("taisho-silk-haori")
+
+        shopify_query.assert_not_called()
+        self.assertEqual(product["handle"], "taisho-silk-haori")
+
+    async def test_collection_follows_cursors_past_first_page(self):
+        pages = {
+            None: _page([{"handle": "a"}, {"handle": "b"}], "cursor-1"),
+            "cursor-1": _page([{"handle": "c"}]),
+        }
+
+        self.responses["GetCollection"] = lambda variables: {
+            "collection": {
+                "handle": variables["handle"],
+                "products": pages[variables["after"]],
+            },
+        }
+
+        collection = await shopify_async.get_collection_by_handle("lace")
+
+        self.assertEqual(
+            [node["handle"] for node in collection["products"]["nodes"]],
+            ["a", "b", "c"],
+        )
+
+    async def test_cart_user_errors_raise(self):
+        self.responses["CartLinesAdd"] = {
+            "cartLinesAdd": {
+                "cart": None,
+                "userErrors": [{"field": "lines", "message": "Sold out"}],
+            },
+        }
+
+        with self.assertRaises(RuntimeError):
+            await shopify_async.add_cart_line(
+                "gid://shopify/Cart/1",
+                "gid://shopify/ProductVariant/1",
+            )
+
+    async def test_async_add_to_bag_creates_cart(self):
+        variant_id = "gid://shopify/ProductVariant/44123456789012"
+
+        cache.set(
+            shopify.variant_index_key("taisho-silk-haori"),
+            {
+                "id": variant_id,
+                "title": "Taisho Silk Haori",
+                "availableForSale": True,
+                "indexed_at": time.time(),
+            },
+        )
+
+        self.responses["CartCreate"] = {
+            "cartCreate": {
+                "cart": {
+                    "id": "gid://shopify/Cart/1",
+                    "checkoutUrl": "https://checkout.example/1",
+                    "totalQuantity": 1,
+                },
+                "userErrors": [],
+            },
+        }
+
+        request = AsyncRequestFactory().post(
+            "/shop/taisho-silk-haori/add-to-bag/",
+            {"variant_id": variant_id},
+        )
+        request.session = SessionStore()
+        request._messages = default_storage(request)
+
+        with mock.patch("catalog.async_views.arecord_funnel_event"):
+            response = await async_views.add_to_bag(
+                request,
+                "taisho-silk-haori",
+            )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [operation for operation, _variables in self.requests],
+            ["CartCreate"],
+        )
+        self.assertEqual(
+            await request.session.aget("shopify_cart_id"),
+            "gid://shopify/Cart/1",
+        )
+        self.assertEqual(
+            await request.session.aget("shopify_cart_handles"),
+            ["taisho-silk-haori"],
+        )
+
+
+@override_settings(
+    ANALYTICS_INGEST="direct",
+    PAGE_CACHE_ENABLED=True,
+    STORAGES=TEST_STORAGES,
+)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.product = {
+            "id": "gid://shopify/Product/8123456789012",
+            "title": "Taisho Silk Haori",
+            "handle": "taisho-silk-haori",
+            "selectedOrFirstAvailableVariant": {
+                "id": "gid://shopify/ProductVariant/44123456789012",
+                "availableForSale": True,
+                "price": {"amount": "185.0", "currencyCode": "GBP"},
+            },
+        }
+
+        patcher = mock.patch.object(
+            shopify,
+            "get_product_by_handle",
+            return_value=self.product,
+        )
+        self.get_product = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("catalog.views.record_funnel_event")
+        self.record_funnel_event = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Page views are written directly; keep their visitor sketches
+        # out of the shared buffer.
+        patcher = mock.patch("analytics.events.pageview_buffer")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.url = reverse(
+            "catalog:product_detail",
+            kwargs={"slug": "taisho-silk-haori"},
+        )
+
+    def _token(self, response):
+        return re.search(
+            rb'name="csrfmiddlewaretoken" value="([^"]+)"',
+            response.content,
+        ).group(1).decode("ascii")
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        second = Client().get(self.url)
+
+        self.assertEqual(second.status_code, 200)
+        self.get_product.assert_called_once()
+
+        self.assertNotIn(page_cache.CSRF_PLACEHOLDER, second.content)
+        self.assertNotEqual(self._token(first), self._token(second))
+
+        # The funnel still sees both product views.
+        self.assertEqual(self.record_funnel_event.call_count, 2)
+
+    def test_bag_quantity_is_part_of_the_key(self):
+        self.client.get(self.url)
+
+        session = self.client.session
+        session["shopify_cart_quantity"] = 2
+        session.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(self.get_product.call_count, 2)
+        self.assertRegex(
+            response.content.decode(),
+            r'nav-bag__count">\s*2\s*<',
+        )
+
+    def test_unknown_query_strings_bypass_the_cache(self):
+        self.client.get(self.url)
+        bypassed = page_cache.page_cache_stats()["bypassed"]
+
+        for query in ({"utm_source": "instagram"}, {"x": "1"}, {"x": "1"}):
+            self.client.get(self.url, query)
+
+        self.assertEqual(self.get_product.call_count, 4)
+        self.assertEqual(
+            page_cache.page_cache_stats()["bypassed"],
+            bypassed + 3,
+        )
+
+    @override_settings(PAGE_CACHE_QUERY_PARAMS=["page"])
+    def test_allowed_query_params_are_part_of_the_key(self):
+        for query in ({"page": "2"}, {"page": "2"}, {"page": "3"}):
+            self.client.get(self.url, query)
+
+        self.assertEqual(self.get_product.call_count, 2)
+
+    def test_pending_messages_bypass_the_cache(self):
+        self.client.get(self.url)
+
+        self.client.cookies["messages"] = "pending"
+        self.client.get(self.url)
+
+        self.assertEqual(self.get_product.call_count, 2)
+
+    def test_purge_drops_cached_pages(self):
+        self.client.get(self.url)
+
+        page_cache.purge_pages()
+        self.client.get(self.url)
+
+        self.assertEqual(self.get_product.call_count, 2)
+
+    def test_product_webhook_leaves_unrelated_pages_cached(self):
+        other_url = reverse(
+            "catalog:product_detail",
+            kwargs={"slug": "lace-trim-jacket"},
+        )
+
+        self.client.get(self.url)
+        self.client.get(other_url)
+
+        body = json.dumps(PRODUCTS_UPDATE_PAYLOAD).encode("utf-8")
+        signature = base64.b64encode(
+            hmac.new(
+                WEBHOOK_SECRET.encode("utf-8"),
+                body,
+                hashlib.sha256,
+            ).digest()
+        ).decode("ascii")
+
+        with mock.patch(
+            "catalog.views.SHOPIFY_WEBHOOK_SECRET",
+            WEBHOOK_SECRET,
+        ):
+            response = self.client.post(
+                reverse("catalog:shopify_webhook"),
+                data=body,
+                content_type="application/json",
+                headers={
+                    "X-Shopify-Topic": "products/update",
+                    "X-Shopify-Hmac-Sha256": signature,
+                },
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.client.get(self.url)
+        self.client.get(other_url)
+
+        self.assertEqual(
+            [call.args[0] for call in self.get_product.call_args_list],
+            ["taisho-silk-haori", "lace-trim-jacket", "taisho-silk-haori"],
+        )
+
+    def test_cached_form_token_passes_csrf(self):
+        self.client.get(self.url)
+
+        client = Client(enforce_csrf_checks=True)
+        page = client.get(self.url)
+
+        self.get_product.assert_called_once()
+
+        with mock.patch(
+            "catalog.views.get_bag_variant",
+            return_value=None,
+        ):
+            response = client.post(
+                reverse(
+                    "catalog:add_to_bag",
+                    kwargs={"slug": "taisho-silk-haori"},
+                ),
+                {"csrfmiddlewaretoken": self._token(page)},
+            )
+
+        self.assertEqual(response.status_code, 302)
+
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=True)
+class FragmentCacheTests(SimpleTestCase):
+    template = Template(
+        "{% load catalog_fragments %}"
+        '{% product_fragment "card" product %}'
+        "{{ product.title }}|{{ label }}"
+        "{% endproduct_fragment %}"
+    )
+
+    def setUp(self):
+        caches["local"].clear()
+        fragment_metrics.reset()
+
+        self.product = {
+            "title": "Taisho Silk Haori",
+            "handle": "taisho-silk-haori",
+            "updatedAt": "2026-10-12T13:21:09Z",
+            "selectedOrFirstAvailableVariant": {
+                "availableForSale": True,
+            },
+        }
+
+    def _render(self, product, label="first"):
+        return self.template.render(
+            Context({"product": product, "label": label})
+        )
+
+    def test_fragment_is_reused_until_the_product_changes(self):
+        self.assertEqual(
+            self._render(self.product),
+            "Taisho Silk Haori|first",
+        )
+        self.assertEqual(
+            self._render(self.product, "second"),
+            "Taisho Silk Haori|first",
+        )
+
+        edited = {**self.product, "updatedAt": "2026-10-13T09:00:00Z"}
+
+        self.assertEqual(
+            self._render(edited, "third"),
+            "Taisho Silk Haori|third",
+        )
+
+        stats = fragment_metrics.stats()
+
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertAlmostEqual(stats["hit_ratio"], 1 / 3)
+
+    def test_selling_out_renders_a_new_fragment(self):
+        self._render(self.product)
+
+        sold = {
+            **self.product,
+            "selectedOrFirstAvailableVariant": {
+                "availableForSale": False,
+            },
+        }
+
+        self.assertEqual(
+            self._render(sold, "sold"),
+            "Taisho Silk Haori|sold",
+        )
+
+    def test_products_without_updated_at_are_not_cached(self):
+        product = {**self.product, "updatedAt": None}
+
+        self._render(product)
+
+        self.assertEqual(
+            self._render(product, "second"),
+            "Taisho Silk Haori|second",
+        )
+        self.assertEqual(fragment_metrics.stats()["uncached"], 2)
+
+
+def _mirror_node(handle, updated_at, available=True):
+    return {
+        "id": f"gid://shopify/Product/{zlib.crc32(handle.encode())}",
+        "title": handle.replace("-", " ").title(),
+        "handle": handle,
+        "updatedAt": updated_at,
+        "description": "Reworked kimono silk.",
+        "descriptionHtml": "<p>Reworked kimono silk.</p>",
+        "featuredImage": {
+            "url": f"https://cdn.shopify.com/{handle}.jpg",
+            "altText": None,
+        },
+        "images": {
+            "nodes": [
+                {"url": f"https://cdn.shopify.com/{handle}.jpg", "altText": None},
+            ],
+        },
+        "variants": {
+            "nodes": [
+                {
+                    "id": f"gid://shopify/ProductVariant/{handle}",
+                    "title": "Default Title",
+                    "sku": "",
+                    "availableForSale": available,
+                    "price": {"amount": "185.0", "currencyCode": "GBP"},
+                    "selectedOptions": [{"name": "Size", "value": "M"}],
+                },
+            ],
+        },
+        "collections": {
+            "nodes": [
+                {
+                    "id": "gid://shopify/Collection/1",
+                    "title": "Lace",
+                    "handle": "lace",
+                    "description": "",
+                },
+            ],
+        },
+    }
+
+
+class CatalogMirrorTests(TestCase):
+    def _sync(self, nodes):
+        with mock.patch.object(
+            shopify,
+            "shopify_query",
+            return_value={"products": _page(nodes)},
+        ):
+            return sync_catalog()
+
+    def test_sync_upserts_and_skips_unchanged_products(self):
+        nodes = [
+            _mirror_node("taisho-silk-haori", "2026-10-12T13:21:09Z"),
+            _mirror_node("lace-trim-jacket", "2026-10-12T13:22:00Z"),
+        ]
+
+        report = self._sync(nodes)
+        self.assertEqual(len(report["created"]), 2)
+
+        nodes[0] = _mirror_node(
+            "taisho-silk-haori",
+            "2026-10-13T09:00:00Z",
+            available=False,
+        )
+
+        report = self._sync(nodes)
+        self.assertEqual(report["updated"], ["taisho-silk-haori"])
+        self.assertEqual(report["unchanged"], 1)
+
+    def test_longest_shopify_handles_fit_the_slugs(self):
+        # SQLite doesn't enforce column lengths, so check the synced
+        # rows against the fields' own validators as PostgreSQL would.
+        handle = ("taisho-silk-haori-" * 15)[:255]
+
+        node = _mirror_node(handle, "2026-10-12T13:21:09Z")
+        node["collections"]["nodes"][0]["handle"] = handle
+
+        report = self._sync([node])
+        self.assertEqual(report["created"], [handle])
+
+        product = Product.objects.get(slug=handle)
+        collection = product.collections.get()
+
+        Product._meta.get_field("slug").run_validators(product.slug)
+        Collection._meta.get_field("slug").run_validators(collection.slug)
+        self.assertEqual(collection.slug, handle)
+
+    def test_admin_products_and_memberships_are_left_alone(self):
+        handmade = Product.objects.create(
+            name="Handmade Obi Belt",
+            slug="obi-belt",
+            description="Made in the studio.",
+            price="45.00",
+            sku="studio-obi-belt",
+        )
+
+        haori = _mirror_node("taisho-silk-haori", "2026-10-12T13:21:09Z")
+        self._sync([haori])
+
+        featured = Collection.objects.create(name="Featured")
+        Product.objects.get(slug="taisho-silk-haori").collections.add(featured)
+
+        report = self._sync(
+            [
+                _mirror_node("obi-belt", "2026-10-12T13:22:00Z"),
+                {**haori, "updatedAt": "2026-10-13T09:00:00Z"},
+            ]
+        )
+
+        self.assertEqual(report["skipped"], ["obi-belt"])
+        self.assertEqual(report["updated"], ["taisho-silk-haori"])
+
+        handmade.refresh_from_db()
+        self.assertEqual(handmade.name, "Handmade Obi Belt")
+        self.assertIsNone(handmade.shopify_id)
+
+        self.assertEqual(
+            sorted(
+                Product.objects.get(slug="taisho-silk-haori")
+                .collections.values_list("slug", flat=True)
+            ),
+            ["featured", "lace"],
+        )
+
+    def test_collections_with_the_same_title_get_unique_names(self):
+        Collection.objects.create(name="Lace", slug="studio-lace")
+
+        node = _mirror_node("taisho-silk-haori", "2026-10-12T13:21:09Z")
+        node["collections"]["nodes"].append(
+            {
+                "id": "gid://shopify/Collection/2",
+                "title": "Lace",
+                "handle": "lace-archive",
+                "description": "",
+            }
+        )
+
+        self._sync([node])
+
+        self.assertEqual(
+            sorted(
+                Collection.objects.filter(
+                    shopify_id__isnull=False,
+                ).values_list("name", flat=True)
+            ),
+            ["Lace (lace)", "Lace (lace-archive)"],
+        )
+        self.assertEqual(
+            Product.objects.get(slug="taisho-silk-haori").collections.count(),
+            2,
+        )
+
+    def test_database_source_serves_storefront_shaped_products(self):
+        self._sync([_mirror_node("taisho-silk-haori", "2026-10-12T13:21:09Z")])
+
+        product = mirror.get_product_by_handle("taisho-silk-haori")
+        variant = product["selectedOrFirstAvailableVariant"]
+
+        self.assertEqual(variant["price"]["amount"], "185.00")
+        self.assertEqual(
+            variant["id"],
+            "gid://shopify/ProductVariant/taisho-silk-haori",
+        )
+
+        collection = mirror.get_collection_by_handle("lace")
+        self.assertEqual(
+            [node["handle"] for node in collection["products"]["nodes"]],
+            ["taisho-silk-haori"],
+        )
+
+
+class SyncCommandTests(TestCase):
+    def test_full_sync_deactivates_missing_handles_and_stores_mark(self):
+        nodes = [
+            _mirror_node("taisho-silk-haori", "2026-10-12T13:21:09Z"),
+            _mirror_node("lace-trim-jacket", "2026-10-12T13:22:00Z"),
+        ]
+
+        with mock.patch.object(
+            shopify,
+            "shopify_query",
+            return_value={"products": _page(nodes)},
+        ):
+            call_command("sync_shopify_catalog", stdout=io.StringIO())
+
+        with mock.patch.object(
+            shopify,
+            "shopify_query",
+            return_value={"products": _page(nodes[:1])},
+        ) as shopify_query:
+            call_command("sync_shopify_catalog", stdout=io.StringIO())
+
+        self.assertIn(
+            "updated_at:>='2026-10-12T13:22:00Z'",
+            shopify_query.call_args.args[1]["query"],
+        )
+        self.assertIn("sortKey: UPDATED_AT", shopify_query.call_args.args[0])
+        self.assertTrue(
+            Product.objects.get(slug="lace-trim-jacket").is_active
+        )
+
+        with mock.patch.object(
+            shopify,
+            "shopify_query",
+            return_value={"products": _page(nodes[:1])},
+        ):
+            call_command(
+                "sync_shopify_catalog",
+                "--full",
+                stdout=io.StringIO(),
+            )
+
+        self.assertFalse(
+            Product.objects.get(slug="lace-trim-jacket").is_active
+        )
+        self.assertEqual(
+            CatalogSyncState.objects.get().high_water_mark.isoformat(),
+            "2026-10-12T13:22:00+00:00",
+        )
+
+
+class CompileTemplatesCommandTests(SimpleTestCase):
+    def test_reports_every_storefront_template(self):
+        out = io.StringIO()
+
+        call_command("compile_templates", stdout=out)
+
+        lines = out.getvalue().splitlines()
+
+        for name in (
+            "base.html",
+            "catalog/product_detail.html",
+            "home/index.html",
+        ):
+            self.assertTrue(
+                any(line.endswith(f"ms  {name}") for line in lines),
+                name,
+            )
+
+        self.assertNotIn("analytics/dashboard.html", out.getvalue())
+        self.assertIn("total for", lines[-1])
+
+    def test_failing_template_is_reported(self):
+        with mock.patch(
+            "django.template.engine.Engine.get_template",
+            side_effect=TemplateSyntaxError("Unclosed tag"),
+        ):
+            with self.assertLogs("anarchy_and_lace.template_warmup", "ERROR"):
+                with self.assertRaisesMessage(CommandError, "base.html"):
+                    call_command(
+                        "compile_templates",
+                        "base.html",
+                        stdout=io.StringIO(),
+                    )
@@ -1,47 +1,59 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 
 app_name = "catalog"
 
 
+# Storefront views that call Shopify. Under ASGI the async versions
+# let one worker wait on many Storefront API requests at once.
+storefront = async_views if settings.CATALOG_ASYNC_VIEWS else views
+
+
 urlpatterns = [
     path("", views.shop, name="shop"),
 
     path(
         "bag/",
-        views.bag,
+        storefront.bag,
         name="bag",
     ),
 
     path(
         "bag/remove/<path:line_id>/",
-        views.remove_from_bag,
+        storefront.remove_from_bag,
         name="remove_from_bag",
     ),
 
     path(
         "checkout/",
-        views.checkout,
+        storefront.checkout,
         name="checkout",
     ),
 
+    path(
+        "webhooks/shopify/",
+        views.shopify_webhook,
+        name="shopify_webhook",
+    ),
+
     path(
         "collection/<slug:collection_handle>/",
-        views.collection_detail,
+        storefront.collection_detail,
         name="collection_detail",
     ),
 
     path(
         "<slug:slug>/add-to-bag/",
-        views.add_to_bag,
+        storefront.add_to_bag,
         name="add_to_bag",
     ),
 
     path(
         "<slug:slug>/",
-        views.product_detail,
+        storefront.product_detail,
         name="product_detail",
     ),
 ]
\ No newline at end of file
@@ -1,33 +1,44 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+
 from django.contrib import messages
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse
+from django.urls import NoReverseMatch, reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from analytics.events import record_funnel_event
+from analytics.models import FunnelEvent
+from anarchy_and_lace.page_cache import on_hit, purge_pages
 
+from .bag_session import added_handles, clear_cart, store_cart
 from .shopify import (
+    SHOPIFY_WEBHOOK_SECRET,
     add_cart_line,
     create_cart,
+    get_bag_variant,
     get_cart,
-    get_collection_by_handle,
-    get_product_by_handle,
-    get_products,
+    invalidate_collection,
+    invalidate_product,
+    product_collection_handles,
+    product_handles,
     remove_cart_line,
 )
+from .sources import catalog_source
 
 
-CANONICAL_SITE_URL = "https://www.anarchyandlace.co.uk"
+logger = logging.getLogger(__name__)
 
 
-def _clear_cart_session(request):
-    """
-    Remove all Shopify cart information from the Django session.
-    """
-    request.session.pop("shopify_cart_id", None)
-    request.session.pop("shopify_checkout_url", None)
-    request.session.pop("shopify_cart_quantity", None)
+CANONICAL_SITE_URL = "https://www.anarchyandlace.co.uk"
 
 
 def product_list(request):
-    products = get_products()
+    products = catalog_source().get_products()
 
     return render(
         request,
@@ -40,11 +51,17 @@ def product_list(request):
 
 
 def product_detail(request, slug):
-    product = get_product_by_handle(slug)
+    product = catalog_source().get_product_by_handle(slug)
 
     if not product:
         raise Http404("Product not found.")
 
+    record_funnel_event(
+        request,
+        FunnelEvent.VIEW_PRODUCT,
+        product["handle"],
+    )
+
     product_path = reverse(
         "catalog:product_detail",
         kwargs={
@@ -67,6 +84,19 @@ def product_detail(request, slug):
     )
 
 
+def _record_cached_product_view(request, match):
+    record_funnel_event(
+        request,
+        FunnelEvent.VIEW_PRODUCT,
+        match.kwargs["slug"],
+    )
+
+
+# Product pages served by the page cache skip product_detail,
+# so the funnel step is recorded when the cached page is served.
+on_hit("catalog:product_detail", _record_cached_product_view)
+
+
 def shop(request):
     return render(
         request,
@@ -78,7 +108,7 @@ def shop(request):
 
 
 def collection_detail(request, collection_handle):
-    collection = get_collection_by_handle(
+    collection = catalog_source().get_collection_by_handle(
         collection_handle
     )
 
@@ -103,14 +133,16 @@ def add_to_bag(request, slug):
             slug=slug,
         )
 
-    product = get_product_by_handle(slug)
-
-    if not product:
-        raise Http404("Product not found.")
-
-    variant = product.get(
-        "selectedOrFirstAvailableVariant"
-    )
+    # The product page posts the variant it rendered, so a fresh
+    # entry in the variant index lets us go straight to the cart
+    # mutation without fetching the product again.
+    try:
+        variant = get_bag_variant(
+            slug,
+            variant_id=request.POST.get("variant_id"),
+        )
+    except RuntimeError:
+        variant = None
 
     if not variant or not variant.get(
         "availableForSale"
@@ -145,21 +177,24 @@ def add_to_bag(request, slug):
                 quantity=1,
             )
 
-        request.session[
-            "shopify_cart_id"
-        ] = cart["id"]
-
-        request.session[
-            "shopify_checkout_url"
-        ] = cart["checkoutUrl"]
+        store_cart(
+            request.session,
+            cart,
+            added_handles(
+                request.session.get("shopify_cart_handles"),
+                slug,
+            ),
+        )
 
-        request.session[
-            "shopify_cart_quantity"
-        ] = cart["totalQuantity"]
+        record_funnel_event(
+            request,
+            FunnelEvent.ADD_TO_BAG,
+            slug,
+        )
 
         messages.success(
             request,
-            f"{product['title']} added to your bag.",
+            f"{variant['title']} added to your bag.",
         )
 
     except RuntimeError:
@@ -199,16 +234,10 @@ def bag(request):
         cart = None
 
     if not cart:
-        _clear_cart_session(request)
+        clear_cart(request.session)
 
     else:
-        request.session[
-            "shopify_checkout_url"
-        ] = cart["checkoutUrl"]
-
-        request.session[
-            "shopify_cart_quantity"
-        ] = cart["totalQuantity"]
+        store_cart(request.session, cart)
 
     return render(
         request,
@@ -237,17 +266,17 @@ def remove_from_bag(request, line_id):
             line_id,
         )
 
+        record_funnel_event(
+            request,
+            FunnelEvent.REMOVE,
+            request.POST.get("product_handle", ""),
+        )
+
         if cart["totalQuantity"] == 0:
-            _clear_cart_session(request)
+            clear_cart(request.session)
 
         else:
-            request.session[
-                "shopify_checkout_url"
-            ] = cart["checkoutUrl"]
-
-            request.session[
-                "shopify_cart_quantity"
-            ] = cart["totalQuantity"]
+            store_cart(request.session, cart)
 
     except RuntimeError:
         messages.error(
@@ -271,4 +300,133 @@ def checkout(request):
 
         return redirect("catalog:shop")
 
-    return redirect(checkout_url)
\ No newline at end of file
+    for handle in request.session.get("shopify_cart_handles") or [""]:
+        record_funnel_event(
+            request,
+            FunnelEvent.CHECKOUT_REDIRECT,
+            handle,
+        )
+
+    return redirect(checkout_url)
+
+
+def _valid_webhook_signature(request):
+    """
+    Check the Shopify HMAC signature sent with a webhook.
+    """
+
+    if not SHOPIFY_WEBHOOK_SECRET:
+        return False
+
+    signature = request.headers.get(
+        "X-Shopify-Hmac-Sha256",
+        "",
+    )
+
+    try:
+        signature = base64.b64decode(signature, validate=True)
+    except ValueError:
+        # Not base64, or not even ASCII.
+        return False
+
+    digest = hmac.new(
+        SHOPIFY_WEBHOOK_SECRET.encode("utf-8"),
+        request.body,
+        hashlib.sha256,
+    ).digest()
+
+    return hmac.compare_digest(
+        digest,
+        signature,
+    )
+
+
+def _catalogue_pages(product_handles, collection_handles):
+    """
+    Return the paths of the cached pages that show these products and
+    collections, plus the listing pages.
+    """
+
+    # The home page lists the featured collection.
+    pages = [
+        reverse("catalog:shop"),
+        reverse("home:home"),
+    ]
+
+    for view_name, kwarg, handles in (
+        ("catalog:product_detail", "slug", product_handles),
+        ("catalog:collection_detail", "collection_handle", collection_handles),
+    ):
+        for handle in handles:
+            try:
+                pages.append(reverse(view_name, kwargs={kwarg: handle}))
+            except NoReverseMatch:
+                # No page can exist for a handle the URL can't hold.
+                continue
+
+    return pages
+
+
+@csrf_exempt
+@require_POST
+def shopify_webhook(request):
+    """
+    Evict cached catalogue reads affected by a Shopify change.
+    """
+
+    if not _valid_webhook_signature(request):
+        return HttpResponse(status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+
+    if not isinstance(payload, dict):
+        return HttpResponse(status=400)
+
+    topic = request.headers.get(
+        "X-Shopify-Topic",
+        "",
+    )
+
+    if topic in ("products/update", "products/delete"):
+        handles = product_handles(
+            product_id=payload.get("id"),
+            handle=payload.get("handle"),
+        )
+
+        pages = _catalogue_pages(
+            handles,
+            product_collection_handles(handles),
+        )
+
+        evicted = invalidate_product(
+            product_id=payload.get("id"),
+            handle=payload.get("handle"),
+        )
+
+    elif topic == "collections/update":
+        pages = _catalogue_pages(
+            (),
+            [payload.get("handle")],
+        )
+
+        evicted = invalidate_collection(
+            payload.get("handle")
+        )
+
+    else:
+        # Acknowledge topics we don't use so
+        # Shopify doesn't keep retrying them.
+        return HttpResponse(status=200)
+
+    purge_pages(pages)
+
+    logger.info(
+        "Shopify webhook %s evicted %d cache entries",
+        topic,
+        len(evicted),
+    )
+
+    return HttpResponse(status=200)
@@ -0,0 +1,23 @@
+"""
+gunicorn settings, read automatically from the working directory.
+
+Command line flags (see Procfile) still take precedence.
+"""
+
+
+def post_worker_init(worker):
+    """
+    Compile the storefront templates before the worker accepts requests,
+    so the first visitors after a deploy or worker restart don't wait on
+    template parsing.
+    """
+
+    from anarchy_and_lace.template_warmup import warm_templates
+
+    timings = warm_templates()
+
+    worker.log.info(
+        "Compiled %d templates in %.1f ms.",
+        len(timings),
+        sum(seconds for _, seconds, _ in timings) * 1000,
+    )
@@ -8,7 +8,7 @@ from django.core.validators import validate_email
 from django.shortcuts import redirect, render
 
 from catalog.models import Product
-from catalog.shopify import get_collection_by_handle
+from catalog.sources import catalog_source
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +83,9 @@ def kimono_history(request):
     )
 
 def index(request):
-    featured_collection = get_collection_by_handle("featured")
+    featured_collection = catalog_source().get_collection_by_handle(
+        "featured"
+    )
 
     featured_products = []
 
@@ -0,0 +1,104 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const chart = document.querySelector(".analytics-chart");
+
+    if (!chart) {
+        return;
+    }
+
+    const plot = chart.querySelector(".analytics-chart__plot");
+    const summary = chart.querySelector(".analytics-chart__summary");
+    const buttons = Array.from(chart.querySelectorAll("[data-days]"));
+
+    const SVG_NS = "http://www.w3.org/2000/svg";
+    const WIDTH = 600;
+    const HEIGHT = 200;
+
+
+    // Local calendar date as YYYY-MM-DD
+    const isoDay = (date) => {
+        const month = String(date.getMonth() + 1).padStart(2, "0");
+        const day = String(date.getDate()).padStart(2, "0");
+
+        return `${date.getFullYear()}-${month}-${day}`;
+    };
+
+
+    const draw = (data) => {
+        plot.replaceChildren();
+
+        const series = data.series;
+        const peak = Math.max(1, ...series.map((point) => point.pageviews));
+        const slot = WIDTH / Math.max(1, series.length);
+
+        series.forEach((point, index) => {
+            [
+                ["views", point.pageviews, 0.1],
+                ["visitors", point.visitors, 0.55],
+            ].forEach(([name, value, offset]) => {
+                const bar = document.createElementNS(SVG_NS, "rect");
+                const height = (value / peak) * HEIGHT;
+
+                bar.setAttribute("class", name);
+                bar.setAttribute("x", index * slot + slot * offset);
+                bar.setAttribute("y", HEIGHT - height);
+                bar.setAttribute("width", slot * 0.35);
+                bar.setAttribute("height", height);
+
+                const title = document.createElementNS(SVG_NS, "title");
+                title.textContent = `${point.t}: ${value} ${name}`;
+                bar.appendChild(title);
+
+                plot.appendChild(bar);
+            });
+        });
+
+        const views = series.reduce((sum, point) => sum + point.pageviews, 0);
+
+        summary.textContent =
+            `${views} page views from ${data.start} to ${data.end}, ` +
+            `per ${data.bucket}.`;
+    };
+
+
+    const load = (button) => {
+        const days = Number(button.dataset.days);
+        const end = new Date();
+        const start = new Date(end);
+
+        start.setDate(end.getDate() - (days - 1));
+
+        const params = new URLSearchParams({
+            start: isoDay(start),
+            end: isoDay(end),
+            bucket: button.dataset.bucket,
+        });
+
+        buttons.forEach((other) => {
+            other.classList.toggle("is-active", other === button);
+        });
+
+        // The browser revalidates with If-None-Match, so switching
+        // back to a range it has seen costs a 304 at most.
+        fetch(`${chart.dataset.seriesUrl}?${params}`, {
+            credentials: "same-origin",
+        })
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+
+                return response.json();
+            })
+            .then(draw)
+            .catch(() => {
+                summary.textContent = "Traffic could not be loaded.";
+            });
+    };
+
+
+    buttons.forEach((button) => {
+        button.addEventListener("click", () => load(button));
+    });
+
+    load(buttons[1]);
+});
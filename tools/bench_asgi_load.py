@@ -0,0 +1,320 @@
+"""
+Compare product page throughput of one sync WSGI worker against one
+async ASGI worker while every page waits on a slow Storefront API.
+
+A local stub GraphQL server stands in for Shopify and answers each
+request after --delay seconds. Every page asks for a different handle,
+so each one misses the catalogue cache and waits on the stub:
+
+  wsgi  gunicorn gthread worker, catalog.views (one thread per request)
+  asgi  gunicorn uvicorn worker, catalog.async_views (CATALOG_ASYNC_VIEWS)
+
+Needs gunicorn, uvicorn and uvicorn-worker. Both servers run with
+DJANGO_DEBUG=1 so no collectstatic or production secrets are needed,
+which costs the same on both sides.
+
+Usage:
+    python tools/bench_asgi_load.py --requests 2000 --concurrency 200 --delay 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+SERVERS = {
+    "wsgi": {
+        "command": [
+            "anarchy_and_lace.wsgi:application",
+            "--worker-class", "gthread",
+        ],
+        "env": {
+            "CATALOG_ASYNC_VIEWS": "0",
+        },
+    },
+    "asgi": {
+        "command": [
+            "anarchy_and_lace.asgi:application",
+            "--worker-class", "uvicorn_worker.UvicornWorker",
+        ],
+        "env": {
+            "CATALOG_ASYNC_VIEWS": "1",
+        },
+    },
+}
+
+
+def _stub_product(handle):
+    return {
+        "id": f"gid://shopify/Product/{abs(hash(handle))}",
+        "title": handle.replace("-", " ").title(),
+        "handle": handle,
+        "updatedAt": "2026-10-12T13:21:09Z",
+        "description": "Reworked kimono silk.",
+        "descriptionHtml": "<p>Reworked kimono silk.</p>",
+        "availableForSale": True,
+        "featuredImage": {
+            "url": f"https://cdn.shopify.com/{handle}.jpg",
+            "altText": None,
+        },
+        "images": {
+            "nodes": [],
+        },
+        "selectedOrFirstAvailableVariant": {
+            "id": f"gid://shopify/ProductVariant/{handle}",
+            "sku": "",
+            "availableForSale": True,
+            "price": {"amount": "185.0", "currencyCode": "GBP"},
+            "selectedOptions": [],
+        },
+    }
+
+
+def _stub_app(delay):
+    async def app(scope, receive, send):
+        body = b""
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        variables = json.loads(body or b"{}").get("variables") or {}
+
+        await asyncio.sleep(delay)
+
+        payload = json.dumps(
+            {
+                "data": {
+                    "product": _stub_product(
+                        variables.get("handle", "bench")
+                    ),
+                },
+            }
+        ).encode("utf-8")
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+    return app
+
+
+def _serve_stub(port, delay):
+    import uvicorn
+
+    uvicorn.run(
+        _stub_app(delay),
+        host="127.0.0.1",
+        port=port,
+        lifespan="off",
+        log_level="warning",
+    )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def _load(base_url, label, total, concurrency):
+    pending = iter(range(total))
+    latencies = []
+    errors = 0
+
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        limits=limits,
+        timeout=120,
+    ) as client:
+
+        async def user():
+            nonlocal errors
+
+            for n in pending:
+                started = time.perf_counter()
+
+                try:
+                    response = await client.get(
+                        f"/shop/bench-{label}-{n}/"
+                    )
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return elapsed, latencies, errors
+
+
+def _report(label, elapsed, latencies, errors):
+    latencies = sorted(latencies) or [0.0]
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+
+    print(
+        f"{label:<5}"
+        f" {len(latencies) / elapsed:8.1f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:8.1f} ms"
+        f"  p95 {p95 * 1000:8.1f} ms"
+        f"  errors {errors}"
+    )
+
+
+def _bench(label, args, stub_url, spool_dir):
+    port = _free_port()
+    server = SERVERS[label]
+
+    env = {
+        **os.environ,
+        **server["env"],
+        "DJANGO_DEBUG": "1",
+        "SHOPIFY_STORE_DOMAIN": "bench.local",
+        "SHOPIFY_STOREFRONT_TOKEN": "bench-token",
+        "SHOPIFY_STOREFRONT_URL": stub_url,
+        "SHOPIFY_POOL_SIZE": str(args.threads),
+        "SHOPIFY_ASYNC_POOL_SIZE": str(args.concurrency),
+        # Keep page views and funnel events away from the database.
+        "ANALYTICS_INGEST": "spool",
+        "ANALYTICS_SPOOL_DIR": spool_dir,
+    }
+
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            *server["command"],
+            "--workers", "1",
+            "--threads", str(args.threads),
+            "--bind", f"127.0.0.1:{port}",
+            "--timeout", "120",
+            # Outlast the load generator's idle connections, so no
+            # request races the server closing its socket.
+            "--keep-alive", "120",
+            "--log-level", "warning",
+        ],
+        cwd=BASE_DIR,
+        env=env,
+    )
+
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        _wait_until_up(f"{base_url}/shop/")
+
+        # Warm up imports, templates and connection pools.
+        asyncio.run(_load(base_url, f"{label}-warm", 20, 10))
+
+        _report(
+            label,
+            *asyncio.run(
+                _load(base_url, label, args.requests, args.concurrency)
+            ),
+        )
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.1,
+        help="Seconds the stub Storefront API takes to answer.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=8,
+        help="Threads in the WSGI worker.",
+    )
+    parser.add_argument(
+        "--only",
+        choices=sorted(SERVERS),
+        action="append",
+    )
+    parser.add_argument("--stub-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub_port:
+        _serve_stub(args.stub_port, args.delay)
+        return
+
+    stub_port = _free_port()
+
+    stub = subprocess.Popen(
+        [
+            sys.executable, __file__,
+            "--stub-port", str(stub_port),
+            "--delay", str(args.delay),
+        ],
+    )
+
+    try:
+        stub_url = f"http://127.0.0.1:{stub_port}/graphql.json"
+        _wait_until_up(stub_url)
+
+        print(
+            f"{args.requests} product pages, {args.concurrency} concurrent,"
+            f" Storefront API delay {args.delay * 1000:.0f} ms,"
+            f" 1 worker ({args.threads} threads for WSGI)"
+        )
+
+        with tempfile.TemporaryDirectory() as spool_dir:
+            for label in args.only or ["wsgi", "asgi"]:
+                _bench(label, args, stub_url, spool_dir)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
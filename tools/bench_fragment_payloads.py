@@ -0,0 +1,201 @@
+"""
+Compare payload size and JSON decode time of the per-view product
+fragments against the full product field set every view used to request.
+
+Record responses from the live Storefront API once (needs the usual
+SHOPIFY_* environment variables), then benchmark the recordings offline:
+
+    python tools/bench_fragment_payloads.py record --collection lace --product some-handle
+    python tools/bench_fragment_payloads.py compare
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on path
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "anarchy_and_lace.settings"
+)
+
+import django
+django.setup()
+
+from catalog import shopify
+
+
+DEFAULT_FIXTURES_DIR = BASE_DIR / "tools" / "fixtures" / "fragment_payloads"
+
+# The detail fragment is a superset of the monolithic PRODUCT_FIELDS
+# every catalog query used before, so it serves as the baseline.
+BASELINE_FIELDS = "detail"
+
+
+def _products_query(fields):
+    spread, fragment = shopify._fragment(fields)
+
+    return f"""
+    query GetProducts($first: Int!) {{
+      products(first: $first) {{
+        nodes {{
+          {spread}
+        }}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _collection_query(fields):
+    spread, fragment = shopify._fragment(fields)
+
+    return f"""
+    query GetCollection($handle: String!, $first: Int!) {{
+      collection(handle: $handle) {{
+        title
+        handle
+        products(first: $first) {{
+          nodes {{
+            {spread}
+          }}
+        }}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _product_query(fields):
+    spread, fragment = shopify._fragment(fields)
+
+    return f"""
+    query GetProduct($handle: String!) {{
+      product(handle: $handle) {{
+        {spread}
+      }}
+    }}
+
+    {fragment}
+    """
+
+
+def _page_types(args):
+    """
+    Return ``(page type, lean fields, query builder, variables)``.
+    """
+
+    return [
+        ("product_list", "card", _products_query, {"first": args.first}),
+        (
+            "collection_detail",
+            "card",
+            _collection_query,
+            {"handle": args.collection, "first": args.first},
+        ),
+        ("product_detail", "detail", _product_query, {"handle": args.product}),
+        ("add_to_bag", "bag", _product_query, {"handle": args.product}),
+        ("sitemap", "sitemap", _products_query, {"first": args.first}),
+    ]
+
+
+def _raw_post(query, variables):
+    response = shopify.get_session().post(
+        shopify._storefront_url(),
+        headers={
+            "X-Shopify-Storefront-Access-Token": (
+                shopify.SHOPIFY_STOREFRONT_TOKEN
+            ),
+        },
+        json={
+            "query": query,
+            "variables": variables,
+        },
+        timeout=(
+            shopify.SHOPIFY_CONNECT_TIMEOUT,
+            shopify.SHOPIFY_READ_TIMEOUT,
+        ),
+    )
+
+    response.raise_for_status()
+
+    return response.content
+
+
+def record(args):
+    args.fixtures.mkdir(parents=True, exist_ok=True)
+
+    for page, lean, build, variables in _page_types(args):
+        for label, fields in (("baseline", BASELINE_FIELDS), ("lean", lean)):
+            body = _raw_post(build(fields), variables)
+            path = args.fixtures / f"{page}.{label}.json"
+            path.write_bytes(body)
+
+            print(f"Wrote {len(body):>9,} bytes to {path}")
+
+
+def _decode_time(body, repeat):
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        json.loads(body)
+
+    return (time.perf_counter() - start) / repeat
+
+
+def compare(args):
+    print(
+        f"{'page':<20}{'baseline B':>12}{'lean B':>10}{'saved':>8}"
+        f"{'baseline ms':>13}{'lean ms':>10}"
+    )
+
+    for page, *_ in _page_types(args):
+        baseline_path = args.fixtures / f"{page}.baseline.json"
+        lean_path = args.fixtures / f"{page}.lean.json"
+
+        if not baseline_path.exists() or not lean_path.exists():
+            print(f"{page:<20}(no recording, run 'record' first)")
+            continue
+
+        baseline = baseline_path.read_bytes()
+        lean = lean_path.read_bytes()
+
+        saved = 1 - (len(lean) / len(baseline)) if baseline else 0
+
+        print(
+            f"{page:<20}{len(baseline):>12,}{len(lean):>10,}{saved:>8.0%}"
+            f"{_decode_time(baseline, args.repeat) * 1000:>13.3f}"
+            f"{_decode_time(lean, args.repeat) * 1000:>10.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["record", "compare"])
+    parser.add_argument("--fixtures", type=Path, default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--collection", default="lace")
+    parser.add_argument("--product", default="")
+    parser.add_argument("--first", type=int, default=shopify.SHOPIFY_PAGE_SIZE)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        if not args.product:
+            parser.error("--product is required when recording")
+
+        record(args)
+
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
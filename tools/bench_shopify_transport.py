@@ -0,0 +1,133 @@
+"""
+Compare per-request latency of a fresh connection per call against the
+pooled keep-alive Storefront transport in catalog/shopify.py.
+
+A local stub GraphQL server stands in for Shopify, so the numbers show
+the connection setup cost only (no TLS, no network distance). Against
+the real Storefront API the saving per request is larger, as every
+fresh connection also pays a TLS handshake.
+
+Usage:
+    python tools/bench_shopify_transport.py --requests 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Ensure project root is on path
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "anarchy_and_lace.settings"
+)
+
+import django
+django.setup()
+
+import requests
+
+from catalog import shopify
+
+
+STUB_RESPONSE = json.dumps(
+    {
+        "data": {
+            "products": {
+                "nodes": [],
+            },
+        },
+    }
+).encode("utf-8")
+
+
+class StubGraphQLHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def _timed(func, count):
+    samples = []
+
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+
+    print(
+        f"{label:<28}"
+        f" mean {statistics.mean(samples) * 1000:7.3f} ms"
+        f"  p50 {statistics.median(samples) * 1000:7.3f} ms"
+        f"  p95 {p95 * 1000:7.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphQLHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{server.server_port}/graphql.json"
+
+    shopify.SHOPIFY_STORE_DOMAIN = "bench.local"
+    shopify.SHOPIFY_STOREFRONT_TOKEN = "bench-token"
+    shopify._storefront_url = lambda: url
+
+    query = "query Bench { products(first: 1) { nodes { id } } }"
+
+    def fresh_connection():
+        response = requests.post(
+            url,
+            headers={"Connection": "close"},
+            json={"query": query, "variables": {}},
+            timeout=10,
+        )
+        response.json()
+
+    def pooled_connection():
+        shopify.shopify_query(query)
+
+    # Warm up both paths so imports and the first pooled
+    # connection are excluded from the measurements.
+    fresh_connection()
+    pooled_connection()
+
+    _report("fresh connection per call", _timed(fresh_connection, args.requests))
+    _report("pooled keep-alive session", _timed(pooled_connection, args.requests))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
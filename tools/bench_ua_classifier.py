@@ -0,0 +1,153 @@
+"""
+Compare the old per-request user-agent checks in analytics.middleware
+(lower-case, then scan each marker tuple) with the compiled, cached
+classifier in analytics/classify.py.
+
+Requests are drawn from a corpus of real browser and bot user agents
+with a long-tailed popularity, as on the shop: a few browser builds
+account for most traffic. "cold" clears the LRU before every lookup to
+show the cost of a cache miss.
+
+Usage:
+    python tools/bench_ua_classifier.py --requests 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on path
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "anarchy_and_lace.settings"
+)
+
+import django
+django.setup()
+
+from analytics.classify import _classify, classify, load_bot_markers
+
+
+CORPUS = [
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 337.0.3.23.54 (iPhone14,5; iOS 17_5; en_GB; en-GB; scale=3.00; 1170x2532; 613516440)",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:127.0) Gecko/20100101 Firefox/127.0",
+    "Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; SAMSUNG SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/25.0 Chrome/121.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/126.0.6478.54 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 13; SM-X200) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 OPR/111.0.0.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14.5; rv:127.0) Gecko/20100101 Firefox/127.0",
+    "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; Googlebot/2.1; +http://www.google.com/bot.html) Chrome/126.0.6478.126 Safari/537.36",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)",
+    "Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.2; +https://openai.com/gptbot)",
+    "Mozilla/5.0 (Linux; Android 5.0) AppleWebKit/537.36 (KHTML, like Gecko) Mobile Safari/537.36 (compatible; Bytespider; spider-feedback@bytedance.com)",
+    "WhatsApp/2.23.20.0",
+    "python-requests/2.32.3",
+    "curl/8.7.1",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/126.0.0.0 Safari/537.36",
+    "Pinterestbot/1.0 (+http://www.pinterest.com/bot.html)",
+]
+
+LEGACY_BOT_MARKERS = (
+    "bot",
+    "crawler",
+    "spider",
+    "slurp",
+    "bingpreview",
+    "facebookexternalhit",
+    "whatsapp",
+    "telegrambot",
+    "discordbot",
+)
+
+
+def legacy_classify(user_agent, bot_markers):
+    ua = user_agent.lower()
+
+    if any(marker in ua for marker in bot_markers):
+        return True, "other"
+
+    if "ipad" in ua or "tablet" in ua:
+        return False, "tablet"
+
+    if any(marker in ua for marker in ("iphone", "android", "mobile")):
+        return False, "mobile"
+
+    return False, "desktop" if ua else "other"
+
+
+def workload(requests, seed=1):
+    rng = random.Random(seed)
+
+    # Zipf-like weights: the first user agent is the most common.
+    weights = [1 / rank for rank in range(1, len(CORPUS) + 1)]
+
+    return rng.choices(CORPUS, weights=weights, k=requests)
+
+
+def bench(name, user_agents, func):
+    started = time.perf_counter()
+
+    for user_agent in user_agents:
+        func(user_agent)
+
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<34} {elapsed * 1000:9.1f} ms total "
+        f"{elapsed / len(user_agents) * 1e6:7.2f} us/request"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100000)
+    args = parser.parse_args()
+
+    user_agents = workload(args.requests)
+    markers = load_bot_markers()
+
+    print(
+        f"{args.requests} requests, {len(CORPUS)} distinct user agents, "
+        f"{len(markers)} bot markers\n"
+    )
+
+    bench(
+        f"legacy scan ({len(LEGACY_BOT_MARKERS)} markers)",
+        user_agents,
+        lambda ua: legacy_classify(ua, LEGACY_BOT_MARKERS),
+    )
+    bench(
+        f"legacy scan ({len(markers)} markers)",
+        user_agents,
+        lambda ua: legacy_classify(ua, markers),
+    )
+
+    def cold(user_agent):
+        _classify.cache_clear()
+        return classify(user_agent)
+
+    bench("compiled regex, cold cache", user_agents, cold)
+
+    _classify.cache_clear()
+    bench("compiled regex, LRU cache", user_agents, classify)
+
+    print(f"\n{_classify.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
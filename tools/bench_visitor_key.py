@@ -0,0 +1,116 @@
+"""
+Compare the old per-request visitor key (HMAC-SHA256 over
+day|ip|user agent keyed with SECRET_KEY, plus a localdate() lookup)
+with the daily derived key and LRU in analytics/visitor_keys.py.
+
+Requests come from a pool of visitors who each view several pages,
+as on the shop, so the LRU sees repeat hits within a session.
+
+Usage:
+    python tools/bench_visitor_key.py --requests 10000 --visitors 1500
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on path
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(BASE_DIR))
+
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE",
+    "anarchy_and_lace.settings"
+)
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.utils import timezone
+
+from analytics.visitor_keys import VisitorKeys
+
+
+USER_AGENTS = [
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+]
+
+
+def legacy_key(ip, user_agent):
+    day = timezone.localdate().isoformat()
+
+    return hmac.new(
+        settings.SECRET_KEY.encode("utf-8"),
+        f"{day}|{ip}|{user_agent}".encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()[:32]
+
+
+def workload(requests, visitors, seed=1):
+    rng = random.Random(seed)
+
+    pool = [
+        (
+            f"81.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+            rng.choice(USER_AGENTS),
+        )
+        for _ in range(visitors)
+    ]
+
+    # Visitors browse in short bursts, so recent ones come back most.
+    identities = []
+    active = []
+
+    for _ in range(requests):
+        if not active or rng.random() < len(pool) / requests:
+            active.append(rng.choice(pool))
+            active = active[-50:]
+
+        identities.append(rng.choice(active))
+
+    return identities
+
+
+def bench(name, identities, func):
+    started = time.perf_counter()
+
+    for ip, user_agent in identities:
+        func(ip, user_agent)
+
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<28} {elapsed * 1000:8.1f} ms total "
+        f"{elapsed / len(identities) * 1e6:6.2f} us/request"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--visitors", type=int, default=1500)
+    args = parser.parse_args()
+
+    identities = workload(args.requests, args.visitors)
+
+    print(
+        f"{args.requests} requests from "
+        f"{len(set(identities))} distinct visitors\n"
+    )
+
+    bench("HMAC per request", identities, legacy_key)
+    bench("daily key, no cache", identities, VisitorKeys(cache_size=0).key)
+    bench("daily key, LRU (1024)", identities, VisitorKeys().key)
+
+
+if __name__ == "__main__":
+    main()